@@ -0,0 +1,535 @@
+"""
+asgi_server.py
+ASGI variant of the Flask backend (server.py) for many slow or idle clients.
+
+Serves the same endpoints with the same JSON responses, but:
+- Upload bodies are parsed as a stream (`multipart_stream.py`) and written to
+  disk in batches on an I/O thread pool, so a slow mobile upload holds a
+  few hundred KiB of buffer and no thread while it trickles in.
+- The prediction pipeline runs on a separate executor (PIPELINE_WORKERS
+  threads), keeping the event loop free for other connections.
+
+It is a plain ASGI application without framework dependencies. Run it with any
+ASGI server, e.g.
+  uvicorn backend.api.asgi_server:app --host 0.0.0.0 --port 8000 --timeout-keep-alive 120
+
+Configuration (environment): everything server.py reads, plus
+  PIPELINE_WORKERS   concurrent classifications (default 2)
+  MAX_UPLOAD_MB      largest accepted upload (default 100)
+"""
+
+import os
+import hmac
+import json
+import uuid
+import shutil
+import asyncio
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.api.multipart_stream import (
+    MultipartError,
+    MultipartParser,
+    boundary_from_content_type,
+    parse_options_header,
+)
+from backend.src.warmup import readiness, start_background_warmup
+from backend.src.resources import configure_process, resource_report
+from backend.src.batching import batcher_stats
+from backend.src.result_cache import result_cache_stats
+from backend.src.watchdog import watchdog_stats
+from backend.src.logging_setup import get_logger, logging_stats
+from backend.src.distributed import distributed_stats
+from backend.src.spacy_pipelines import pipeline_stats
+from backend.src.memory_governor import MemoryPressure, job_admission, memory_report
+from backend.src.scheduler import DeadlineExceeded, submit_job, estimate_job, parse_deadline, scheduler_stats
+from backend.src.profiling import list_profiles, artifact_path
+
+# =========================
+# Configuration
+# =========================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
+PROCESSED_FOLDER = os.path.join(BASE_DIR, "processed_audio")
+
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+LOG_FILE = os.path.join(LOG_DIR, "server.log")
+
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+os.makedirs(LOG_DIR, exist_ok=True)
+
+logger = get_logger(__name__, LOG_FILE)
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+WARMUP_LANGUAGES = [lang for lang in os.environ.get("WARMUP_LANGUAGES", "").split(",") if lang]
+PIPELINE_WORKERS = int(os.environ.get("PIPELINE_WORKERS", 2))
+MAX_UPLOAD_BYTES = int(float(os.environ.get("MAX_UPLOAD_MB", 100)) * 2**20)
+
+# Upload data is written to disk once this much has been buffered
+WRITE_BATCH_BYTES = 256 * 1024
+MAX_FIELD_BYTES = 64 * 1024
+MAX_JSON_BYTES = 64 * 1024
+
+# Global runtime state (one process, like server.py)
+UPLOAD_STATUS = {"complete": False}
+STATE = {"language": None}
+
+_pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+_io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload-io")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# =========================
+# ASGI Helpers
+# =========================
+def _headers(scope) -> dict:
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+
+
+async def send_json(send, payload, status: int = 200):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_file(send, path: str, download_name: str):
+    loop = asyncio.get_running_loop()
+    body = await loop.run_in_executor(_io_executor, _read_file, path)
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"application/octet-stream"),
+            (b"content-length", str(len(body)).encode()),
+            (b"content-disposition", f'attachment; filename="{download_name}"'.encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def body_chunks(receive):
+    """Yield request body chunks as the client sends them."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected")
+        chunk = message.get("body", b"")
+        if chunk:
+            yield chunk
+        if not message.get("more_body", False):
+            return
+
+
+async def read_json(receive):
+    body = b""
+    async for chunk in body_chunks(receive):
+        body += chunk
+        if len(body) > MAX_JSON_BYTES:
+            raise HTTPError(413, "Request body too large")
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+def admin_authorized(headers) -> bool:
+    """True only if ADMIN_TOKEN is configured and the request carries it (admin endpoints fail closed)."""
+    token = headers.get("x-admin-token")
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def reset_upload_status():
+    UPLOAD_STATUS["complete"] = False
+
+
+def clear_processed_audio():
+    if os.path.exists(PROCESSED_FOLDER):
+        shutil.rmtree(PROCESSED_FOLDER)
+        os.makedirs(PROCESSED_FOLDER, exist_ok=True)
+
+
+# =========================
+# Streaming Upload
+# =========================
+class _FileSink:
+    """Collects one part's data and writes it to disk in WRITE_BATCH_BYTES batches off the event loop."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = 0
+        self._file = None
+        self._pending = []
+        self._pending_bytes = 0
+
+    def add(self, data: bytes):
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        self.size += len(data)
+
+    @property
+    def ready(self) -> bool:
+        return self._pending_bytes >= WRITE_BATCH_BYTES
+
+    def _write(self, data: bytes):
+        if self._file is None:
+            self._file = open(self.path, "wb")
+        self._file.write(data)
+
+    async def flush(self, loop):
+        if self._pending:
+            data, self._pending, self._pending_bytes = b"".join(self._pending), [], 0
+            await loop.run_in_executor(_io_executor, self._write, data)
+
+    def discard(self):
+        """Close the file without flushing (after errors; a no-op once closed)."""
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+
+    async def close(self, loop):
+        await self.flush(loop)
+        if self._file is None:
+            # Empty part: still create the file
+            await loop.run_in_executor(_io_executor, self._write, b"")
+        await loop.run_in_executor(_io_executor, self._file.close)
+
+
+async def receive_upload(scope, receive, file_field: str, destination: str) -> dict:
+    """
+    Stream a multipart body: the `file_field` part goes to `destination` (via a
+    temporary .part file, renamed when complete), other fields are kept in memory.
+    Returns {"fields", "filename", "size"}; filename is None if the part was missing.
+    """
+    headers = _headers(scope)
+    if int(headers.get("content-length", 0) or 0) > MAX_UPLOAD_BYTES:
+        raise HTTPError(413, "Upload too large")
+    try:
+        boundary = boundary_from_content_type(headers.get("content-type", ""))
+    except MultipartError:
+        raise HTTPError(400, "No file part in request")
+
+    loop = asyncio.get_running_loop()
+    temp_path = f"{destination}.{uuid.uuid4().hex}.part"
+    state = {"fields": {}, "filename": None, "file_sink": None, "sink": None, "field": None, "received": 0}
+
+    def on_part_begin(part_headers):
+        _, params = parse_options_header(part_headers.get("content-disposition", ""))
+        name = params.get("name")
+        if name == file_field and "filename" in params and state["filename"] is None:
+            state["filename"] = params["filename"]
+            state["sink"] = state["file_sink"] = _FileSink(temp_path)
+            state["field"] = None
+        else:
+            state["sink"] = None
+            state["field"] = name
+            state["fields"][name] = b""
+
+    def on_part_data(data):
+        if state["sink"] is not None:
+            state["sink"].add(data)
+        elif state["field"] is not None:
+            value = state["fields"][state["field"]] + data
+            if len(value) > MAX_FIELD_BYTES:
+                raise HTTPError(413, f"Field '{state['field']}' too large")
+            state["fields"][state["field"]] = value
+
+    def on_part_end():
+        state["field"] = None
+
+    parser = MultipartParser(boundary, on_part_begin, on_part_data, on_part_end)
+    try:
+        async for chunk in body_chunks(receive):
+            state["received"] += len(chunk)
+            if state["received"] > MAX_UPLOAD_BYTES:
+                raise HTTPError(413, "Upload too large")
+            try:
+                parser.feed(chunk)
+            except MultipartError as e:
+                raise HTTPError(400, str(e))
+            if state["file_sink"] is not None and state["file_sink"].ready:
+                await state["file_sink"].flush(loop)
+        try:
+            parser.finish()
+        except MultipartError as e:
+            raise HTTPError(400, str(e))
+
+        size = 0
+        file_sink = state["file_sink"]
+        if file_sink is not None:
+            await file_sink.close(loop)
+            size = file_sink.size
+            if state["filename"]:
+                await loop.run_in_executor(_io_executor, os.replace, temp_path, destination)
+        return {
+            "fields": {k: v.decode("utf-8", errors="replace") for k, v in state["fields"].items()},
+            "filename": state["filename"],
+            "size": size,
+        }
+    finally:
+        if state["file_sink"] is not None:
+            state["file_sink"].discard()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# =========================
+# Routes
+# =========================
+async def selected_language(scope, receive, send):
+    data = await read_json(receive)
+    if not data or "languageCode" not in data:
+        return await send_json(send, {"status": "error", "message": "Missing 'languageCode' in request body"}, 400)
+
+    STATE["language"] = data["languageCode"]
+    reset_upload_status()
+    await send_json(send, {
+        "status": "success",
+        "message": f"Language '{STATE['language']}' set successfully",
+    })
+
+
+async def upload_audio(scope, receive, send):
+    if STATE["language"] is None:
+        return await send_json(send, {"status": "error", "message": "Language code not set"}, 400)
+
+    filename = f"recording_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
+    upload = await receive_upload(scope, receive, "file", os.path.join(UPLOAD_FOLDER, filename))
+    if upload["filename"] is None:
+        return await send_json(send, {"status": "error", "message": "No file part in request"}, 400)
+    if upload["filename"] == "":
+        return await send_json(send, {"status": "error", "message": "No selected file"}, 400)
+
+    UPLOAD_STATUS["complete"] = True
+    await send_json(send, {"status": "success", "message": "File uploaded successfully"})
+
+
+async def test_connection(scope, receive, send):
+    upload = await receive_upload(scope, receive, "file", os.path.join(UPLOAD_FOLDER, "test_connection.wav"))
+    if upload["filename"] is None:
+        return await send_json(send, {"status": "error", "message": "No file part in request"}, 400)
+    if upload["filename"] == "":
+        return await send_json(send, {"status": "error", "message": "No selected file"}, 400)
+    await send_json(send, {"status": "success", "message": "Test connection successful"})
+
+
+async def upload_status(scope, receive, send):
+    await send_json(send, {"complete": UPLOAD_STATUS.get("complete", False)})
+
+
+def _latest_upload():
+    uploaded_files = sorted(
+        [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith(".wav")],
+        key=lambda x: os.path.getmtime(os.path.join(UPLOAD_FOLDER, x)),
+        reverse=True,
+    )
+    return os.path.join(UPLOAD_FOLDER, uploaded_files[0]) if uploaded_files else None
+
+
+def _classify(file_path, lang, profile_id, ticket):
+    # Imports the ML pipeline on first use
+    from backend.src.prediction_script import classify_recording
+    # The slot is released here, when the pipeline is done, even if the client has gone
+    with ticket, job_admission(lang):
+        classification_label, source = classify_recording(file_path, lang, profile_id)
+        ticket.record = source == "computed"
+        return classification_label
+
+
+def _client_id(scope, headers):
+    return headers.get("x-client-id") or (scope.get("client") or ("-",))[0]
+
+
+async def get_classification(scope, receive, send):
+    if STATE["language"] is None:
+        return await send_json(send, {"status": "error", "message": "Language not set"}, 400)
+    if not UPLOAD_STATUS.get("complete", False):
+        return await send_json(send, {"status": "error", "message": "No file uploaded yet"}, 400)
+
+    loop = asyncio.get_running_loop()
+    latest_file = await loop.run_in_executor(_io_executor, _latest_upload)
+    if latest_file is None:
+        return await send_json(send, {"status": "error", "message": "No audio file found"}, 404)
+
+    headers = _headers(scope)
+    profile_id = uuid.uuid4().hex if headers.get("x-profile") == "1" and admin_authorized(headers) else None
+
+    # Queue the job; it is refused up front when it would miss its deadline
+    try:
+        deadline = parse_deadline(headers.get("x-deadline-seconds"))
+    except ValueError as e:
+        return await send_json(send, {"status": "error", "message": f"Invalid X-Deadline-Seconds: {e}"}, 400)
+    try:
+        ticket = submit_job(latest_file, STATE["language"], _client_id(scope, headers), deadline)
+    except DeadlineExceeded as e:
+        return await send_json(send, {"status": "error", "message": str(e), "schedule": e.estimate}, 503)
+
+    # Wait for the job's turn without holding a pipeline thread
+    try:
+        await ticket.wait_async()
+    except asyncio.CancelledError:
+        ticket.done(record=False)
+        raise
+
+    # CPU-bound pipeline on its own executor; the event loop keeps serving other connections
+    try:
+        # run_in_executor does not carry contextvars (log job / segment ids) over; copy them explicitly
+        classification_label = await asyncio.shield(loop.run_in_executor(
+            _pipeline_executor, contextvars.copy_context().run,
+            _classify, latest_file, STATE["language"], profile_id, ticket,
+        ))
+    except MemoryPressure as e:
+        return await send_json(send, {"status": "error", "message": str(e)}, 503)
+
+    reset_upload_status()
+    response = {"status": "success", "classification": classification_label, "schedule": ticket.summary()}
+    if profile_id:
+        # Only one job is profiled at a time; a job that found the profiler busy ran unprofiled
+        if artifact_path(profile_id, "summary.json"):
+            response["profile_id"] = profile_id
+        else:
+            response["profile_skipped"] = "another profile was running"
+    await send_json(send, response)
+
+
+async def estimate(scope, receive, send):
+    if STATE["language"] is None:
+        return await send_json(send, {"status": "error", "message": "Language not set"}, 400)
+    loop = asyncio.get_running_loop()
+    latest_file = await loop.run_in_executor(_io_executor, _latest_upload)
+    if latest_file is None:
+        return await send_json(send, {"status": "error", "message": "No audio file found"}, 404)
+    client = _client_id(scope, _headers(scope))
+    await send_json(send, {"status": "success", **estimate_job(latest_file, STATE["language"], client)})
+
+
+async def cancel_process(scope, receive, send):
+    await asyncio.get_running_loop().run_in_executor(_io_executor, clear_processed_audio)
+    reset_upload_status()
+    await send_json(send, {"status": "success", "message": "Process canceled and cleaned up"})
+
+
+async def ready(scope, receive, send):
+    status = readiness()
+    await send_json(send, status, 200 if status["ready"] else 503)
+
+
+async def admin_resources(scope, receive, send):
+    if not admin_authorized(_headers(scope)):
+        return await send_json(send, {"status": "error", "message": "Unauthorized"}, 401)
+    await send_json(send, {
+        **resource_report(),
+        "batchers": batcher_stats(),
+        "result_cache": result_cache_stats(),
+        "timeouts": watchdog_stats(),
+        "logging": logging_stats(),
+        "distributed": distributed_stats(),
+        "spacy": pipeline_stats(),
+        "scheduler": scheduler_stats(),
+    })
+
+
+async def admin_memory(scope, receive, send):
+    if not admin_authorized(_headers(scope)):
+        return await send_json(send, {"status": "error", "message": "Unauthorized"}, 401)
+    await send_json(send, memory_report())
+
+
+async def admin_profiles(scope, receive, send):
+    if not admin_authorized(_headers(scope)):
+        return await send_json(send, {"status": "error", "message": "Unauthorized"}, 401)
+    profiles = await asyncio.get_running_loop().run_in_executor(_io_executor, list_profiles)
+    await send_json(send, {"profiles": profiles})
+
+
+async def admin_profile_artifact(scope, receive, send, profile_id, artifact):
+    if not admin_authorized(_headers(scope)):
+        return await send_json(send, {"status": "error", "message": "Unauthorized"}, 401)
+    try:
+        path = artifact_path(profile_id, artifact)
+    except ValueError as e:
+        return await send_json(send, {"status": "error", "message": str(e)}, 400)
+    if path is None:
+        return await send_json(send, {"status": "error", "message": "Profile artifact not found"}, 404)
+    await send_file(send, path, f"{profile_id}_{artifact}")
+
+
+ROUTES = {
+    ("POST", "/selected-language"): selected_language,
+    ("POST", "/upload"): upload_audio,
+    ("GET", "/upload-status"): upload_status,
+    ("GET", "/estimate"): estimate,
+    ("GET", "/get_classification"): get_classification,
+    ("POST", "/cancel"): cancel_process,
+    ("POST", "/test-connection"): test_connection,
+    ("GET", "/ready"): ready,
+    ("GET", "/admin/resources"): admin_resources,
+    ("GET", "/admin/memory"): admin_memory,
+    ("GET", "/admin/profiles"): admin_profiles,
+}
+
+
+def resolve(method: str, path: str):
+    """(handler, extra args) for a request, or (None, status) when nothing matches."""
+    handler = ROUTES.get((method, path))
+    if handler is not None:
+        return handler, ()
+    parts = path.strip("/").split("/")
+    if len(parts) == 4 and parts[:2] == ["admin", "profiles"]:
+        return (admin_profile_artifact, tuple(parts[2:])) if method == "GET" else (None, 405)
+    if any(route_path == path for _, route_path in ROUTES):
+        return None, 405
+    return None, 404
+
+
+# =========================
+# ASGI Application
+# =========================
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            configure_process()
+            if WARMUP_LANGUAGES:
+                start_background_warmup(WARMUP_LANGUAGES)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            _pipeline_executor.shutdown(wait=False, cancel_futures=True)
+            _io_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    handler, extra = resolve(scope["method"], scope["path"])
+    if handler is None:
+        message = "Method not allowed" if extra == 405 else "Not found"
+        return await send_json(send, {"status": "error", "message": message}, extra)
+
+    try:
+        await handler(scope, receive, send, *extra)
+    except HTTPError as e:
+        await send_json(send, {"status": "error", "message": e.message}, e.status)
+    except Exception as e:
+        logger.error(f"Unhandled error on {scope['path']}: {e}")
+        await send_json(send, {"status": "error", "message": str(e)}, 500)
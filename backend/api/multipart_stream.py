@@ -0,0 +1,125 @@
+"""
+multipart_stream.py
+Incremental multipart/form-data parser for the ASGI server.
+
+Body chunks are fed in as they arrive (`feed()`), so an upload is never held
+in memory as a whole: the parser reports each part's headers, then its data
+in pieces, then its end. Only a delimiter-sized tail of the current chunk is
+kept back between calls.
+"""
+
+from email.message import Message
+
+
+class MultipartError(ValueError):
+    """The request body is not valid multipart/form-data."""
+
+
+def parse_options_header(value: str):
+    """Split a header like 'form-data; name="file"; filename="a.wav"' into (value, {params})."""
+    message = Message()
+    message["x-options"] = value
+    params = message.get_params(header="x-options") or []
+    if not params:
+        return "", {}
+    return params[0][0].lower(), {key.lower(): val for key, val in params[1:]}
+
+
+def boundary_from_content_type(content_type: str) -> bytes:
+    """The boundary of a multipart/form-data Content-Type header."""
+    kind, params = parse_options_header(content_type or "")
+    if kind != "multipart/form-data" or not params.get("boundary"):
+        raise MultipartError("Expected multipart/form-data with a boundary")
+    return params["boundary"].encode("latin-1")
+
+
+class MultipartParser:
+    """
+    Push parser. Callbacks:
+      on_part_begin(headers: dict)  lower-cased header names → values
+      on_part_data(data: bytes)
+      on_part_end()
+    """
+
+    MAX_HEADER_BYTES = 16 * 1024
+
+    def __init__(self, boundary: bytes, on_part_begin, on_part_data, on_part_end):
+        self.delimiter = b"\r\n--" + boundary
+        self.on_part_begin = on_part_begin
+        self.on_part_data = on_part_data
+        self.on_part_end = on_part_end
+        # The body starts with "--boundary" (no leading CRLF); prepend one to match the delimiter
+        self._buffer = b"\r\n"
+        self._state = "preamble"  # preamble | after_delimiter | headers | body | done
+
+    def feed(self, chunk: bytes):
+        if self._state == "done":
+            return  # epilogue
+        self._buffer += chunk
+        while self._step():
+            pass
+
+    def finish(self):
+        if self._state != "done":
+            raise MultipartError("Incomplete multipart body")
+
+    def _step(self) -> bool:
+        """Advance one state transition; False when more input is needed."""
+        buffer = self._buffer
+        if self._state == "preamble":
+            index = buffer.find(self.delimiter)
+            if index < 0:
+                self._buffer = buffer[-len(self.delimiter):]
+                return False
+            self._buffer = buffer[index + len(self.delimiter):]
+            self._state = "after_delimiter"
+            return True
+
+        if self._state == "after_delimiter":
+            if len(buffer) < 2:
+                return False
+            if buffer.startswith(b"--"):
+                self._state, self._buffer = "done", b""
+                return False
+            end = buffer.find(b"\r\n")
+            if end < 0:
+                return False
+            # Transport padding (whitespace) may follow the delimiter
+            self._buffer = buffer[end + 2:]
+            self._state = "headers"
+            return True
+
+        if self._state == "headers":
+            end = buffer.find(b"\r\n\r\n")
+            if end < 0:
+                if len(buffer) > self.MAX_HEADER_BYTES:
+                    raise MultipartError("Part headers too large")
+                return False
+            headers = {}
+            for line in buffer[:end].decode("utf-8", errors="replace").split("\r\n"):
+                name, sep, value = line.partition(":")
+                if not sep:
+                    raise MultipartError(f"Malformed part header: {line!r}")
+                headers[name.strip().lower()] = value.strip()
+            self._buffer = buffer[end + 4:]
+            self._state = "body"
+            self.on_part_begin(headers)
+            return True
+
+        if self._state == "body":
+            index = buffer.find(self.delimiter)
+            if index >= 0:
+                if index:
+                    self.on_part_data(buffer[:index])
+                self.on_part_end()
+                self._buffer = buffer[index + len(self.delimiter):]
+                self._state = "after_delimiter"
+                return True
+            # Everything except a possible partial delimiter at the end is part data
+            keep = len(self.delimiter) - 1
+            if len(buffer) > keep:
+                self.on_part_data(buffer[:-keep])
+                self._buffer = buffer[-keep:]
+            return False
+
+        return False
@@ -4,23 +4,33 @@ Handles model loading, feature extraction, scaling, and final dementia classific
 """
 
 import os
+import time
+import weakref
+import warnings
 import joblib
 import numpy as np
 import pandas as pd
 from sklearn.exceptions import NotFittedError
+from sklearn.preprocessing import StandardScaler
 
 # Import your feature extraction scripts
 from backend.src.acoustic_extraction import extract_acoustic_features
 from backend.src.linguistic_extraction import extract_linguistic_features
+from backend.src.feature_schema import schema_for_scaler
+
+# The classifier is fed plain float32 matrices laid out in its training column order
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
 
 # ==========================================
 # PATH CONFIGURATION
 # ==========================================
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, "models", "random_forest_model.joblib")
-SCALER_PATH = os.path.join(BASE_DIR, "models", "scaler.joblib")
-OUTPUTS_DIR = os.path.join(BASE_DIR, "outputs")
+MODEL_PATH = os.path.join(BASE_DIR, "..", "models", "random_forest_model.joblib")
+SCALER_PATH = os.path.join(BASE_DIR, "..", "models", "scaler.joblib")
+BUNDLE_PATH = os.path.join(BASE_DIR, "..", "models", "model_bundle.joblib")
+BUNDLE_FORMAT_VERSION = 1
+OUTPUTS_DIR = os.path.join(BASE_DIR, "..", "outputs")
 
 os.makedirs(OUTPUTS_DIR, exist_ok=True)
 
@@ -28,20 +38,56 @@ os.makedirs(OUTPUTS_DIR, exist_ok=True)
 # ==========================================
 # LOAD MODEL AND SCALER
 # ==========================================
-def load_model_and_scaler():
+def load_model_and_scaler(model_path=MODEL_PATH, scaler_path=SCALER_PATH):
     """Load trained model and scaler from the models directory."""
-    if not os.path.exists(MODEL_PATH):
-        raise FileNotFoundError(f"❌ Model file not found at {MODEL_PATH}")
-    if not os.path.exists(SCALER_PATH):
-        raise FileNotFoundError(f"❌ Scaler file not found at {SCALER_PATH}")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"❌ Model file not found at {model_path}")
+    if not os.path.exists(scaler_path):
+        raise FileNotFoundError(f"❌ Scaler file not found at {scaler_path}")
 
-    model = joblib.load(MODEL_PATH)
-    scaler = joblib.load(SCALER_PATH)
+    model = joblib.load(model_path)
+    scaler = joblib.load(scaler_path)
 
     print("✅ Model and Scaler loaded successfully.")
     return model, scaler
 
 
+def save_model_bundle(path, model, scaler, selected_features, metadata=None, acoustic_model=None):
+    """
+    Save model, scaler and selected feature list together as one versioned artifact.
+    An optional acoustic-only screening model (for the cascade mode) is stored alongside.
+    Returns the bundle's version string.
+    """
+    version = time.strftime("%Y%m%d-%H%M%S")
+    bundle = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "version": version,
+        "model": model,
+        "scaler": scaler,
+        "selected_features": list(selected_features),
+        "acoustic_model": acoustic_model,
+        "metadata": metadata or {},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(bundle, tmp_path, compress=3)
+    os.replace(tmp_path, path)
+    return version
+
+
+def load_model_bundle(path=BUNDLE_PATH):
+    """Load a bundle written by save_model_bundle() and check its format."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"❌ Model bundle not found at {path}")
+
+    bundle = joblib.load(path)
+    if not isinstance(bundle, dict) or bundle.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"❌ Unsupported model bundle format at {path}")
+
+    print(f"✅ Model bundle {bundle['version']} loaded successfully.")
+    return bundle
+
+
 # ==========================================
 # FEATURE EXTRACTION
 # ==========================================
@@ -64,6 +110,88 @@ def prepare_features(audio_path, language_code):
     return combined_df
 
 
+# ==========================================
+# SEGMENT-LEVEL PREDICTION
+# ==========================================
+# Weakly keyed by the scaler, so the arrays are dropped with it (see feature_schema.py)
+_scaling = weakref.WeakKeyDictionary()
+
+
+def _scaling_arrays(scaler):
+    """float32 (mean, scale) of a fitted StandardScaler, or None for other scalers."""
+    if scaler not in _scaling:
+        if not isinstance(scaler, StandardScaler):
+            _scaling[scaler] = None
+        else:
+            width = scaler.n_features_in_
+            mean = scaler.mean_ if scaler.with_mean else np.zeros(width)
+            scale = scaler.scale_ if scaler.with_std else np.ones(width)
+            _scaling[scaler] = (np.asarray(mean, dtype=np.float32), np.asarray(scale, dtype=np.float32))
+    return _scaling[scaler]
+
+
+def predict_matrix(model, scaler, X, schema=None):
+    """
+    Run the classifier on a float32 feature matrix laid out by the scaler's schema.
+    Scaling uses the scaler's mean_/scale_ directly; missing (NaN) features become 0.
+    Returns the AD probability per row.
+    """
+    schema = schema or schema_for_scaler(scaler)
+    arrays = _scaling_arrays(scaler)
+    if arrays is None:
+        scaled = scaler.transform(X).astype(np.float32, copy=False)
+    else:
+        mean, scale = arrays
+        scaled = (X - mean) / scale
+    np.nan_to_num(scaled, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+    model_columns = getattr(model, "feature_names_in_", None)
+    if model_columns is not None:
+        scaled = scaled[:, schema.columns(model_columns)]
+
+    return model.predict_proba(scaled)[:, 1]
+
+
+def predict(model, scaler, features):
+    """
+    Scale a feature DataFrame and run the classifier on it.
+    Columns are aligned to the scaler's training features; missing values are
+    imputed with the training mean. Returns (predicted labels, AD probabilities).
+    """
+    schema = schema_for_scaler(scaler)
+    X = features.reindex(columns=list(schema.names)).to_numpy(dtype=np.float32, na_value=np.nan)
+    probabilities = predict_matrix(model, scaler, X, schema)
+    predictions = (probabilities >= 0.5).astype(int)
+    return predictions, probabilities
+
+
+def save_predictions(results_df, predictions, probabilities, output_csv="predictions.csv"):
+    """Save per-segment predictions and probabilities to the outputs directory."""
+    output_path = os.path.join(OUTPUTS_DIR, output_csv)
+    summary = pd.DataFrame({
+        "file_name": results_df["file_name"] if "file_name" in results_df else range(len(results_df)),
+        "Prediction": np.asarray(predictions),
+        "Probability": np.asarray(probabilities),
+    })
+    summary.to_csv(output_path, index=False)
+    return output_path
+
+
+def weighted_majority_voting(results_df):
+    """
+    Combine segment predictions into one label.
+    Each segment votes for its predicted class, weighted by its confidence in that class.
+    Returns 1 (AD) or 0 (HC).
+    """
+    predictions = results_df["Prediction"].to_numpy()
+    probabilities = results_df["Probability"].to_numpy()
+    confidence = np.where(predictions == 1, probabilities, 1.0 - probabilities)
+
+    ad_weight = confidence[predictions == 1].sum()
+    hc_weight = confidence[predictions == 0].sum()
+    return 1 if ad_weight > hc_weight else 0
+
+
 # ==========================================
 # PREDICTION
 # ==========================================
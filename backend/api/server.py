@@ -11,16 +11,45 @@ Endpoints:
   POST /selected-language    → Sets current language code
   GET  /get_classification   → Returns predicted dementia classification
   GET  /upload-status        → Checks upload completion
+  GET  /estimate             → Estimated processing time and predicted wait for the uploaded recording
   POST /cancel               → Cancels active process and clears directories
+  GET  /ready                → Reports model warm-up progress (503 until ready)
+  GET  /admin/resources      → Thread budget, per-stage core usage, stage timeouts, cache and queue counters, spaCy pipelines, scheduler
+  GET  /admin/memory         → RSS, per-model memory, idle times and admission counters (memory_governor.py)
+  GET  /admin/profiles       → Stored per-job profiles (newest first)
+  GET  /admin/profiles/<id>/<artifact> → Download profile.prof / profile.txt / memory.txt / summary.json
+
+Admin endpoints (and X-Profile) require the X-Admin-Token header and are
+disabled when ADMIN_TOKEN is not set.
+Classification jobs are ordered by the scheduler (scheduler.py); send
+`X-Deadline-Seconds` to have a job refused up front (503) when it would finish
+later, and `X-Client-Id` to identify the client for fair-share ordering.
+Sending `X-Profile: 1` (with the admin token) to /get_classification profiles
+that job; the response then includes its `profile_id`.
+
+The ML pipeline is imported on first use; set WARMUP_LANGUAGES (e.g. "en,de")
+to preload it in the background at startup.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 import os
+import hmac
+import uuid
 import shutil
 import signal
 from datetime import datetime
-from backend.src.prediction_script import predict_final_classification
+from backend.src.warmup import readiness, start_background_warmup
+from backend.src.resources import configure_process, resource_report
+from backend.src.batching import batcher_stats
+from backend.src.result_cache import result_cache_stats
+from backend.src.watchdog import watchdog_stats
+from backend.src.logging_setup import logging_stats
+from backend.src.profiling import list_profiles, artifact_path
+from backend.src.distributed import distributed_stats
+from backend.src.spacy_pipelines import pipeline_stats
+from backend.src.memory_governor import MemoryPressure, job_admission, memory_report
+from backend.src.scheduler import DeadlineExceeded, submit_job, estimate_job, parse_deadline, scheduler_stats
 # =========================
 # Flask Configuration
 # =========================
@@ -40,6 +69,17 @@ UPLOAD_STATUS = {"complete": False}
 selected_language_code = None
 current_process_pid = None
 
+# Per-stage thread budgets (THREAD_BUDGET / CPU_BUDGET); set before heavy libraries load
+configure_process()
+
+# Shared secret for /admin endpoints; without it they always answer 401
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# Optional background warm-up (comma-separated language codes)
+WARMUP_LANGUAGES = [lang for lang in os.environ.get("WARMUP_LANGUAGES", "").split(",") if lang]
+if WARMUP_LANGUAGES:
+    start_background_warmup(WARMUP_LANGUAGES)
+
 
 # =========================
 # Utility Functions
@@ -49,6 +89,22 @@ def reset_upload_status():
     UPLOAD_STATUS["complete"] = False
 
 
+def admin_authorized():
+    """True only if ADMIN_TOKEN is configured and the request carries it (admin endpoints fail closed)."""
+    token = request.headers.get("X-Admin-Token")
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def latest_upload():
+    """Path of the most recently uploaded recording, or None."""
+    uploaded_files = sorted(
+        [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.wav')],
+        key=lambda x: os.path.getmtime(os.path.join(UPLOAD_FOLDER, x)),
+        reverse=True
+    )
+    return os.path.join(UPLOAD_FOLDER, uploaded_files[0]) if uploaded_files else None
+
+
 def clear_processed_audio():
     """Clears processed audio folder."""
     if os.path.exists(PROCESSED_FOLDER):
@@ -122,26 +178,62 @@ def get_classification():
             return jsonify({"status": "error", "message": "No file uploaded yet"}), 400
 
         # Get latest uploaded file
-        uploaded_files = sorted(
-            [f for f in os.listdir(UPLOAD_FOLDER) if f.endswith('.wav')],
-            key=lambda x: os.path.getmtime(os.path.join(UPLOAD_FOLDER, x)),
-            reverse=True
-        )
-        if not uploaded_files:
+        latest_file = latest_upload()
+        if latest_file is None:
             return jsonify({"status": "error", "message": "No audio file found"}), 404
 
-        latest_file = os.path.join(UPLOAD_FOLDER, uploaded_files[0])
-
-        # Run prediction
-        classification_label = predict_final_classification(latest_file, selected_language_code)
+        # Opt-in per-job profiling for admins
+        profile_id = None
+        if request.headers.get("X-Profile") == "1" and admin_authorized():
+            profile_id = uuid.uuid4().hex
+
+        # Imports the ML pipeline on first use
+        from backend.src.prediction_script import classify_recording
+
+        # Queue the job; it is refused up front when it would miss its deadline
+        try:
+            deadline = parse_deadline(request.headers.get("X-Deadline-Seconds"))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": f"Invalid X-Deadline-Seconds: {e}"}), 400
+        client = request.headers.get("X-Client-Id") or request.remote_addr
+        try:
+            ticket = submit_job(latest_file, selected_language_code, client, deadline)
+        except DeadlineExceeded as e:
+            return jsonify({"status": "error", "message": str(e), "schedule": e.estimate}), 503
+
+        # Run prediction in its turn, once memory allows it
+        try:
+            with ticket, job_admission(selected_language_code):
+                classification_label, source = classify_recording(latest_file, selected_language_code, profile_id)
+                ticket.record = source == "computed"
+        except MemoryPressure as e:
+            return jsonify({"status": "error", "message": str(e)}), 503
 
         reset_upload_status()  # reset after prediction
-        return jsonify({"status": "success", "classification": classification_label}), 200
+        response = {"status": "success", "classification": classification_label, "schedule": ticket.summary()}
+        if profile_id:
+            # Only one job is profiled at a time; a job that found the profiler busy ran unprofiled
+            if artifact_path(profile_id, "summary.json"):
+                response["profile_id"] = profile_id
+            else:
+                response["profile_skipped"] = "another profile was running"
+        return jsonify(response), 200
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/estimate', methods=['GET'])
+def estimate():
+    if selected_language_code is None:
+        return jsonify({"status": "error", "message": "Language not set"}), 400
+    latest_file = latest_upload()
+    if latest_file is None:
+        return jsonify({"status": "error", "message": "No audio file found"}), 404
+    client = request.headers.get("X-Client-Id") or request.remote_addr
+    return jsonify({"status": "success", **estimate_job(latest_file, selected_language_code, client)}), 200
+
+
 @app.route('/cancel', methods=['POST'])
 def cancel_process():
     global current_process_pid
@@ -177,6 +269,49 @@ def test_connection():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    status = readiness()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+
+@app.route('/admin/resources', methods=['GET'])
+def admin_resources():
+    if not admin_authorized():
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    return jsonify({**resource_report(), "batchers": batcher_stats(), "result_cache": result_cache_stats(),
+                    "timeouts": watchdog_stats(), "logging": logging_stats(),
+                    "distributed": distributed_stats(), "spacy": pipeline_stats(),
+                    "scheduler": scheduler_stats()}), 200
+
+
+@app.route('/admin/memory', methods=['GET'])
+def admin_memory():
+    if not admin_authorized():
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    return jsonify(memory_report()), 200
+
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_profiles():
+    if not admin_authorized():
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    return jsonify({"profiles": list_profiles()}), 200
+
+
+@app.route('/admin/profiles/<profile_id>/<artifact>', methods=['GET'])
+def admin_profile_artifact(profile_id, artifact):
+    if not admin_authorized():
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+    try:
+        path = artifact_path(profile_id, artifact)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if path is None:
+        return jsonify({"status": "error", "message": "Profile artifact not found"}), 404
+    return send_file(path, as_attachment=True, download_name=f"{profile_id}_{artifact}")
+
+
 # =========================
 # Entry Point
 # =========================
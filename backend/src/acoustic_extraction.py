@@ -2,19 +2,32 @@
 acoustic_extraction.py
 Extracts acoustic features from audio files for dementia classification.
 
-This module combines Librosa, PyAudioAnalysis, and OpenSMILE feature extraction
-into a single callable function for use in model inference or dataset creation.
+This module combines Librosa, PyAudioAnalysis-style short-term features and
+OpenSMILE feature extraction into a single callable function for use in model
+inference or dataset creation. The short-term features come from the vectorized
+port in `short_term_features.py`; the audio libraries are imported lazily on first use.
 """
 
 import os
-import librosa
 import numpy as np
 import pandas as pd
-import opensmile
 from tqdm import tqdm
-from pyAudioAnalysis import ShortTermFeatures, audioBasicIO
 import warnings
-import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.src.logging_setup import get_logger
+from backend.src.lazy_imports import lazy_module, ensure_loaded
+from backend.src.feature_store import package_versions, write_feature_table
+from backend.src.audio_io import decode_audio
+from backend.src import short_term_features
+from backend.src.feature_schema import FeatureSchema
+from backend.src.shared_arrays import attached
+from backend.src.resources import BUDGET, configure_process
+from backend.src.watchdog import SupervisedPool, StageTimeout, stage_timeout
+
+librosa = lazy_module("librosa")
+opensmile = lazy_module("opensmile")
 
 # ----------------------------------------------------
 # Configuration
@@ -28,132 +41,392 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "feature_extraction.log")
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
+# Bump when the set or definition of extracted features changes
+EXTRACTOR_VERSION = "1"
+
+# Records are queued and written by the background writer (see logging_setup.py)
+logger = get_logger(__name__, LOG_FILE)
+
+
+# ----------------------------------------------------
+# Block Names
+# ----------------------------------------------------
+# Each extractor returns (names, values) with names in a fixed order; the name
+# lists are built once and reused so per-segment extraction allocates no keys.
+_block_names = {}
+
+LIBROSA_SCALARS = ["duration", "zero_crossing_rate", "spectral_centroid", "spectral_bandwidth", "spectral_rolloff"]
+
+
+def _cached_names(key, build):
+    if key not in _block_names:
+        _block_names[key] = build()
+    return _block_names[key]
+
+
+def _mean_std_names(prefix, count):
+    return [f"{prefix}_{i+1}_{stat}" for i in range(count) for stat in ("mean", "std")]
+
+
+def _mean_std(matrix):
+    """Interleaved per-row mean/std: [row1_mean, row1_std, row2_mean, ...]."""
+    return np.column_stack([np.mean(matrix, axis=1), np.std(matrix, axis=1)]).ravel()
 
 
 # ----------------------------------------------------
 # Librosa Feature Extraction
 # ----------------------------------------------------
-def extract_librosa_features(file_path, sr=22050):
-    """Extract Librosa-based features such as MFCC, chroma, spectral features."""
+def librosa_block(file_path, sr=22050):
+    """Librosa-based features (MFCC, chroma, spectral, tonnetz) as (names, values)."""
     try:
         y, sr = librosa.load(file_path, sr=sr, duration=5.0)
     except Exception as e:
-        logging.error(f"librosa.load error for {file_path}: {e}")
-        return {}
+        logger.error(f"librosa.load error for {file_path}: {e}")
+        return [], np.empty(0)
+    return _librosa_values(y, sr, file_path)
 
-    features = {}
+
+def librosa_signal_block(samples, sample_rate, sr=22050):
+    """librosa_block() for an in-memory mono signal (first 5 s, resampled to sr)."""
+    y = samples[:int(5.0 * sample_rate)]
     try:
-        features["duration"] = librosa.get_duration(y=y, sr=sr)
-        features["zero_crossing_rate"] = np.mean(librosa.feature.zero_crossing_rate(y))
-        features["spectral_centroid"] = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        features["spectral_bandwidth"] = np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr))
-        features["spectral_rolloff"] = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
+        if sample_rate != sr:
+            y = librosa.resample(y, orig_sr=sample_rate, target_sr=sr)
+    except Exception as e:
+        logger.error(f"librosa.resample error: {e}")
+        return [], np.empty(0)
+    return _librosa_values(y, sr, "<signal>")
 
-        # MFCC
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=40)
-        for i in range(40):
-            features[f"mfcc_{i+1}_mean"] = np.mean(mfccs[i])
-            features[f"mfcc_{i+1}_std"] = np.std(mfccs[i])
 
-        # Chroma
+def _librosa_values(y, sr, source):
+    try:
+        scalars = [
+            librosa.get_duration(y=y, sr=sr),
+            np.mean(librosa.feature.zero_crossing_rate(y)),
+            np.mean(librosa.feature.spectral_centroid(y=y, sr=sr)),
+            np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr)),
+            np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr)),
+        ]
+        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=40)
         chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-        for i in range(chroma.shape[0]):
-            features[f"chroma_{i+1}_mean"] = np.mean(chroma[i])
-            features[f"chroma_{i+1}_std"] = np.std(chroma[i])
-
-        # Spectral contrast
         contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-        for i in range(contrast.shape[0]):
-            features[f"spectral_contrast_{i+1}_mean"] = np.mean(contrast[i])
-            features[f"spectral_contrast_{i+1}_std"] = np.std(contrast[i])
-
-        # Tonnetz
         tonnetz = librosa.feature.tonnetz(y=librosa.effects.harmonic(y), sr=sr)
-        for i in range(tonnetz.shape[0]):
-            features[f"tonnetz_{i+1}_mean"] = np.mean(tonnetz[i])
-            features[f"tonnetz_{i+1}_std"] = np.std(tonnetz[i])
-
     except Exception as e:
-        logging.error(f"Librosa feature extraction error for {file_path}: {e}")
-        return {}
+        logger.error(f"Librosa feature extraction error for {source}: {e}")
+        return [], np.empty(0)
+
+    shape_key = ("librosa", chroma.shape[0], contrast.shape[0], tonnetz.shape[0])
+    names = _cached_names(shape_key, lambda: (
+        LIBROSA_SCALARS
+        + _mean_std_names("mfcc", 40)
+        + _mean_std_names("chroma", chroma.shape[0])
+        + _mean_std_names("spectral_contrast", contrast.shape[0])
+        + _mean_std_names("tonnetz", tonnetz.shape[0])
+    ))
+    values = np.concatenate([
+        scalars, _mean_std(mfccs), _mean_std(chroma), _mean_std(contrast), _mean_std(tonnetz),
+    ])
+    return names, values
 
-    return features
+
+def extract_librosa_features(file_path, sr=22050):
+    """Extract Librosa-based features such as MFCC, chroma, spectral features."""
+    return dict(zip(*librosa_block(file_path, sr=sr)))
 
 
 # ----------------------------------------------------
 # PyAudioAnalysis Feature Extraction
 # ----------------------------------------------------
-def extract_pyaudio_features(file_path):
-    """Extract short-term statistical features using PyAudioAnalysis."""
+def pyaudio_block(file_path):
+    """PyAudioAnalysis short-term statistics (vectorized port) as (names, values)."""
     try:
-        [Fs, x] = audioBasicIO.read_audio_file(file_path)
-        x = audioBasicIO.stereo_to_mono(x)
+        x, Fs = decode_audio(file_path)
+        # int16 scale, as audioBasicIO returns it
+        x = x * (2.0 ** 15)
     except Exception as e:
-        logging.error(f"audioBasicIO.read_audio_file error for {file_path}: {e}")
-        return {}
+        logger.error(f"decode_audio error for {file_path}: {e}")
+        return [], np.empty(0)
+
+    return _pyaudio_values(x, Fs, file_path)
+
+
+def pyaudio_signal_block(samples, sample_rate):
+    """pyaudio_block() for an in-memory mono float signal in [-1, 1]."""
+    return _pyaudio_values(samples * (2.0 ** 15), sample_rate, "<signal>")
 
+
+def _pyaudio_values(x, Fs, source):
     try:
-        feats, names = ShortTermFeatures.feature_extraction(x, Fs, 0.050 * Fs, 0.025 * Fs)
-        f_mean, f_std = np.mean(feats, axis=1), np.std(feats, axis=1)
-        return {f"pyaudio_{name}_mean": f_mean[i] for i, name in enumerate(names)} | \
-               {f"pyaudio_{name}_std": f_std[i] for i, name in enumerate(names)}
+        feats, feature_names = short_term_features.feature_extraction(x, Fs, 0.050 * Fs, 0.025 * Fs)
     except Exception as e:
-        logging.error(f"ShortTermFeatures.feature_extraction error for {file_path}: {e}")
-        return {}
+        logger.error(f"Short-term feature extraction error for {source}: {e}")
+        return [], np.empty(0)
+
+    names = _cached_names("pyaudio", lambda: (
+        [f"pyaudio_{name}_mean" for name in feature_names] + [f"pyaudio_{name}_std" for name in feature_names]
+    ))
+    return names, np.concatenate([np.mean(feats, axis=1), np.std(feats, axis=1)])
+
+
+def extract_pyaudio_features(file_path):
+    """Extract PyAudioAnalysis short-term statistical features (vectorized port)."""
+    return dict(zip(*pyaudio_block(file_path)))
 
 
 # ----------------------------------------------------
 # OpenSMILE Feature Extraction
 # ----------------------------------------------------
-def extract_opensmile_features(file_path):
-    """Extract ComParE_2016-level functionals using OpenSMILE."""
-    try:
-        smile = opensmile.Smile(
+_smile = None
+
+
+def get_smile():
+    """Create the ComParE_2016 extractor once and reuse it across calls."""
+    global _smile
+    if _smile is None:
+        _smile = opensmile.Smile(
             feature_set=opensmile.FeatureSet.ComParE_2016,
             feature_level=opensmile.FeatureLevel.Functionals,
         )
-        result = smile.process_file(file_path)
-        features = result.to_dict(orient="records")[0]
-        return {f"opensmile_{k}": v for k, v in features.items()}
+    return _smile
+
+
+def opensmile_block(file_path):
+    """ComParE_2016 functionals as (names, values)."""
+    try:
+        result = get_smile().process_file(file_path)
     except Exception as e:
-        logging.error(f"OpenSMILE feature extraction error for {file_path}: {e}")
-        return {}
+        logger.error(f"OpenSMILE feature extraction error for {file_path}: {e}")
+        return [], np.empty(0)
+
+    return _opensmile_values(result)
+
+
+def opensmile_signal_block(samples, sample_rate):
+    """opensmile_block() for an in-memory mono signal."""
+    try:
+        result = get_smile().process_signal(samples, sample_rate)
+    except Exception as e:
+        logger.error(f"OpenSMILE feature extraction error for <signal>: {e}")
+        return [], np.empty(0)
+    return _opensmile_values(result)
+
+
+def _opensmile_values(result):
+    names = _cached_names("opensmile", lambda: [f"opensmile_{k}" for k in result.columns])
+    return names, result.to_numpy(dtype=np.float64)[0]
+
+
+def extract_opensmile_features(file_path):
+    """Extract ComParE_2016-level functionals using OpenSMILE."""
+    return dict(zip(*opensmile_block(file_path)))
 
 
 # ----------------------------------------------------
 # Combined Feature Extraction
 # ----------------------------------------------------
-def extract_acoustic_features(file_path):
-    """Unified entry point for extracting all acoustic features."""
+ACOUSTIC_BLOCKS = (
+    ("librosa", librosa_block),
+    ("pyaudio", pyaudio_block),
+    ("opensmile", opensmile_block),
+)
+
+
+ACOUSTIC_SIGNAL_BLOCKS = (
+    ("librosa", librosa_signal_block),
+    ("pyaudio", pyaudio_signal_block),
+    ("opensmile", opensmile_signal_block),
+)
+
+
+def _write_blocks(blocks, row, schema, source):
+    produced = 0
+    for block_name, block in blocks:
+        names, values = block()
+        if len(names):
+            schema.write(row, block_name, names, values)
+            produced += len(names)
+
+    if not produced:
+        logger.warning(f"No features extracted for {source}.")
+    else:
+        logger.info(f"Extracted {produced} acoustic features from {source}.")
+    return produced
+
+
+def extract_acoustic_into(file_path, row, schema):
+    """
+    Write all acoustic features of one file directly into a float32 schema row.
+    Returns the number of features the extractors produced.
+    """
+    blocks = [(name, lambda block=block: block(file_path)) for name, block in ACOUSTIC_BLOCKS]
+    return _write_blocks(blocks, row, schema, file_path)
+
+
+def extract_acoustic_signal_into(samples, sample_rate, row, schema):
+    """extract_acoustic_into() for an in-memory mono float32 signal."""
+    blocks = [
+        (name, lambda block=block: block(samples, sample_rate)) for name, block in ACOUSTIC_SIGNAL_BLOCKS
+    ]
+    return _write_blocks(blocks, row, schema, "<signal>")
+
+
+def extract_all_features(file_path):
+    """Extract Librosa, PyAudioAnalysis and OpenSMILE features as a single dict."""
     all_features = {}
-    all_features.update(extract_librosa_features(file_path))
-    all_features.update(extract_pyaudio_features(file_path))
-    all_features.update(extract_opensmile_features(file_path))
+    for _, block in ACOUSTIC_BLOCKS:
+        all_features.update(zip(*block(file_path)))
 
     if not all_features:
-        logging.warning(f"No features extracted for {file_path}.")
+        logger.warning(f"No features extracted for {file_path}.")
     else:
-        logging.info(f"Extracted {len(all_features)} acoustic features from {file_path}.")
-        print("🎧 Extracted Acoustic Features")
+        logger.info(f"Extracted {len(all_features)} acoustic features from {file_path}.")
+
+    return all_features
+
+
+# ----------------------------------------------------
+# Supervised Extraction (worker processes, deadlines, shared memory)
+# ----------------------------------------------------
+# OpenSMILE / librosa can hang inside native code on pathological input, so
+# with an acoustic deadline (STAGE_TIMEOUTS) extraction runs in supervised
+# worker processes that are killed when a segment misses it. The segment's
+# features then stay NaN, like a failed extractor.
+_worker_schema = None
+_pool = {}
+
+
+def _init_worker(feature_names, native_threads):
+    global _worker_schema
+    # Workers split the acoustic stage's thread budget between them
+    configure_process(native_threads=native_threads)
+    _worker_schema = FeatureSchema(feature_names)
+    # Import and build the extractors now, so start-up does not count against the deadline
+    try:
+        ensure_loaded(librosa)
+        get_smile()
+    except Exception as e:
+        logger.error(f"Acoustic worker warm-up failed: {e}")
+
+
+def _extract_row(file_path):
+    """Worker: features of one segment file as a float32 schema row."""
+    row = _worker_schema.new_rows(1)[0]
+    extract_acoustic_into(file_path, row, _worker_schema)
+    return row
+
+
+def _extract_shared(audio_handle, sample_rate, features_handle, row_index):
+    """Worker: read a segment from shared memory and write its features into the shared matrix in place."""
+    with attached(audio_handle) as samples, attached(features_handle) as features:
+        return extract_acoustic_signal_into(samples, sample_rate, features[row_index], _worker_schema)
+
+
+def get_acoustic_pool(schema, workers: int):
+    """Supervised worker pool holding `schema`; recreated if the schema or size changes."""
+    # Compared by identity against the schema kept here, never by a reusable id()
+    if _pool.get("schema") is not schema or _pool.get("workers") != workers:
+        if _pool.get("pool") is not None:
+            _pool["pool"].shutdown()
+        _pool.update(
+            schema=schema,
+            workers=workers,
+            pool=SupervisedPool(
+                "acoustic",
+                workers,
+                initializer=_init_worker,
+                initargs=(schema.names, max(1, BUDGET["acoustic"] // workers)),
+            ),
+        )
+    return _pool["pool"]
+
+
+def _run_supervised(calls, workers: int, on_timeout):
+    """Run pool calls from `workers` threads; on_timeout(i) handles segments that missed the deadline."""
+    def run(i, call):
+        try:
+            return call()
+        except StageTimeout as e:
+            logger.warning(f"Acoustic extraction of segment {i} abandoned: {e}")
+            on_timeout(i)
+            return 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Each call runs in a copy of the caller's context so log records keep the job id
+        futures = [executor.submit(contextvars.copy_context().run, run, i, call) for i, call in enumerate(calls)]
+        return [future.result() for future in futures]
+
+
+def extract_acoustic_supervised(file_paths, features, schema, workers: int = 1):
+    """
+    Extract acoustic features of segment files into the rows of `features` in
+    supervised worker processes with the acoustic deadline. Rows of segments that
+    time out stay NaN. Returns the number of segments that timed out.
+    """
+    pool = get_acoustic_pool(schema, workers)
+    timeout = stage_timeout("acoustic")
+    timed_out = []
+
+    def store(i, path):
+        features[i] = pool.call(_extract_row, path, timeout=timeout)
+        return schema.width
+
+    calls = [lambda i=i, path=path: store(i, path) for i, path in enumerate(file_paths)]
+    _run_supervised(calls, workers, timed_out.append)
+    return len(timed_out)
+
+
+def extract_acoustic_parallel(segments, features_handle, schema, workers: int):
+    """
+    Extract acoustic features of segments published by segmentation (see
+    shared_arrays.py) in supervised worker processes. Each worker writes its row
+    of the shared feature matrix directly; only handles cross process boundaries.
+    Rows of segments that miss the acoustic deadline are reset to NaN.
+    Returns the number of features produced per segment.
+    """
+    pool = get_acoustic_pool(schema, workers)
+    timeout = stage_timeout("acoustic")
+
+    def reset_row(i):
+        # A killed worker may have written part of the row
+        with attached(features_handle) as features:
+            features[i] = np.nan
+
+    calls = [
+        lambda i=i, segment=segment: pool.call(
+            _extract_shared, segment["audio"], segment["sample_rate"], features_handle, i, timeout=timeout
+        )
+        for i, segment in enumerate(segments)
+    ]
+    return _run_supervised(calls, workers, reset_row)
+
+
+def extract_acoustic_features(file_path):
+    """Unified entry point for extracting all acoustic features as a one-row DataFrame."""
+    return pd.DataFrame([extract_all_features(file_path)])
+
 
-    return pd.DataFrame([all_features])
+def get_extractor_versions():
+    """Versions of this extractor and the libraries it wraps, stored with feature tables."""
+    return {
+        "acoustic_extraction": EXTRACTOR_VERSION,
+        **package_versions(("librosa", "opensmile", "numpy", "scipy")),
+    }
 
 
 # ----------------------------------------------------
 # Batch Processing (Optional)
 # ----------------------------------------------------
-def process_audio_directory(directory_path):
-    """Process all WAV files in a directory and return a DataFrame."""
+def process_audio_directory(directory_path, output_path=None):
+    """
+    Process all WAV files in a directory and return a DataFrame.
+    If output_path is given, the features are also written as a float32
+    Parquet/Arrow table (or CSV, following the file extension).
+    """
     features_list = []
     audio_files = [os.path.join(directory_path, f) for f in os.listdir(directory_path) if f.endswith(".wav")]
 
     if not audio_files:
-        logging.warning(f"No audio files found in {directory_path}.")
+        logger.warning(f"No audio files found in {directory_path}.")
         return pd.DataFrame()
 
     for f in tqdm(audio_files, desc="Extracting Features"):
@@ -162,4 +435,8 @@ def process_audio_directory(directory_path):
         feats["file_name"] = os.path.basename(f)
         features_list.append(feats)
 
-    return pd.concat(features_list, ignore_index=True) if features_list else pd.DataFrame()
+    features_df = pd.concat(features_list, ignore_index=True)
+    if output_path:
+        write_feature_table(features_df, output_path, get_extractor_versions())
+        logger.info(f"Acoustic features saved to {output_path}")
+    return features_df
@@ -0,0 +1,220 @@
+"""
+audio_io.py
+-----------
+In-process audio decoding for the prediction pipeline.
+
+WAV/PCM files are read straight into NumPy (stdlib `wave` + `np.frombuffer`,
+or `soundfile` when it is installed) without spawning any subprocess.
+FFmpeg is only used as a fallback for compressed formats, streaming raw PCM
+through a pipe instead of writing temporary files.
+"""
+
+import os
+import time
+import wave
+import logging
+import subprocess
+import numpy as np
+
+from backend.src.watchdog import stage_timeout, record_call, record_timeout
+
+try:
+    import soundfile
+except ImportError:  # optional dependency
+    soundfile = None
+
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFMPEG_SAMPLE_RATE = 16000
+
+# Decode timings keyed by "<format>:<backend>", e.g. "wav:wave"
+_decode_stats = {}
+
+
+class AudioDecodeError(Exception):
+    """Raised when an audio file cannot be decoded by any backend."""
+
+
+# ----------------------------------------------------
+# Decode Metrics
+# ----------------------------------------------------
+def _record_decode(fmt: str, backend: str, seconds: float, ok: bool = True):
+    """Accumulate decode timings per format/backend pair."""
+    stats = _decode_stats.setdefault(
+        f"{fmt}:{backend}", {"count": 0, "seconds": 0.0, "failures": 0}
+    )
+    if ok:
+        stats["count"] += 1
+        stats["seconds"] += seconds
+    else:
+        stats["failures"] += 1
+
+
+def get_decode_stats():
+    """Returns a snapshot of decode counts and mean latency per format/backend."""
+    snapshot = {}
+    for key, stats in _decode_stats.items():
+        mean_ms = (stats["seconds"] / stats["count"] * 1000) if stats["count"] else 0.0
+        snapshot[key] = {**stats, "mean_ms": round(mean_ms, 3)}
+    return snapshot
+
+
+# ----------------------------------------------------
+# PCM Helpers
+# ----------------------------------------------------
+def _pcm_to_float32(raw: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """Convert interleaved little-endian PCM bytes to a mono float32 array in [-1, 1]."""
+    if sample_width == 1:
+        # 8-bit WAV is unsigned
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 3:
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        as_int = (
+            packed[:, 0].astype(np.int32)
+            | (packed[:, 1].astype(np.int32) << 8)
+            | (packed[:, 2].astype(np.int32) << 16)
+        )
+        as_int = np.where(as_int >= 1 << 23, as_int - (1 << 24), as_int)
+        samples = as_int.astype(np.float32) / float(1 << 23)
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+    else:
+        raise AudioDecodeError(f"Unsupported PCM sample width: {sample_width} bytes")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    """Downmix a (frames, channels) array to mono float32."""
+    if samples.ndim == 2:
+        samples = samples.mean(axis=1)
+    return samples.astype(np.float32, copy=False)
+
+
+# ----------------------------------------------------
+# Backends
+# ----------------------------------------------------
+def _decode_wave(file_path: str):
+    """Decode integer PCM WAV with the stdlib `wave` module."""
+    with wave.open(file_path, "rb") as wf:
+        channels = wf.getnchannels()
+        sample_width = wf.getsampwidth()
+        sample_rate = wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    return _pcm_to_float32(raw, sample_width, channels), sample_rate
+
+
+def _decode_soundfile(file_path: str):
+    """Decode any libsndfile-supported format (float WAV, FLAC, OGG...)."""
+    samples, sample_rate = soundfile.read(file_path, dtype="float32", always_2d=False)
+    return to_mono(samples), sample_rate
+
+
+def decode_with_ffmpeg(file_path: str, sample_rate: int = FFMPEG_SAMPLE_RATE):
+    """
+    Decode any FFmpeg-supported format by streaming mono 16-bit PCM through stdout.
+    Nothing is written to disk. FFmpeg is killed after the "ffmpeg" stage deadline.
+    """
+    command = [
+        FFMPEG_BINARY, "-nostdin", "-v", "error",
+        "-i", file_path,
+        "-f", "s16le",
+        "-acodec", "pcm_s16le",
+        "-ac", "1",
+        "-ar", str(sample_rate),
+        "pipe:1",
+    ]
+    timeout = stage_timeout("ffmpeg")
+    record_call("ffmpeg")
+    try:
+        proc = subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        # subprocess.run kills FFmpeg before raising
+        record_timeout("ffmpeg")
+        raise AudioDecodeError(f"FFmpeg decode exceeded {timeout:.0f}s") from e
+    except FileNotFoundError as e:
+        raise AudioDecodeError(f"FFmpeg binary not found: {FFMPEG_BINARY}") from e
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(f"FFmpeg decode failed: {e.stderr.decode(errors='ignore')}") from e
+
+    return _pcm_to_float32(proc.stdout, 2, 1), sample_rate
+
+
+# ----------------------------------------------------
+# Public API
+# ----------------------------------------------------
+def audio_duration(file_path: str):
+    """Duration in seconds read from the file header (nothing is decoded), or None."""
+    try:
+        with wave.open(file_path, "rb") as wf:
+            return wf.getnframes() / wf.getframerate()
+    except (wave.Error, EOFError, OSError, ZeroDivisionError):
+        pass
+    if soundfile is not None:
+        try:
+            return soundfile.info(file_path).duration
+        except Exception:
+            pass
+    return None
+
+
+def decode_audio(file_path: str):
+    """
+    Decode an audio file to a mono float32 NumPy array.
+
+    Tries the in-process backends first (stdlib `wave`, then `soundfile`) and
+    only falls back to an FFmpeg pipe for formats they cannot read.
+    Returns (samples, sample_rate).
+    """
+    if not os.path.isfile(file_path):
+        raise AudioDecodeError(f"File not found: {file_path}")
+
+    fmt = os.path.splitext(file_path)[1].lower().lstrip(".") or "unknown"
+    backends = [("wave", _decode_wave)] if fmt == "wav" else []
+    if soundfile is not None:
+        backends.append(("soundfile", _decode_soundfile))
+    backends.append(("ffmpeg", decode_with_ffmpeg))
+
+    errors = []
+    for backend, decoder in backends:
+        start = time.perf_counter()
+        try:
+            samples, sample_rate = decoder(file_path)
+        except Exception as e:
+            _record_decode(fmt, backend, 0.0, ok=False)
+            errors.append(f"{backend}: {e}")
+            continue
+        elapsed = time.perf_counter() - start
+        _record_decode(fmt, backend, elapsed)
+        logging.info(f"Decoded {os.path.basename(file_path)} with {backend} in {elapsed * 1000:.1f} ms")
+        return samples, sample_rate
+
+    raise AudioDecodeError(f"Could not decode {file_path} ({'; '.join(errors)})")
+
+
+def to_pcm16(samples: np.ndarray) -> np.ndarray:
+    """Quantize float samples in [-1, 1] to little-endian 16-bit PCM, as write_wav stores them."""
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2")
+
+
+def pcm16_roundtrip(samples: np.ndarray) -> np.ndarray:
+    """The float32 samples decode_audio() would return for a WAV written by write_wav()."""
+    return to_pcm16(samples).astype(np.float32) / 32768.0
+
+
+def write_wav(file_path: str, samples: np.ndarray, sample_rate: int):
+    """Write a mono float32 array as 16-bit PCM WAV."""
+    pcm = to_pcm16(samples)
+    with wave.open(file_path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(int(sample_rate))
+        wf.writeframes(pcm.tobytes())
+
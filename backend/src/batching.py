@@ -0,0 +1,255 @@
+"""
+batching.py
+-----------
+Dynamic micro-batching across concurrent prediction jobs.
+
+Each `MicroBatcher` owns one background thread. Callers `submit()` single
+items (a segment to transcribe, a float32 feature row to classify) and get a Future
+back. The thread waits for the first item, keeps collecting until either
+`max_batch_size` items are queued or `max_wait_ms` has passed, runs the whole
+batch through one call of `batch_fn`, and resolves every caller's Future with
+its own result. Segments from different jobs that share a language therefore
+share one ASR forward pass, and all jobs share classifier batches. A batch runs
+in the context (log job / segment ids) of the caller whose item opened it.
+
+Configuration (environment):
+  BATCHING_ENABLED      "0" disables batching (default "1")
+  ASR_MAX_BATCH         maximum segments per ASR forward pass (default 4)
+  ASR_MAX_WAIT_MS       how long an ASR batch waits to fill up (default 25)
+  CLASSIFIER_MAX_BATCH  maximum rows per classifier call (default 64)
+  CLASSIFIER_MAX_WAIT_MS                                    (default 5)
+"""
+
+import os
+import time
+import queue
+import threading
+import contextvars
+from concurrent.futures import Future
+
+from backend.src.logging_setup import get_logger
+from backend.src.resources import stage_threads
+
+import numpy as np
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "prediction_pipeline.log")
+
+logger = get_logger(__name__, LOG_FILE)
+
+BATCHING_ENABLED = os.environ.get("BATCHING_ENABLED", "1") != "0"
+ASR_MAX_BATCH = int(os.environ.get("ASR_MAX_BATCH", 4))
+ASR_MAX_WAIT_MS = float(os.environ.get("ASR_MAX_WAIT_MS", 25))
+CLASSIFIER_MAX_BATCH = int(os.environ.get("CLASSIFIER_MAX_BATCH", 64))
+CLASSIFIER_MAX_WAIT_MS = float(os.environ.get("CLASSIFIER_MAX_WAIT_MS", 5))
+
+
+# Queued by close(): the batcher thread exits after the items before it
+_STOP = object()
+
+
+# ----------------------------------------------------
+# Micro-batcher
+# ----------------------------------------------------
+class MicroBatcher:
+    """
+    Groups items submitted from many threads into batches for `batch_fn`.
+    `batch_fn(items)` must return one result per item, in order.
+    """
+
+    def __init__(self, name: str, batch_fn, max_batch_size: int = 8, max_wait_ms: float = 10.0):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._closed = False
+        self._stats = {"batches": 0, "items": 0, "max_batch": 0, "retried": 0, "busy_seconds": 0.0}
+
+    def submit(self, item) -> Future:
+        """Queue one item; the returned Future resolves to its result."""
+        future = Future()
+        with self._start_lock:
+            if not self._closed:
+                self._ensure_started()
+                self._queue.put((item, future, contextvars.copy_context()))
+                return future
+        # Closed batcher (e.g. its model was unloaded): run the item on the caller's thread
+        try:
+            future.set_result(self.batch_fn([item])[0])
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self):
+        """Stop the thread once the queued items are done; it then releases batch_fn."""
+        with self._start_lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is not None:
+                self._queue.put(_STOP)
+
+    def map(self, items):
+        """Submit several items and wait for all results, preserving order."""
+        futures = [self.submit(item) for item in items]
+        return [f.result() for f in futures]
+
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["mean_batch"] = round(stats["items"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self):
+        # Called with _start_lock held
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _collect(self):
+        """Block for the first item, then gather more until full or the wait expires."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = self._collect()
+            # Nothing is queued after the stop marker (see close())
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+            # Skip items whose caller already gave up
+            batch = [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+            if batch:
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        items = [item for item, _, _ in batch]
+        # The whole batch runs in the context of the item that opened it
+        results = batch[0][2].run(self._call, items)
+        if results is None:
+            if len(batch) == 1:
+                batch[0][1].set_exception(self._error)
+                return
+            # One bad item (or a transient error) must not fail the other jobs in the batch
+            self._stats["retried"] += len(batch)
+            for item, future, context in batch:
+                results = context.run(self._call, [item])
+                if results is None:
+                    future.set_exception(self._error)
+                else:
+                    future.set_result(results[0])
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            future.set_result(result)
+
+        self._stats["batches"] += 1
+        self._stats["items"] += len(items)
+        self._stats["max_batch"] = max(self._stats["max_batch"], len(items))
+
+    def _call(self, items):
+        """batch_fn(items), or None with the exception in self._error (batcher thread only)."""
+        start = time.perf_counter()
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items")
+            return results
+        except Exception as e:
+            logger.error(f"Batch of {len(items)} failed in {self.name}: {e}")
+            self._error = e
+            return None
+        finally:
+            self._stats["busy_seconds"] += time.perf_counter() - start
+
+
+# ----------------------------------------------------
+# Shared Batchers
+# ----------------------------------------------------
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(name: str, factory):
+    """Return the process-wide batcher `name`, creating it with factory() on first use."""
+    batcher = _batchers.get(name)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(name)
+            if batcher is None:
+                batcher = _batchers[name] = factory()
+    return batcher
+
+
+def get_asr_batcher(lang: str):
+    """Batcher that transcribes segment files for one language in shared forward passes."""
+    from backend.src.transcription import transcribe_batch, load_language_model, language_models
+
+    def batch_fn(paths):
+        load_language_model(lang)
+        entry = language_models[lang]
+        with stage_threads("asr"):
+            return transcribe_batch(paths, entry["tokenizer"], entry["model"], device="cpu")
+
+    return get_batcher(
+        f"asr:{lang}",
+        lambda: MicroBatcher(f"asr:{lang}", batch_fn, ASR_MAX_BATCH, ASR_MAX_WAIT_MS),
+    )
+
+
+def classifier_batcher(model, scaler):
+    """
+    New batcher that scores float32 schema rows (see feature_schema.py) in one
+    predict_matrix() call. It belongs to one loaded classifier: the owner keeps
+    it with the model and closes it with close_batcher("classifier", batcher).
+    """
+    from backend.api.prediction import predict_matrix
+
+    def batch_fn(rows):
+        with stage_threads("classifier"):
+            probs = predict_matrix(model, scaler, np.vstack(rows))
+        return [float(p) for p in probs]
+
+    batcher = MicroBatcher("classifier", batch_fn, CLASSIFIER_MAX_BATCH, CLASSIFIER_MAX_WAIT_MS)
+    with _batchers_lock:
+        _batchers["classifier"] = batcher  # listed by batcher_stats()
+    return batcher
+
+
+def close_batcher(name: str, batcher=None):
+    """
+    Remove batcher `name` (only while it is still `batcher`, when given) and close
+    it; its thread, and what batch_fn holds, goes once its queue is drained.
+    """
+    with _batchers_lock:
+        current = _batchers.get(name)
+        if current is not None and (batcher is None or current is batcher):
+            del _batchers[name]
+        batcher = batcher or current
+    if batcher is not None:
+        batcher.close()
+
+
+def batcher_stats() -> dict:
+    """Per-batcher counters (batches, items, mean/max batch size, queue depth)."""
+    return {name: batcher.stats() for name, batcher in list(_batchers.items())}
@@ -0,0 +1,300 @@
+"""
+broker.py
+---------
+Message brokers for distributed stage workers (see distributed.py).
+
+A broker moves JSON-serializable messages between named queues and keeps a
+small key/value store for data shared by all nodes (feature name lists).
+Messages are delivered at least once: `consume()` hides a message for
+`visibility_timeout` seconds and `ack()` deletes it. A message that was not
+acknowledged in time (its worker died) is delivered again.
+
+Implementations, chosen by URL (`get_broker`):
+  memory://               in-process queues, for tests and single-process runs
+  sqlite:///path/to.db    one SQLite file shared by processes on the same host
+  redis://host:6379/0     Redis, for workers on several nodes (needs the `redis` package)
+"""
+
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+
+try:
+    import redis
+except ImportError:  # optional; only needed for redis:// brokers
+    redis = None
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+DEFAULT_VISIBILITY_TIMEOUT = 300.0
+POLL_INTERVAL = 0.05
+
+
+class Broker:
+    """Interface shared by all brokers."""
+
+    def publish(self, queue_name: str, message: dict):
+        raise NotImplementedError
+
+    def consume(self, queue_name: str, timeout: float = 1.0):
+        """Next message as (message_id, message), or None if none arrived within `timeout` (0 = don't wait)."""
+        raise NotImplementedError
+
+    def ack(self, queue_name: str, message_id: str):
+        raise NotImplementedError
+
+    def set_value(self, key: str, value):
+        raise NotImplementedError
+
+    def get_value(self, key: str, default=None):
+        raise NotImplementedError
+
+    def delete_value(self, key: str):
+        raise NotImplementedError
+
+    def depth(self, queue_name: str) -> int:
+        """Messages waiting in a queue (not counting ones being processed)."""
+        raise NotImplementedError
+
+
+# ----------------------------------------------------
+# In-process
+# ----------------------------------------------------
+class MemoryBroker(Broker):
+    """Thread-safe in-process broker. Messages are copied through JSON like on the wire."""
+
+    def __init__(self, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT):
+        self.visibility_timeout = visibility_timeout
+        self._queues = {}
+        self._inflight = {}  # message id -> (queue name, body, deadline)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _queue(self, queue_name):
+        with self._lock:
+            return self._queues.setdefault(queue_name, queue.Queue())
+
+    def _requeue_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [(mid, entry) for mid, entry in self._inflight.items() if entry[2] < now]
+            for mid, _ in expired:
+                del self._inflight[mid]
+        for _, (queue_name, body, _) in expired:
+            self._queue(queue_name).put(body)
+
+    def publish(self, queue_name, message):
+        self._queue(queue_name).put(json.dumps(message))
+
+    def consume(self, queue_name, timeout=1.0):
+        self._requeue_expired()
+        try:
+            body = self._queue(queue_name).get(timeout=timeout)
+        except queue.Empty:
+            return None
+        message_id = uuid.uuid4().hex
+        with self._lock:
+            self._inflight[message_id] = (queue_name, body, time.monotonic() + self.visibility_timeout)
+        return message_id, json.loads(body)
+
+    def ack(self, queue_name, message_id):
+        with self._lock:
+            self._inflight.pop(message_id, None)
+
+    def set_value(self, key, value):
+        with self._lock:
+            self._values[key] = json.dumps(value)
+
+    def get_value(self, key, default=None):
+        with self._lock:
+            body = self._values.get(key)
+        return default if body is None else json.loads(body)
+
+    def delete_value(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def depth(self, queue_name):
+        return self._queue(queue_name).qsize()
+
+
+# ----------------------------------------------------
+# SQLite (processes on one host)
+# ----------------------------------------------------
+class SQLiteBroker(Broker):
+    """Queues in one SQLite file (WAL mode). Consumers poll; each thread uses its own connection."""
+
+    def __init__(self, path: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self._local = threading.local()
+        self._connection().execute("PRAGMA journal_mode=WAL")
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT, queue TEXT NOT NULL, body TEXT NOT NULL,"
+                " visible_at REAL NOT NULL DEFAULT 0)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS messages_queue ON messages (queue, visible_at, id)")
+            db.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return db
+
+    def _connect(self):
+        return _Transaction(self._connection())
+
+    def publish(self, queue_name, message):
+        with self._connect() as db:
+            db.execute("INSERT INTO messages (queue, body) VALUES (?, ?)", (queue_name, json.dumps(message)))
+
+    def consume(self, queue_name, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.time()
+            with self._connect() as db:
+                row = db.execute(
+                    "SELECT id, body FROM messages WHERE queue = ? AND visible_at <= ? ORDER BY id LIMIT 1",
+                    (queue_name, now),
+                ).fetchone()
+                if row is not None:
+                    db.execute("UPDATE messages SET visible_at = ? WHERE id = ?",
+                               (now + self.visibility_timeout, row[0]))
+                    return str(row[0]), json.loads(row[1])
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def ack(self, queue_name, message_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM messages WHERE id = ?", (int(message_id),))
+
+    def set_value(self, key, value):
+        with self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_value(self, key, default=None):
+        with self._connect() as db:
+            row = db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+    def delete_value(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def depth(self, queue_name):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM messages WHERE queue = ? AND visible_at <= ?",
+                              (queue_name, time.time())).fetchone()[0]
+
+
+class _Transaction:
+    """`with` block running as one IMMEDIATE transaction (serializes concurrent consumers)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+# ----------------------------------------------------
+# Redis (several nodes)
+# ----------------------------------------------------
+class RedisBroker(Broker):
+    """
+    Lists per queue. A consumed message moves atomically to a processing list
+    with its delivery time; `ack` removes it, and stale entries are moved back
+    to the queue by any consumer of that queue.
+    """
+
+    def __init__(self, url: str, visibility_timeout: float = DEFAULT_VISIBILITY_TIMEOUT, prefix: str = "adpipe"):
+        if redis is None:
+            raise ImportError("The redis package is required for redis:// brokers (pip install redis).")
+        self.client = redis.Redis.from_url(url)
+        self.visibility_timeout = visibility_timeout
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return ":".join((self.prefix,) + parts)
+
+    def _requeue_expired(self, queue_name):
+        deadline = time.time() - self.visibility_timeout
+        started = self._key("started", queue_name)
+        for body in self.client.zrangebyscore(started, 0, deadline):
+            # Only one consumer wins the ZREM, so a message is requeued once
+            if self.client.zrem(started, body):
+                self.client.lrem(self._key("processing", queue_name), 1, body)
+                self.client.lpush(self._key("queue", queue_name), body)
+
+    def publish(self, queue_name, message):
+        envelope = json.dumps({"id": uuid.uuid4().hex, "message": message})
+        self.client.lpush(self._key("queue", queue_name), envelope)
+
+    def consume(self, queue_name, timeout=1.0):
+        self._requeue_expired(queue_name)
+        source, processing = self._key("queue", queue_name), self._key("processing", queue_name)
+        if timeout <= 0:
+            body = self.client.lmove(source, processing, src="RIGHT", dest="LEFT")
+        else:
+            # BLMOVE takes whole seconds on older servers
+            body = self.client.blmove(source, processing, timeout=max(1, int(round(timeout))), src="RIGHT", dest="LEFT")
+        if body is None:
+            return None
+        self.client.zadd(self._key("started", queue_name), {body: time.time()})
+        envelope = json.loads(body)
+        # The raw body is the message id, so ack can remove exactly this entry
+        return body.decode("utf-8"), envelope["message"]
+
+    def ack(self, queue_name, message_id):
+        self.client.lrem(self._key("processing", queue_name), 1, message_id)
+        self.client.zrem(self._key("started", queue_name), message_id)
+
+    def set_value(self, key, value):
+        self.client.set(self._key("kv", key), json.dumps(value))
+
+    def get_value(self, key, default=None):
+        body = self.client.get(self._key("kv", key))
+        return default if body is None else json.loads(body)
+
+    def delete_value(self, key):
+        self.client.delete(self._key("kv", key))
+
+    def depth(self, queue_name):
+        return self.client.llen(self._key("queue", queue_name))
+
+
+# ----------------------------------------------------
+# Factory
+# ----------------------------------------------------
+_brokers = {}
+_brokers_lock = threading.Lock()
+
+
+def get_broker(url: str) -> Broker:
+    """
+    Broker for a URL: memory://[name], sqlite:///path.db or redis://host:port/db.
+    Created once per process; the same URL returns the same broker.
+    """
+    with _brokers_lock:
+        if url not in _brokers:
+            if url.startswith("memory://"):
+                _brokers[url] = MemoryBroker()
+            elif url.startswith("sqlite:///"):
+                _brokers[url] = SQLiteBroker(url[len("sqlite:///"):])
+            elif url.startswith(("redis://", "rediss://")):
+                _brokers[url] = RedisBroker(url)
+            else:
+                raise ValueError(f"Unsupported broker URL '{url}'. Use memory://, sqlite:///path or redis://.")
+        return _brokers[url]
@@ -0,0 +1,474 @@
+"""
+distributed.py
+--------------
+Distributed pipeline mode: each stage runs on the nodes that subscribe to it.
+
+With PIPELINE_BROKER set (see broker.py for URLs), `score_recording` hands
+the recording to a broker instead of running the stages in the API process.
+Stage workers started with
+
+    python -m backend.src.distributed --broker redis://queue:6379/0 --stages asr:en asr:de
+    python -m backend.src.distributed --broker redis://queue:6379/0 --stages segmentation acoustic linguistic
+    python -m backend.src.distributed --broker redis://queue:6379/0 --stages classification
+
+consume their stage queues, so GPU nodes can run only ASR for the languages
+they hold models for while CPU nodes extract features, and every stage is
+scaled by starting more workers for it.
+
+Flow of one job (queue names in brackets):
+
+  client ──► [segmentation] ──► [asr.<lang>] ──► [linguistic] ──┐
+                      │                                          ├──► [classification.<p>] ──► result
+                      └──────► [acoustic] ───────────────────────┘
+
+Audio travels through the broker's key/value store (uploads and 16-bit WAV
+segments, base64), queue messages only carry references. Feature blocks are
+sent as float32 values plus the id of their name list, which is stored once
+in the key/value store. All messages of a job go to the same classification
+partition (CLASSIFIER_PARTITIONS), whose worker collects the segment rows and
+acknowledges them only once the job has been classified, so a crashed
+classification worker's jobs are redelivered. A stage that fails on a segment
+still reports it (without features), so the job completes with NaN features
+instead of hanging.
+
+Configuration (environment):
+  PIPELINE_BROKER        broker URL; unset runs the pipeline in-process
+  CLASSIFIER_PARTITIONS  classification queues jobs are spread over (default 1)
+  DISTRIBUTED_TIMEOUT    seconds a client waits for a job's result (default 600)
+  DISTRIBUTED_ASR_BATCH  segments an ASR worker transcribes per forward pass (default 8)
+"""
+
+import os
+import time
+import uuid
+import base64
+import shutil
+import zlib
+import hashlib
+import argparse
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+
+from backend.src.logging_setup import get_logger, log_context
+from backend.src.broker import get_broker
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "distributed.log")
+
+PIPELINE_BROKER = os.environ.get("PIPELINE_BROKER", "")
+CLASSIFIER_PARTITIONS = int(os.environ.get("CLASSIFIER_PARTITIONS", 1))
+DISTRIBUTED_TIMEOUT = float(os.environ.get("DISTRIBUTED_TIMEOUT", 600))
+DISTRIBUTED_ASR_BATCH = int(os.environ.get("DISTRIBUTED_ASR_BATCH", 8))
+
+STAGES = ("segmentation", "asr", "acoustic", "linguistic", "classification")
+CONSUME_TIMEOUT = 1.0
+RESULT_POLL_INTERVAL = 0.1
+FINISHED_JOBS_KEPT = 10000
+
+# Records are queued and written by the background writer (see logging_setup.py)
+logger = get_logger(__name__, LOG_FILE)
+
+
+# ----------------------------------------------------
+# Wire Helpers
+# ----------------------------------------------------
+def _encode_bytes(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _decode_bytes(text: str) -> bytes:
+    return base64.b64decode(text.encode("ascii"))
+
+
+def classification_queue(job_id: str) -> str:
+    """Classification partition of a job; all of its messages go there."""
+    return f"classification.{zlib.crc32(job_id.encode()) % CLASSIFIER_PARTITIONS}"
+
+
+_published_names = set()  # (broker, name list id) pairs this process already stored
+_resolved_names = {}  # name list id -> names, on classification nodes
+_submitted_languages = set()  # ASR queues this client has used, for queue_depths()
+
+
+def _names_id(broker, names) -> str:
+    """Store a feature name list once in the broker and return its id."""
+    names = list(names)
+    names_id = hashlib.sha1("\n".join(names).encode("utf-8")).hexdigest()[:16]
+    if (id(broker), names_id) not in _published_names:
+        broker.set_value(f"names:{names_id}", names)
+        _published_names.add((id(broker), names_id))
+    return names_id
+
+
+def _names(broker, names_id: str):
+    names = _resolved_names.get(names_id)
+    if names is None:
+        names = _resolved_names[names_id] = broker.get_value(f"names:{names_id}")
+    return names
+
+
+def _encode_blocks(broker, blocks) -> list:
+    """[(block name, names, values)] → JSON-ready blocks with float32 values."""
+    encoded = []
+    for block_name, names, values in blocks:
+        if len(names):
+            encoded.append({
+                "block": block_name,
+                "names": _names_id(broker, names),
+                "values": _encode_bytes(np.asarray(values, dtype=np.float32).tobytes()),
+            })
+    return encoded
+
+
+def _report(broker, job_id: str, segment: int, kind: str, blocks=()):
+    """Send one segment's features of one kind ('acoustic' / 'linguistic') to classification."""
+    broker.publish(classification_queue(job_id), {
+        "job_id": job_id, "type": kind, "segment": segment, "blocks": _encode_blocks(broker, blocks),
+    })
+
+
+# ----------------------------------------------------
+# Stage Handlers
+# ----------------------------------------------------
+def handle_segmentation(broker, message):
+    """Decode and segment an uploaded recording; queue its segments for ASR and acoustic extraction."""
+    from backend.src.segmentation import process_single_audio_file
+
+    job_id, lang = message["job_id"], message["lang"]
+    work_dir = tempfile.mkdtemp(prefix=f"seg_{job_id}_")
+    try:
+        try:
+            upload_path = os.path.join(work_dir, "upload", os.path.basename(message["file_name"]))
+            os.makedirs(os.path.dirname(upload_path))
+            with open(upload_path, "wb") as f:
+                f.write(_decode_bytes(broker.get_value(f"upload:{job_id}")))
+            segments = process_single_audio_file(upload_path, output_folder=os.path.join(work_dir, "segments"))
+            segments = sorted(segments, key=lambda segment: segment["path"])
+            for i, segment in enumerate(segments):
+                with open(segment["path"], "rb") as f:
+                    broker.set_value(f"segment:{job_id}:{i}", _encode_bytes(f.read()))
+        except Exception as e:
+            logger.error(f"Segmentation failed: {e}")
+            segments = []
+
+        # The plan tells classification how many segments to wait for (none = failed segmentation)
+        names = [os.path.basename(segment["path"]) for segment in segments]
+        broker.publish(classification_queue(job_id), {"job_id": job_id, "type": "plan", "segments": names})
+        for i in range(len(segments)):
+            reference = {"job_id": job_id, "segment": i, "lang": lang}
+            broker.publish("acoustic", reference)
+            broker.publish(f"asr.{lang}", reference)
+        logger.info(f"Queued {len(segments)} segments")
+    finally:
+        broker.delete_value(f"upload:{job_id}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def handle_acoustic(broker, message):
+    """Acoustic feature blocks of one segment."""
+    from backend.src.audio_io import decode_audio
+    from backend.src.acoustic_extraction import ACOUSTIC_SIGNAL_BLOCKS
+
+    job_id, segment = message["job_id"], message["segment"]
+    blocks = []
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".wav") as f:
+            f.write(_decode_bytes(broker.get_value(f"segment:{job_id}:{segment}")))
+            f.flush()
+            samples, sample_rate = decode_audio(f.name)
+        for block_name, block in ACOUSTIC_SIGNAL_BLOCKS:
+            names, values = block(samples, sample_rate)
+            blocks.append((block_name, names, values))
+    except Exception as e:
+        logger.error(f"Acoustic extraction failed: {e}")
+    _report(broker, job_id, segment, "acoustic", blocks)
+
+
+def handle_asr(broker, messages, lang: str):
+    """Transcribe a batch of segments (possibly from several jobs) in one forward pass."""
+    from backend.src.transcription import load_language_model, language_models, transcribe_batch
+
+    work_dir = tempfile.mkdtemp(prefix=f"asr_{lang}_")
+    try:
+        paths = []
+        for i, message in enumerate(messages):
+            path = os.path.join(work_dir, f"{i}.wav")
+            with open(path, "wb") as f:
+                f.write(_decode_bytes(broker.get_value(f"segment:{message['job_id']}:{message['segment']}")))
+            paths.append(path)
+        try:
+            load_language_model(lang)
+            entry = language_models[lang]
+            transcriptions = transcribe_batch(paths, entry["tokenizer"], entry["model"], device="cpu")
+        except Exception as e:
+            logger.error(f"ASR failed for a batch of {len(messages)} segments: {e}")
+            transcriptions = [None] * len(messages)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for message, text in zip(messages, transcriptions):
+        broker.publish("linguistic", {**message, "text": text})
+
+
+def handle_linguistic(broker, message):
+    """Linguistic feature block of one transcribed segment."""
+    from backend.src.linguistic_extraction import linguistic_block
+
+    names, values = ([], None)
+    if message.get("text"):
+        names, values = linguistic_block(message["text"], message["lang"])
+    _report(broker, message["job_id"], message["segment"], "linguistic", [("linguistic", names, values)])
+
+
+class _JobCollector:
+    """Segment feature rows of the jobs in flight on one classification partition."""
+
+    def __init__(self, broker, queue_name):
+        self.broker = broker
+        self.queue_name = queue_name
+        self.jobs = {}  # job id -> {"segments", "parts", "message_ids"}
+        self.finished = OrderedDict()  # recently classified job ids, to drop late redeliveries
+
+    def add(self, message_id, message):
+        if message["job_id"] in self.finished:
+            self.broker.ack(self.queue_name, message_id)
+            return
+        job = self.jobs.setdefault(message["job_id"], {"segments": None, "parts": {}, "message_ids": []})
+        job["message_ids"].append(message_id)
+        if message["type"] == "plan":
+            job["segments"] = message["segments"]
+        else:
+            # Redelivered parts replace the earlier copy
+            job["parts"][(message["segment"], message["type"])] = message["blocks"]
+
+        if job["segments"] is not None and len(job["parts"]) >= 2 * len(job["segments"]):
+            self._finish(message["job_id"], job)
+
+    def _finish(self, job_id, job):
+        from backend.src.prediction_script import get_model_and_scaler
+        from backend.src.feature_schema import schema_for_scaler
+        from backend.api.prediction import predict_matrix
+
+        result = {"segments": job["segments"], "probabilities": []}
+        try:
+            if job["segments"]:
+                model, scaler = get_model_and_scaler()
+                schema = schema_for_scaler(scaler)
+                features = schema.new_rows(len(job["segments"]))
+                for (segment, _), blocks in job["parts"].items():
+                    for block in blocks:
+                        values = np.frombuffer(_decode_bytes(block["values"]), dtype=np.float32)
+                        schema.write(features[segment], block["block"], _names(self.broker, block["names"]), values)
+                result["probabilities"] = [float(p) for p in predict_matrix(model, scaler, features, schema)]
+        except Exception as e:
+            logger.error(f"Classification failed: {e}")
+            result["error"] = str(e)
+
+        self.broker.set_value(f"result:{job_id}", result)
+        for i in range(len(job["segments"])):
+            self.broker.delete_value(f"segment:{job_id}:{i}")
+        for message_id in job["message_ids"]:
+            self.broker.ack(self.queue_name, message_id)
+        del self.jobs[job_id]
+        self.finished[job_id] = True
+        if len(self.finished) > FINISHED_JOBS_KEPT:
+            self.finished.popitem(last=False)
+        logger.info(f"Classified {len(job['segments'])} segments")
+
+
+# ----------------------------------------------------
+# Workers
+# ----------------------------------------------------
+def parse_stage(spec: str):
+    """
+    "segmentation", "acoustic", "linguistic", "asr:<lang>", "classification"
+    (every partition) or "classification:<p>" → list of (stage, queue name).
+    """
+    stage, _, arg = spec.partition(":")
+    if stage not in STAGES:
+        raise ValueError(f"Unknown stage '{stage}'; expected one of {', '.join(STAGES)}")
+    if stage == "asr":
+        if not arg:
+            raise ValueError("ASR stages need a language, e.g. asr:en")
+        return [(stage, f"asr.{arg}")]
+    if stage == "classification":
+        partitions = [int(arg)] if arg else range(CLASSIFIER_PARTITIONS)
+        return [(stage, f"classification.{p}") for p in partitions]
+    return [(stage, stage)]
+
+
+def run_stage(broker, stage: str, queue_name: str, stop_event: threading.Event):
+    """Consume one stage queue until stop_event is set."""
+    collector = _JobCollector(broker, queue_name) if stage == "classification" else None
+    while not stop_event.is_set():
+        delivery = broker.consume(queue_name, timeout=CONSUME_TIMEOUT)
+        if delivery is None:
+            continue
+        message_id, message = delivery
+        deliveries = [delivery]
+        with log_context(job_id=message["job_id"], segment=message.get("segment")):
+            try:
+                if stage == "classification":
+                    collector.add(message_id, message)  # acknowledged when the job is classified
+                    continue
+                if stage == "asr":
+                    # Batch whatever else is already waiting, across jobs
+                    while len(deliveries) < DISTRIBUTED_ASR_BATCH:
+                        extra = broker.consume(queue_name, timeout=0)
+                        if extra is None:
+                            break
+                        deliveries.append(extra)
+                    handle_asr(broker, [m for _, m in deliveries], queue_name.split(".", 1)[1])
+                else:
+                    HANDLERS[stage](broker, message)
+            except Exception as e:
+                logger.error(f"{stage} stage failed: {e}")
+                _report_failure(broker, stage, [m for _, m in deliveries])
+        for extra_id, _ in deliveries[1:]:
+            broker.ack(queue_name, extra_id)
+        broker.ack(queue_name, message_id)
+
+
+def _report_failure(broker, stage: str, messages):
+    """
+    Report empty features for the segments of a failed stage, so their jobs are
+    classified with those features missing instead of waiting forever.
+    Segmentation publishes its own (empty) plan when it fails.
+    """
+    if stage == "segmentation":
+        return
+    kind = "acoustic" if stage == "acoustic" else "linguistic"
+    for message in messages:
+        try:
+            _report(broker, message["job_id"], message["segment"], kind)
+        except Exception as e:
+            logger.error(f"Could not report the failed {stage} stage: {e}")
+
+
+HANDLERS = {
+    "segmentation": handle_segmentation,
+    "acoustic": handle_acoustic,
+    "linguistic": handle_linguistic,
+}
+
+
+def start_workers(broker, stage_specs, stop_event: threading.Event = None, threads_per_stage: int = 1):
+    """Start consumer threads for the given stage specs; returns (stop_event, threads)."""
+    stop_event = stop_event or threading.Event()
+    threads = []
+    for spec in stage_specs:
+        for stage, queue_name in parse_stage(spec):
+            # One collector per classification partition, or jobs would be split between threads
+            count = 1 if stage == "classification" else threads_per_stage
+            for n in range(count):
+                thread = threading.Thread(
+                    target=run_stage, args=(broker, stage, queue_name, stop_event),
+                    name=f"stage-{queue_name}-{n}", daemon=True,
+                )
+                thread.start()
+                threads.append(thread)
+    return stop_event, threads
+
+
+# ----------------------------------------------------
+# Client
+# ----------------------------------------------------
+def submit_recording(broker, audio_file_path: str, lang: str, job_id: str = None) -> str:
+    """Queue a recording for segmentation; returns its job id."""
+    job_id = job_id or uuid.uuid4().hex
+    _submitted_languages.add(lang)
+    with open(audio_file_path, "rb") as f:
+        broker.set_value(f"upload:{job_id}", _encode_bytes(f.read()))
+    broker.publish("segmentation", {
+        "job_id": job_id, "lang": lang, "file_name": os.path.basename(audio_file_path),
+    })
+    return job_id
+
+
+def wait_for_result(broker, job_id: str, timeout: float = DISTRIBUTED_TIMEOUT) -> dict:
+    """Block until the job's classification is stored, then remove and return it."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = broker.get_value(f"result:{job_id}")
+        if result is not None:
+            broker.delete_value(f"result:{job_id}")
+            return result
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"No result for job {job_id} within {timeout:.0f}s")
+        time.sleep(RESULT_POLL_INTERVAL)
+
+
+def score_recording_distributed(audio_file_path: str, lang: str, broker_url: str = None) -> dict:
+    """score_recording() through stage workers; returns the same result dict."""
+    from backend.src.prediction_script import _summarize
+
+    broker = get_broker(broker_url or PIPELINE_BROKER)
+    job_id = submit_recording(broker, audio_file_path, lang)
+    with log_context(job_id=job_id):
+        logger.info(f"Submitted {os.path.basename(audio_file_path)} ({lang})")
+        result = wait_for_result(broker, job_id)
+    if result.get("error"):
+        raise RuntimeError(f"Distributed classification failed: {result['error']}")
+    if not result["segments"]:
+        raise FileNotFoundError("No audio segments found after segmentation.")
+    return _summarize(result["segments"], result["probabilities"], stage="full")
+
+
+def queue_depths(broker, languages=("en",)) -> dict:
+    """Messages waiting per stage queue, for monitoring and scaling decisions."""
+    names = ["segmentation", "acoustic", "linguistic"] + [f"asr.{lang}" for lang in sorted(languages)]
+    names += [f"classification.{p}" for p in range(CLASSIFIER_PARTITIONS)]
+    return {name: broker.depth(name) for name in names}
+
+
+def distributed_stats() -> dict:
+    """Broker and queue depths for /admin/resources; empty when running in-process."""
+    if not PIPELINE_BROKER:
+        return {}
+    try:
+        depths = queue_depths(get_broker(PIPELINE_BROKER), _submitted_languages or {"en"})
+    except Exception as e:
+        return {"broker": PIPELINE_BROKER.split("://", 1)[0], "error": str(e)}
+    return {"broker": PIPELINE_BROKER.split("://", 1)[0], "queues": depths}
+
+
+# ----------------------------------------------------
+# CLI
+# ----------------------------------------------------
+def main(argv=None):
+    from backend.src.resources import configure_process
+
+    parser = argparse.ArgumentParser(description="Run distributed pipeline stage workers.")
+    parser.add_argument("--broker", default=PIPELINE_BROKER, help="Broker URL (default: PIPELINE_BROKER)")
+    parser.add_argument("--stages", nargs="+", required=True,
+                        help="Stages to serve: segmentation, acoustic, linguistic, asr:<lang>, classification[:<p>]")
+    parser.add_argument("--threads", type=int, default=1, help="Consumer threads per stage queue")
+    args = parser.parse_args(argv)
+    if not args.broker:
+        parser.error("--broker or PIPELINE_BROKER is required")
+    if args.broker.startswith("memory://"):
+        parser.error("memory:// brokers only work inside one process; use sqlite:/// or redis://")
+
+    configure_process()
+    broker = get_broker(args.broker)
+    stop_event, threads = start_workers(broker, args.stages, threads_per_stage=args.threads)
+    print(f"Serving {', '.join(args.stages)} from {args.broker} ({len(threads)} threads). Ctrl+C to stop.")
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+feature_schema.py
+-----------------
+Fixed-position feature vectors for inference.
+
+A `FeatureSchema` maps every feature name the scaler was trained on to a
+column index once. Extractors produce their values as arrays in a fixed
+order (a "block": librosa, pyaudio, opensmile, linguistic) and write them
+straight into a preallocated float32 row of a (segments x features) matrix;
+the name → index lookup for each block is resolved on first use and reused
+for every later segment. Features an extractor did not produce stay NaN and
+are treated like missing DataFrame columns were before (zero after scaling).
+"""
+
+import weakref
+import threading
+import numpy as np
+import pandas as pd
+
+
+class FeatureSchema:
+    """Ordered feature names with cached index lookups for extractor blocks."""
+
+    def __init__(self, names):
+        self.names = tuple(names)
+        self.width = len(self.names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self._blocks = {}
+        self._columns = {}
+
+    def new_rows(self, n: int = 1) -> np.ndarray:
+        """Preallocated (n x width) float32 matrix, NaN until written."""
+        return np.full((n, self.width), np.nan, dtype=np.float32)
+
+    def block(self, block_name: str, names):
+        """
+        (destination columns, source positions) for a block that emits `names` in order.
+        Names the schema does not know are dropped. Cached per block name.
+        """
+        cached = self._blocks.get(block_name)
+        if cached is not None and (cached[0] is names or cached[0] == names):
+            return cached[1], cached[2]
+
+        src = [i for i, name in enumerate(names) if name in self.index]
+        dest = np.array([self.index[names[i]] for i in src], dtype=np.intp)
+        src = np.array(src, dtype=np.intp)
+        self._blocks[block_name] = (names, dest, src)
+        return dest, src
+
+    def write(self, row: np.ndarray, block_name: str, names, values):
+        """Write one block's values into a row (or a matrix slice) in place."""
+        dest, src = self.block(block_name, names)
+        row[..., dest] = np.asarray(values)[..., src]
+
+    def columns(self, names) -> np.ndarray:
+        """Column indices of `names` (e.g. a model's selected features), cached."""
+        key = tuple(names)
+        if key not in self._columns:
+            missing = [name for name in key if name not in self.index]
+            if missing:
+                raise KeyError(f"{len(missing)} features missing from schema, e.g. {missing[:3]}")
+            self._columns[key] = np.array([self.index[name] for name in key], dtype=np.intp)
+        return self._columns[key]
+
+    def to_frame(self, matrix: np.ndarray) -> pd.DataFrame:
+        """DataFrame view of a feature matrix, for saving or inspection."""
+        return pd.DataFrame(matrix, columns=list(self.names), copy=False)
+
+
+# ----------------------------------------------------
+# Registered Schemas
+# ----------------------------------------------------
+# Keyed by the scaler itself (weakly): a schema goes away with its scaler when the
+# classifier is unloaded, and a later scaler can never pick up a stale layout
+_schemas = weakref.WeakKeyDictionary()
+_schemas_lock = threading.Lock()
+
+
+def schema_for_scaler(scaler) -> FeatureSchema:
+    """The schema of the scaler's training features, created once per scaler object."""
+    schema = _schemas.get(scaler)
+    if schema is None:
+        names = getattr(scaler, "feature_names_in_", None)
+        if names is None:
+            raise ValueError("Scaler has no feature_names_in_; refit it on a DataFrame to get a schema.")
+        with _schemas_lock:
+            schema = _schemas.get(scaler)
+            if schema is None:
+                schema = _schemas[scaler] = FeatureSchema(names)
+    return schema
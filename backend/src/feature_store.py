@@ -0,0 +1,288 @@
+"""
+feature_store.py
+----------------
+Typed, columnar feature tables for extraction outputs and training inputs.
+
+Feature columns are stored as float32 in Parquet (default) or Arrow IPC
+files. The schema metadata records the ordered feature names and the
+extractor versions that produced them, so a table can be checked against a
+trained model without reading any data. Readers can select only the columns
+they need and memory-map the file. Plain CSV is still supported as an
+optional export format.
+
+Usage (convert an existing wide CSV):
+  python -m backend.src.feature_store convert English_Acoustic_Features.csv English_Acoustic_Features.parquet
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from importlib import metadata as importlib_metadata
+import numpy as np
+import pandas as pd
+
+from backend.src.lazy_imports import lazy_module, ensure_loaded
+
+# Optional dependency, only needed for parquet/arrow tables; imported on first use
+pa = lazy_module("pyarrow")
+pq = lazy_module("pyarrow.parquet")
+
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+# Non-feature columns kept with their original (string) type
+METADATA_COLUMNS = ("label", "file_name", "id")
+
+FORMAT_EXTENSIONS = {
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+    ".feather": "arrow",
+    ".csv": "csv",
+}
+
+CSV_CHUNK_ROWS = 1000
+
+
+def _require_pyarrow():
+    try:
+        ensure_loaded(pq)
+    except ImportError:
+        raise ImportError("pyarrow is required for Parquet/Arrow feature tables (pip install pyarrow).") from None
+
+
+def package_versions(packages) -> dict:
+    """Installed versions of the given distributions, without importing them."""
+    versions = {}
+    for name in packages:
+        try:
+            versions[name] = importlib_metadata.version(name)
+        except importlib_metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def infer_format(path: str) -> str:
+    """Map a file extension to a table format ('parquet', 'arrow' or 'csv')."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMAT_EXTENSIONS:
+        raise ValueError(f"Unknown feature table format for {path}. Use one of {sorted(FORMAT_EXTENSIONS)}.")
+    return FORMAT_EXTENSIONS[ext]
+
+
+def split_columns(columns):
+    """Split column names into (metadata columns, feature columns), preserving order."""
+    meta = [c for c in columns if c in METADATA_COLUMNS]
+    feats = [c for c in columns if c not in METADATA_COLUMNS]
+    return meta, feats
+
+
+# ----------------------------------------------------
+# Writing
+# ----------------------------------------------------
+def _to_arrow_table(df: pd.DataFrame, extractor_versions: dict):
+    """Build a float32 Arrow table with feature names/versions in the schema metadata."""
+    meta_cols, feature_cols = split_columns(df.columns)
+    arrays, fields = [], []
+
+    for col in meta_cols:
+        arrays.append(pa.array(df[col].astype(str).to_numpy(), type=pa.string()))
+        fields.append(pa.field(col, pa.string()))
+
+    values = df[feature_cols].to_numpy(dtype=np.float32, na_value=np.nan)
+    for i, col in enumerate(feature_cols):
+        arrays.append(pa.array(values[:, i], type=pa.float32()))
+        fields.append(pa.field(col, pa.float32()))
+
+    metadata = {
+        b"feature_names": json.dumps(feature_cols).encode(),
+        b"extractor_versions": json.dumps(extractor_versions or {}).encode(),
+        b"created_at": str(time.time()).encode(),
+    }
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields, metadata=metadata))
+
+
+def write_feature_table(df: pd.DataFrame, path: str, extractor_versions: dict = None, fmt: str = None):
+    """
+    Write a feature DataFrame as a float32 Parquet/Arrow table (or CSV).
+    The format follows the file extension unless `fmt` is given.
+    """
+    fmt = fmt or infer_format(path)
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return path
+
+    _require_pyarrow()
+    table = _to_arrow_table(df, extractor_versions)
+    if fmt == "parquet":
+        pq.write_table(table, path, compression="zstd")
+    elif fmt == "arrow":
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unsupported feature table format: {fmt}")
+    return path
+
+
+# ----------------------------------------------------
+# Reading
+# ----------------------------------------------------
+def read_feature_schema(path: str) -> dict:
+    """
+    Return {"columns", "feature_names", "extractor_versions"} without reading the data.
+    CSV files only expose their header.
+    """
+    fmt = infer_format(path)
+    if fmt == "csv":
+        columns = list(pd.read_csv(path, nrows=0).columns)
+        return {"columns": columns, "feature_names": split_columns(columns)[1], "extractor_versions": {}}
+
+    _require_pyarrow()
+    if fmt == "parquet":
+        schema = pq.read_schema(path, memory_map=True)
+    else:
+        with pa.memory_map(path, "r") as source:
+            schema = pa.ipc.open_file(source).schema
+
+    metadata = schema.metadata or {}
+    feature_names = json.loads(metadata.get(b"feature_names", b"null")) or split_columns(schema.names)[1]
+    return {
+        "columns": list(schema.names),
+        "feature_names": feature_names,
+        "extractor_versions": json.loads(metadata.get(b"extractor_versions", b"{}")),
+    }
+
+
+def read_feature_table(path: str, columns=None, exclude=(), memory_map: bool = True) -> pd.DataFrame:
+    """
+    Load a feature table, reading only `columns` (minus `exclude`) when given.
+    Parquet/Arrow files are memory-mapped and their float32 dtypes are preserved.
+    """
+    fmt = infer_format(path)
+    if columns is None and exclude:
+        columns = [c for c in read_feature_schema(path)["columns"] if c not in exclude]
+    elif columns is not None:
+        columns = [c for c in columns if c not in exclude]
+
+    if fmt == "csv":
+        return pd.read_csv(path, usecols=columns)
+
+    _require_pyarrow()
+    if fmt == "parquet":
+        table = pq.read_table(path, columns=columns, memory_map=memory_map)
+    else:
+        source = pa.memory_map(path, "r") if memory_map else pa.OSFile(path, "rb")
+        table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def iter_feature_table(path: str, chunk_rows: int = 10000, columns=None, exclude=(), skip_rows: int = 0):
+    """
+    Yield a feature table as DataFrames of at most `chunk_rows` rows, so tables
+    larger than memory can be processed. The first `skip_rows` rows are skipped.
+    """
+    fmt = infer_format(path)
+    if columns is None and exclude:
+        columns = [c for c in read_feature_schema(path)["columns"] if c not in exclude]
+    elif columns is not None:
+        columns = [c for c in columns if c not in exclude]
+
+    if fmt == "csv":
+        # Skip data lines only; line 0 is the header
+        skip = range(1, skip_rows + 1) if skip_rows else None
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunk_rows, skiprows=skip)
+        return
+
+    _require_pyarrow()
+    if fmt == "parquet":
+        batches = pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=chunk_rows, columns=columns)
+    else:
+        reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        batches = (
+            reader.get_batch(i).select(columns) if columns is not None else reader.get_batch(i)
+            for i in range(reader.num_record_batches)
+        )
+    for batch in batches:
+        if skip_rows >= batch.num_rows:
+            skip_rows -= batch.num_rows
+            continue
+        if skip_rows:
+            batch, skip_rows = batch.slice(skip_rows), 0
+        # Arrow IPC batches are as large as they were written; split them to chunk_rows
+        for start in range(0, batch.num_rows, chunk_rows):
+            yield batch.slice(start, chunk_rows).to_pandas()
+
+
+def resolve_feature_table(path: str) -> str:
+    """Prefer a columnar sibling (.parquet, then .arrow) of a CSV path when one exists."""
+    base, ext = os.path.splitext(path)
+    if ext.lower() == ".csv":
+        for candidate in (base + ".parquet", base + ".arrow"):
+            if os.path.exists(candidate):
+                return candidate
+    return path
+
+
+# ----------------------------------------------------
+# CSV Conversion
+# ----------------------------------------------------
+def convert_csv(csv_path: str, output_path: str, extractor_versions: dict = None):
+    """Stream a wide CSV into a float32 Parquet table chunk by chunk."""
+    _require_pyarrow()
+    writer = None
+    rows = 0
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=CSV_CHUNK_ROWS):
+            table = _to_arrow_table(chunk, extractor_versions)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema, compression="zstd")
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Feature table utilities.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert = sub.add_parser("convert", help="Convert a wide CSV to a float32 Parquet table.")
+    convert.add_argument("csv_path")
+    convert.add_argument("output_path")
+    convert.add_argument("--extractor", choices=["acoustic", "linguistic"], default=None,
+                         help="Record the current extractor versions in the table schema.")
+
+    show = sub.add_parser("schema", help="Print the feature count and extractor versions of a table.")
+    show.add_argument("path")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        versions = {}
+        if args.extractor == "acoustic":
+            from backend.src.acoustic_extraction import get_extractor_versions
+            versions = get_extractor_versions()
+        elif args.extractor == "linguistic":
+            from backend.src.linguistic_extraction import get_extractor_versions
+            versions = get_extractor_versions()
+        rows = convert_csv(args.csv_path, args.output_path, versions)
+        print(f"✅ Converted {rows} rows → {args.output_path}")
+    else:
+        schema = read_feature_schema(args.path)
+        print(f"{len(schema['feature_names'])} features, {len(schema['columns'])} columns")
+        print(json.dumps(schema["extractor_versions"], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
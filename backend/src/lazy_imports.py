@@ -0,0 +1,89 @@
+"""
+lazy_imports.py
+---------------
+Deferred imports for the heavy ML/audio dependencies (torch, transformers,
+librosa, opensmile, pyAudioAnalysis, spaCy, LFTK, pyarrow).
+
+`lazy_module("librosa")` returns a placeholder module that performs the real
+import on first attribute access, so importing the server stays cheap and
+each dependency is only paid for by the stage that actually uses it.
+Import durations are recorded for the warm-up/profile report.
+"""
+
+import os
+import sys
+import time
+import types
+import importlib
+import threading
+
+from backend.src.logging_setup import get_logger
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "prediction_pipeline.log")
+
+logger = get_logger(__name__, LOG_FILE)
+
+# Module name -> seconds spent in its first import
+IMPORT_TIMES = {}
+
+_import_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Module placeholder that imports the real module on first use."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_target"]
+        if module is None:
+            with _import_lock:
+                module = self.__dict__["_lazy_target"]
+                if module is None:
+                    module = _timed_import(self.__name__)
+                    self.__dict__["_lazy_target"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def _timed_import(name: str):
+    """Import a module and record how long the first import took."""
+    already_loaded = name in sys.modules
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    if not already_loaded:
+        elapsed = time.perf_counter() - start
+        IMPORT_TIMES[name] = elapsed
+        logger.info(f"Imported {name} in {elapsed:.2f}s")
+    return module
+
+
+def lazy_module(name: str) -> LazyModule:
+    """Returns a placeholder for `name` that is imported on first attribute access."""
+    return LazyModule(name)
+
+
+def ensure_loaded(module):
+    """Force the import behind a lazy placeholder (used by warm-up)."""
+    if isinstance(module, LazyModule):
+        return module._load()
+    return module
+
+
+def is_loaded(name: str) -> bool:
+    """True once the real module has been imported in this process."""
+    return name in sys.modules
@@ -4,13 +4,19 @@ Extracts linguistic features from text transcriptions using SpaCy and LFTK.
 
 Supports multilingual processing (40+ languages) using appropriate SpaCy pipelines.
 Used for dementia-related language pattern analysis in multilingual datasets.
+SpaCy and LFTK are imported lazily on first use.
 """
 
 import os
+import numpy as np
 import pandas as pd
-import spacy
-import lftk
-import logging
+
+from backend.src.logging_setup import get_logger
+from backend.src.lazy_imports import lazy_module
+from backend.src.feature_store import package_versions, write_feature_table
+from backend.src.spacy_pipelines import get_pipeline_manager
+
+lftk = lazy_module("lftk")
 
 # ----------------------------------------------------
 # Configuration
@@ -21,72 +27,106 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "linguistic_extraction.log")
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
-
-# ----------------------------------------------------
-# Language to SpaCy Model Mapping
-# ----------------------------------------------------
-SPACY_PIPELINES = {
-    "de": "de_core_news_sm", "en": "en_core_web_sm", "es": "es_core_news_sm",
-    "fr": "fr_core_news_sm", "it": "it_core_news_sm", "nl": "nl_core_news_sm",
-    "pl": "pl_core_news_sm", "pt": "pt_core_news_sm", "ru": "ru_core_news_sm",
-    "zh": "zh_core_web_sm", "ja": "ja_core_news_sm", "ko": "ko_core_news_sm",
-    # fallback multilingual pipeline for unsupported languages
-    "default": "xx_sent_ud_sm"
-}
+# Bump when the set or definition of extracted features changes
+EXTRACTOR_VERSION = "1"
 
-_loaded_pipelines = {}
+# Records are queued and written by the background writer (see logging_setup.py)
+logger = get_logger(__name__, LOG_FILE)
 
 # ----------------------------------------------------
 # SpaCy Pipeline Management
 # ----------------------------------------------------
 def get_spacy_pipeline(lang_code: str):
-    """Load and cache the SpaCy pipeline for a given language."""
-    model_name = SPACY_PIPELINES.get(lang_code, SPACY_PIPELINES["default"])
-
-    if lang_code not in _loaded_pipelines:
-        try:
-            _loaded_pipelines[lang_code] = spacy.load(model_name)
-            logging.info(f"Loaded SpaCy model: {model_name} for language {lang_code}")
-        except Exception as e:
-            logging.error(f"Error loading SpaCy model for {lang_code}: {e}")
-            raise RuntimeError(f"Failed to load SpaCy model for {lang_code}: {e}")
-    
-    return _loaded_pipelines[lang_code]
+    """The (pruned, LRU-cached) SpaCy pipeline for a language; see spacy_pipelines.py."""
+    return get_pipeline_manager().get(lang_code)
 
 # ----------------------------------------------------
 # Feature Extraction Core
 # ----------------------------------------------------
-# Filter out problematic LFTK features
-_all_features = [
-    f for f in lftk.search_features(return_format="list_key")
-    if f not in ["bilog_ttr", "bilog_ttr_no_lem"]
-]
+_all_features = None
+_feature_families = None
+
+
+def get_feature_keys():
+    """Returns the LFTK feature keys in use, resolved once on first call."""
+    global _all_features
+    if _all_features is None:
+        # Filter out problematic LFTK features
+        _all_features = [
+            f for f in lftk.search_features(return_format="list_key")
+            if f not in ["bilog_ttr", "bilog_ttr_no_lem"]
+        ]
+    return _all_features
+
+
+def get_feature_families():
+    """LFTK feature families of the features in use; decides the spaCy components loaded."""
+    global _feature_families
+    if _feature_families is None:
+        keys = set(get_feature_keys())
+        _feature_families = sorted({
+            f["family"] for f in lftk.search_features(return_format="list_dict") if f["key"] in keys
+        })
+    return _feature_families
+
+
+def _extract_lftk(transcription: str, lang_code: str):
+    """LFTK feature dict for one transcription, or None if it is empty or extraction fails."""
+    if not transcription or not transcription.strip():
+        logger.warning("Empty transcription received for linguistic feature extraction.")
+        return None
+
+    try:
+        doc = get_pipeline_manager().parse(lang_code, transcription)
+        extractor = lftk.Extractor(docs=doc)
+        features = extractor.extract(features=get_feature_keys())
+        logger.info(f"Extracted linguistic features for language: {lang_code}")
+        return features
+    except Exception as e:
+        logger.error(f"Error extracting linguistic features: {e}")
+        return None
+
 
 def extract_linguistic_features(transcription: str, lang_code: str) -> pd.DataFrame:
     """
     Extract linguistic features from a single transcription.
     Returns a DataFrame with one row of feature values.
     """
-    if not transcription.strip():
-        logging.warning("Empty transcription received for linguistic feature extraction.")
-        return pd.DataFrame([{f: float("nan") for f in _all_features}])
+    features = _extract_lftk(transcription, lang_code)
+    if features is None:
+        return pd.DataFrame([{f: float("nan") for f in get_feature_keys()}])
+    return pd.DataFrame([features])
+
+
+def linguistic_block(transcription: str, lang_code: str):
+    """(feature keys, float64 values) for one transcription, or ([], empty) on failure."""
+    features = _extract_lftk(transcription, lang_code)
+    if features is None:
+        return [], np.empty(0)
+    feature_keys = get_feature_keys()
+    # dtype=float turns missing (None) values into NaN
+    return feature_keys, np.array([features.get(k) for k in feature_keys], dtype=np.float64)
+
+
+def extract_linguistic_into(transcription: str, lang_code: str, row, schema) -> bool:
+    """
+    Write the LFTK features of one transcription directly into a float32 schema row.
+    On failure the row keeps NaN for these features. Returns True if features were written.
+    """
+    feature_keys, values = linguistic_block(transcription, lang_code)
+    if not len(feature_keys):
+        return False
+    schema.write(row, "linguistic", feature_keys, values)
+    return True
+
+
+def get_extractor_versions():
+    """Versions of this extractor and the libraries it wraps, stored with feature tables."""
+    return {
+        "linguistic_extraction": EXTRACTOR_VERSION,
+        **package_versions(("spacy", "lftk")),
+    }
 
-    try:
-        nlp = get_spacy_pipeline(lang_code)
-        doc = nlp(transcription)
-        extractor = lftk.Extractor(docs=doc)
-        features = extractor.extract(features=_all_features)
-        logging.info(f"Extracted linguistic features for language: {lang_code}")
-        print("🗣️ Extracted Linguistic Features")
-        return pd.DataFrame([features])
-    except Exception as e:
-        logging.error(f"Error extracting linguistic features: {e}")
-        return pd.DataFrame([{f: float('nan') for f in _all_features}])
 
 # ----------------------------------------------------
 # Batch CSV Processing
@@ -95,6 +135,7 @@ def process_transcriptions_csv(input_csv: str, output_csv: str, lang_code: str):
     """
     Process a CSV file containing transcriptions and save linguistic features to output_csv.
     Expected column: 'transcription'
+    The output format follows the extension: .parquet/.arrow (float32 table) or .csv.
     """
     if not os.path.exists(input_csv):
         raise FileNotFoundError(f"Input CSV not found: {input_csv}")
@@ -104,6 +145,7 @@ def process_transcriptions_csv(input_csv: str, output_csv: str, lang_code: str):
         raise ValueError("Input CSV must contain a 'transcription' column.")
 
     nlp = get_spacy_pipeline(lang_code)
+    feature_keys = get_feature_keys()
     results = []
 
     for _, row in df.iterrows():
@@ -111,10 +153,10 @@ def process_transcriptions_csv(input_csv: str, output_csv: str, lang_code: str):
         try:
             doc = nlp(text)
             extractor = lftk.Extractor(docs=doc)
-            feats = extractor.extract(features=_all_features)
+            feats = extractor.extract(features=feature_keys)
         except Exception as e:
-            logging.error(f"Error extracting features for row: {e}")
-            feats = {f: float("nan") for f in _all_features}
+            logger.error(f"Error extracting features for row: {e}")
+            feats = {f: float("nan") for f in feature_keys}
 
         feats["label"] = "Unknown"
         if "id" in row:
@@ -122,8 +164,7 @@ def process_transcriptions_csv(input_csv: str, output_csv: str, lang_code: str):
         results.append(feats)
 
     features_df = pd.DataFrame(results)
-    os.makedirs(os.path.dirname(output_csv), exist_ok=True)
-    features_df.to_csv(output_csv, index=False)
-    logging.info(f"Linguistic features saved to {output_csv}")
+    write_feature_table(features_df, output_csv, get_extractor_versions())
+    logger.info(f"Linguistic features saved to {output_csv}")
     print(f"✅ Linguistic features saved to {output_csv}")
     return output_csv
@@ -0,0 +1,223 @@
+"""
+logging_setup.py
+----------------
+One logging subsystem for the pipeline, kept off the request hot path.
+
+Pipeline modules get their logger from `get_logger(__name__, log_file)`.
+Records go through a bounded in-memory queue to a single background writer
+thread (`QueueListener`), which routes each module's records to its own log
+file and, from LOG_CONSOLE_LEVEL up, to stderr. Calling threads only format
+the message and enqueue it; when the queue is full the record is dropped and
+counted rather than blocking the request.
+
+Every record carries the current `job_id` and `segment` (set with
+`log_context()`), so lines from concurrent requests can be told apart.
+
+Configuration (environment):
+  LOG_FORMAT         "text" (default) or "json" (one object per line)
+  LOG_LEVELS         per-module levels, e.g. "acoustic_extraction=WARNING,transcription=DEBUG"
+  LOG_SAMPLING       keep this fraction of a module's INFO/DEBUG records, e.g. "acoustic_extraction=0.1";
+                     warnings and errors are always kept
+  LOG_CONSOLE_LEVEL  level from which records are also written to stderr (default WARNING)
+  LOG_QUEUE_SIZE     records buffered before new ones are dropped (default 10000)
+"""
+
+import os
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+DEFAULT_LOG_FILE = os.path.join(LOG_DIR, "pipeline.log")
+
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_CONSOLE_LEVEL = os.environ.get("LOG_CONSOLE_LEVEL", "WARNING").upper()
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s job=%(job_id)s segment=%(segment)s %(message)s"
+
+
+def _parse_module_map(spec: str) -> dict:
+    """Parse "module=value,..." into {short module name: value}."""
+    entries = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        module, _, value = item.partition("=")
+        entries[module.rsplit(".", 1)[-1]] = value.strip()
+    return entries
+
+
+LOG_LEVELS = _parse_module_map(os.environ.get("LOG_LEVELS", ""))
+LOG_SAMPLING = {module: float(rate) for module, rate in _parse_module_map(os.environ.get("LOG_SAMPLING", "")).items()}
+
+job_id_var = contextvars.ContextVar("job_id", default="-")
+segment_var = contextvars.ContextVar("segment", default="-")
+
+_routes = {}  # logger name -> log file
+_file_handlers = {}  # log file -> FileHandler (writer thread only)
+_state = {"listener": None, "dropped": 0, "enqueued": 0}
+_setup_lock = threading.Lock()
+
+
+# ----------------------------------------------------
+# Context
+# ----------------------------------------------------
+@contextmanager
+def log_context(job_id=None, segment=None):
+    """Attach a job id and/or segment name to every record logged inside the block."""
+    tokens = []
+    if job_id is not None:
+        tokens.append((job_id_var, job_id_var.set(str(job_id))))
+    if segment is not None:
+        tokens.append((segment_var, segment_var.set(str(segment))))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """Copy the calling thread's job / segment ids onto the record before it is queued."""
+
+    def filter(self, record):
+        record.job_id = job_id_var.get()
+        record.segment = segment_var.get()
+        return True
+
+
+class _SamplingFilter(logging.Filter):
+    """Keep every n-th INFO/DEBUG record of a logger; warnings and errors always pass."""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1.0 / rate)) if rate > 0 else 0
+        self._count = 0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if not self.every:
+            return False
+        self._count += 1
+        return self._count % self.every == 1 or self.every == 1
+
+
+# ----------------------------------------------------
+# Writer Side (background thread)
+# ----------------------------------------------------
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "job_id": getattr(record, "job_id", "-"),
+            "segment": getattr(record, "segment", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _formatter():
+    return JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+
+
+class _RoutingHandler(logging.Handler):
+    """Writes each record to the file registered for its logger (DEFAULT_LOG_FILE otherwise)."""
+
+    def emit(self, record):
+        path = _routes.get(record.name, DEFAULT_LOG_FILE)
+        handler = _file_handlers.get(path)
+        if handler is None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            handler = _file_handlers[path] = logging.FileHandler(path, encoding="utf-8")
+            handler.setFormatter(_formatter())
+        handler.handle(record)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records are dropped and counted when the queue is full."""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            _state["enqueued"] += 1
+        except queue.Full:
+            _state["dropped"] += 1
+
+
+# ----------------------------------------------------
+# Setup
+# ----------------------------------------------------
+def _start():
+    """Install the queue handler on the root logger and start the writer thread (once per process)."""
+    if _state["listener"] is not None:
+        return
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    console = logging.StreamHandler()
+    console.setLevel(LOG_CONSOLE_LEVEL)
+    console.setFormatter(_formatter())
+    listener = QueueListener(log_queue, _RoutingHandler(), console, respect_handler_level=True)
+    listener.start()
+
+    queue_handler = _DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter())
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(logging.INFO)
+    _state.update(listener=listener, handler=queue_handler)
+    atexit.register(shutdown_logging)
+
+
+def get_logger(name: str, log_file: str = None) -> logging.Logger:
+    """
+    Logger for a pipeline module. Its records are written to `log_file` by the
+    background writer; LOG_LEVELS and LOG_SAMPLING entries for the module apply.
+    """
+    with _setup_lock:
+        _start()
+        if log_file:
+            _routes[name] = log_file
+        logger = logging.getLogger(name)
+        short_name = name.rsplit(".", 1)[-1]
+        if short_name in LOG_LEVELS:
+            logger.setLevel(LOG_LEVELS[short_name].upper())
+        if short_name in LOG_SAMPLING and not any(isinstance(f, _SamplingFilter) for f in logger.filters):
+            logger.addFilter(_SamplingFilter(LOG_SAMPLING[short_name]))
+    return logger
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    listener = _state.get("listener")
+    if listener is None:
+        return
+    listener.stop()
+    logging.getLogger().removeHandler(_state["handler"])
+    _state["listener"] = None
+    for handler in _file_handlers.values():
+        handler.close()
+    _file_handlers.clear()
+
+
+def logging_stats() -> dict:
+    """Records enqueued / dropped so far and the current queue depth."""
+    listener = _state.get("listener")
+    return {
+        "enqueued": _state["enqueued"],
+        "dropped": _state["dropped"],
+        "queued": listener.queue.qsize() if listener is not None else 0,
+        "format": LOG_FORMAT,
+        "levels": LOG_LEVELS,
+        "sampling": LOG_SAMPLING,
+    }
@@ -0,0 +1,387 @@
+"""
+memory_governor.py
+------------------
+Per-component memory accounting, idle model unloading and memory-based
+admission control for the prediction pipeline.
+
+Models register themselves when they are loaded (ASR models per language in
+transcription.py, spaCy pipelines in spacy_pipelines.py, the classifier in
+prediction_script.py) with a function that unloads them, and are touched
+whenever they are used. The governor then:
+
+- unloads components idle for longer than MODEL_IDLE_TTL seconds, checked
+  between jobs and by a background reaper thread;
+- after every job runs the garbage collector, returns freed heap pages to the
+  OS (glibc malloc_trim) and empties torch's CUDA cache when one is in use;
+- admits a job only if the projected RSS (current RSS plus the jobs already
+  admitted and a cold model load, if the job needs one) stays below
+  MEMORY_LIMIT_MB. Otherwise components no admitted job is using are unloaded
+  first (least recently used first); if that is not enough the job waits for running jobs
+  to finish (MEMORY_ADMISSION=queue) or is refused (MEMORY_ADMISSION=reject).
+  A job is always admitted when no other job is running.
+
+A job is estimated at JOB_MEMORY_MB (the report shows the RSS finished jobs
+actually retained, to help tune it) plus, if its ASR model is not loaded, the
+size that model had at its last load (ASR_MODEL_MB before the first one).
+`memory_report()` is served at /admin/memory.
+
+Configuration (environment):
+  MEMORY_LIMIT_MB        projected RSS above which jobs are held back (default 0 = no limit)
+  MEMORY_ADMISSION       "queue" (default) or "reject"
+  MEMORY_QUEUE_TIMEOUT   seconds a queued job waits before it is refused (default 120)
+  MODEL_IDLE_TTL         seconds before an unused model is unloaded (default 0 = never)
+  JOB_MEMORY_MB          per-job memory estimate (default 300)
+  ASR_MODEL_MB           estimated size of an ASR model never loaded before (default 1300)
+"""
+
+import os
+import gc
+import sys
+import time
+import ctypes
+import ctypes.util
+import threading
+from contextlib import contextmanager
+
+from backend.src.logging_setup import get_logger
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "prediction_pipeline.log")
+
+MEMORY_LIMIT_MB = float(os.environ.get("MEMORY_LIMIT_MB", 0))
+MEMORY_ADMISSION = os.environ.get("MEMORY_ADMISSION", "queue")
+MEMORY_QUEUE_TIMEOUT = float(os.environ.get("MEMORY_QUEUE_TIMEOUT", 120))
+MODEL_IDLE_TTL = float(os.environ.get("MODEL_IDLE_TTL", 0))
+JOB_MEMORY_MB = float(os.environ.get("JOB_MEMORY_MB", 300))
+ASR_MODEL_MB = float(os.environ.get("ASR_MODEL_MB", 1300))
+
+if MEMORY_ADMISSION not in ("queue", "reject"):
+    raise ValueError(f"Invalid MEMORY_ADMISSION '{MEMORY_ADMISSION}': use 'queue' or 'reject'")
+
+logger = get_logger(__name__, LOG_FILE)
+
+
+class MemoryPressure(Exception):
+    """A job was refused because it would exceed MEMORY_LIMIT_MB."""
+
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def object_mb(obj):
+    """
+    Size of a loaded model in MB: parameters and buffers of a torch module,
+    node arrays of a fitted scikit-learn forest; None for anything else.
+    """
+    if obj is None:
+        return None
+    if hasattr(obj, "parameters") and hasattr(obj, "buffers"):
+        tensors = list(obj.parameters()) + list(obj.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors) / 2 ** 20
+    if hasattr(obj, "estimators_"):
+        total = 0
+        for tree in obj.estimators_:
+            state = tree.tree_.__getstate__()
+            total += state["nodes"].nbytes + state["values"].nbytes
+        return total / 2 ** 20
+    return None
+
+
+def _load_malloc_trim():
+    """glibc's malloc_trim, or None on other C libraries."""
+    name = ctypes.util.find_library("c")
+    try:
+        libc = ctypes.CDLL(name or "libc.so.6")
+        return libc.malloc_trim
+    except (OSError, AttributeError):
+        return None
+
+
+_malloc_trim = _load_malloc_trim()
+
+
+# ----------------------------------------------------
+# Memory Governor
+# ----------------------------------------------------
+class MemoryGovernor:
+    """Registry of unloadable components plus the admission state of running jobs."""
+
+    def __init__(self, limit_mb=MEMORY_LIMIT_MB, idle_ttl=MODEL_IDLE_TTL, admission=MEMORY_ADMISSION,
+                 queue_timeout=MEMORY_QUEUE_TIMEOUT, job_mb=JOB_MEMORY_MB):
+        self.limit_mb = limit_mb
+        self.idle_ttl = idle_ttl
+        self.admission = admission
+        self.queue_timeout = queue_timeout
+        self.job_mb = job_mb
+        self._components = {}  # name -> {"unload", "size", "last_used", "loaded_at", "size_mb"}
+        self._model_mb = {}  # name -> size at its last load, kept after unloading
+        self._jobs = {}  # job token -> (reserved MB, component names it uses)
+        self._condition = threading.Condition()
+        self._reaper = None
+        self.counters = {"admitted": 0, "queued": 0, "refused": 0, "unloaded_idle": 0,
+                         "unloaded_pressure": 0, "trims": 0, "trimmed_mb": 0.0,
+                         "finished": 0, "retained_mb": 0.0}
+
+    # -- components -------------------------------------------------------
+    def register(self, name: str, unload, size=None):
+        """
+        Track a loaded component. `unload()` releases it; `size()` returns its
+        size in MB (or None to leave it unmeasured).
+        """
+        with self._condition:
+            self._components[name] = {"unload": unload, "size": size, "last_used": time.time(),
+                                      "loaded_at": time.time(), "size_mb": None}
+        size_mb = self._measure(name)
+        if size_mb is not None:
+            self._model_mb[name] = size_mb
+        self._start_reaper()
+
+    def unregister(self, name: str):
+        with self._condition:
+            self._components.pop(name, None)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._components
+
+    def touch(self, name: str):
+        component = self._components.get(name)
+        if component is not None:
+            component["last_used"] = time.time()
+
+    def _measure(self, name):
+        component = self._components.get(name)
+        if component is None or component["size"] is None:
+            return None
+        try:
+            size_mb = component["size"]()
+        except Exception as e:
+            logger.warning(f"Could not measure {name}: {e}")
+            return None
+        component["size_mb"] = size_mb
+        return size_mb
+
+    def unload(self, name: str, reason: str = "admin") -> bool:
+        with self._condition:
+            component = self._components.pop(name, None)
+        if component is None:
+            return False
+        try:
+            component["unload"]()
+        except Exception as e:
+            logger.error(f"Error unloading {name}: {e}")
+            return False
+        key = "unloaded_pressure" if reason == "pressure" else "unloaded_idle" if reason == "idle" else None
+        if key:
+            self.counters[key] += 1
+        logger.info(f"Unloaded {name} ({reason}, idle {time.time() - component['last_used']:.0f}s)")
+        return True
+
+    def unload_idle(self, ttl: float = None) -> list:
+        """Unload components unused for `ttl` seconds (default MODEL_IDLE_TTL)."""
+        ttl = self.idle_ttl if ttl is None else ttl
+        if not ttl:
+            return []
+        now = time.time()
+        with self._condition:
+            in_use = self._in_use()
+        idle = [name for name, c in list(self._components.items())
+                if now - c["last_used"] > ttl and name not in in_use]
+        unloaded = [name for name in idle if self.unload(name, reason="idle")]
+        if unloaded:
+            self.trim()
+        return unloaded
+
+    def _start_reaper(self):
+        if not self.idle_ttl or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reap, name="memory-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        # Idle models are released even when no job arrives to trigger the check
+        interval = max(1.0, min(60.0, self.idle_ttl / 2))
+        while True:
+            time.sleep(interval)
+            try:
+                self.unload_idle()
+            except Exception as e:
+                logger.error(f"Idle model reaper failed: {e}")
+
+    # -- reclamation ------------------------------------------------------
+    def trim(self):
+        """Collect garbage, return free heap pages to the OS and empty torch's CUDA cache."""
+        before = rss_mb()
+        gc.collect()
+        if _malloc_trim is not None:
+            _malloc_trim(0)
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        after = rss_mb()
+        self.counters["trims"] += 1
+        if before is not None and after is not None:
+            self.counters["trimmed_mb"] += max(0.0, before - after)
+        return after
+
+    # -- admission --------------------------------------------------------
+    def job_estimate(self, components=()) -> float:
+        """Projected growth of a job needing `components`: job memory plus cold loads."""
+        cold = sum(
+            self._model_mb.get(name, ASR_MODEL_MB if name.startswith("asr:") else 0.0)
+            for name in components if name not in self._components
+        )
+        return self.job_mb + cold
+
+    def _in_use(self) -> set:
+        """Components of the admitted jobs (lock held); never unloaded under them."""
+        return {name for _, components in self._jobs.values() for name in components}
+
+    def _projected(self, estimate):
+        current = rss_mb() or 0.0
+        return current + sum(reserved for reserved, _ in self._jobs.values()) + estimate
+
+    def _reclaim(self, needed_mb, keep):
+        """Unload least recently used components (not in `keep`) until needed_mb is freed."""
+        candidates = sorted(
+            (c["last_used"], name) for name, c in self._components.items() if name not in keep
+        )
+        freed = 0.0
+        for _, name in candidates:
+            if freed >= needed_mb:
+                break
+            size_mb = self._components[name]["size_mb"] or 0.0
+            if self.unload(name, reason="pressure"):
+                freed += size_mb
+        if freed:
+            self.trim()
+
+    @contextmanager
+    def admit(self, components=()):
+        """
+        Run a job once the memory limit allows it; `components` are the names it
+        will use (e.g. "asr:en"). Raises MemoryPressure if it is refused.
+        """
+        components = tuple(components)
+        for name in components:
+            self.touch(name)
+        estimate = self.job_estimate(components)
+        token = object()
+        start_rss = rss_mb()
+
+        with self._condition:
+            if self.limit_mb and self._projected(estimate) > self.limit_mb:
+                self._reclaim(self._projected(estimate) - self.limit_mb, keep=self._in_use() | set(components))
+            deadline = time.monotonic() + self.queue_timeout
+            queued = False
+            while self.limit_mb and self._jobs and self._projected(estimate) > self.limit_mb:
+                remaining = deadline - time.monotonic()
+                if self.admission == "reject" or remaining <= 0:
+                    self.counters["refused"] += 1
+                    logger.warning(f"Job refused: projected {self._projected(estimate):.0f} MB "
+                                   f"> limit {self.limit_mb:.0f} MB ({len(self._jobs)} running)")
+                    raise MemoryPressure(
+                        f"Not enough memory for another job (limit {self.limit_mb:.0f} MB); retry later"
+                    )
+                if not queued:
+                    queued = True
+                    self.counters["queued"] += 1
+                self._condition.wait(remaining)
+            self._jobs[token] = (estimate, components)
+            self.counters["admitted"] += 1
+
+        try:
+            yield estimate
+        finally:
+            with self._condition:
+                self._jobs.pop(token, None)
+                self._condition.notify_all()
+            after = self.after_job()
+            self.counters["finished"] += 1
+            if start_rss is not None and after is not None:
+                self.counters["retained_mb"] += after - start_rss
+            for name in components:
+                self.touch(name)
+
+    def after_job(self):
+        """Between-jobs housekeeping: idle unloading and allocator trimming."""
+        self.unload_idle()
+        return self.trim()
+
+    # -- reporting --------------------------------------------------------
+    def report(self) -> dict:
+        now = time.time()
+        with self._condition:
+            components = {
+                name: {
+                    "size_mb": round(self._measure(name) or 0.0, 1) if c["size"] is not None else None,
+                    "idle_seconds": round(now - c["last_used"], 1),
+                    "loaded_seconds": round(now - c["loaded_at"], 1),
+                }
+                for name, c in self._components.items()
+            }
+            running = len(self._jobs)
+            reserved = sum(reserved for reserved, _ in self._jobs.values())
+        current = rss_mb()
+        tracked = sum(c["size_mb"] or 0.0 for c in components.values())
+        return {
+            "rss_mb": round(current, 1) if current is not None else None,
+            "limit_mb": self.limit_mb,
+            "admission": self.admission,
+            "idle_ttl": self.idle_ttl,
+            "job_estimate_mb": self.job_mb,
+            "mean_retained_mb": (round(self.counters["retained_mb"] / self.counters["finished"], 1)
+                                 if self.counters["finished"] else None),
+            "running_jobs": running,
+            "reserved_mb": round(reserved, 1),
+            "tracked_mb": round(tracked, 1),
+            "untracked_mb": round(current - tracked, 1) if current is not None else None,
+            "components": components,
+            "last_load_mb": {name: round(mb, 1) for name, mb in self._model_mb.items()},
+            "counters": {k: round(v, 1) if isinstance(v, float) else v for k, v in self.counters.items()},
+            "malloc_trim": _malloc_trim is not None,
+        }
+
+
+_governor = MemoryGovernor()
+
+
+def get_memory_governor() -> MemoryGovernor:
+    return _governor
+
+
+def register_component(name: str, unload, size=None):
+    _governor.register(name, unload, size)
+
+
+def unregister_component(name: str):
+    _governor.unregister(name)
+
+
+def touch_component(name: str):
+    _governor.touch(name)
+
+
+def job_admission(lang: str = None):
+    """Admission context for one classification job in `lang`."""
+    components = ["classifier"]
+    if lang:
+        # Imported here: spacy_pipelines registers its models with this module
+        from backend.src.spacy_pipelines import model_for
+        components += [f"asr:{lang}", f"spacy:{model_for(lang)}"]
+    return _governor.admit(components)
+
+
+def memory_report() -> dict:
+    return _governor.report()
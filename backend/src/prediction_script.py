@@ -8,19 +8,37 @@ Runs the full dementia prediction pipeline:
 """
 
 import os
+import time
+import uuid
 import shutil
+import threading
+import numpy as np
 import pandas as pd
-import logging
-import torch
+from concurrent.futures import TimeoutError as FutureTimeout
 
 # Import project modules
+from backend.src.logging_setup import get_logger, log_context
 from backend.src.segmentation import process_single_audio_file
-from backend.src.acoustic_extraction import extract_all_features
-from backend.src.linguistic_extraction import extract_linguistic_features
-from backend.src.transcription import transcribe_audio, load_language_model, language_models
+from backend.src.acoustic_extraction import (
+    extract_acoustic_into,
+    extract_acoustic_parallel,
+    extract_acoustic_supervised,
+)
+from backend.src.shared_arrays import create_array, job_scope
+from backend.src.resources import BUDGET, stage_threads, configure_model
+from backend.src.watchdog import stage_timeout, record_call, record_timeout
+from backend.src.linguistic_extraction import extract_linguistic_into
+from backend.src.feature_schema import schema_for_scaler
+from backend.src.transcription import transcribe_audio, load_language_model, language_models, ASRModelUnavailable
+from backend.src.batching import BATCHING_ENABLED, get_asr_batcher, classifier_batcher, close_batcher
+from backend.src.result_cache import cached_classification
+from backend.src.profiling import profiled
+from backend.src.distributed import PIPELINE_BROKER, score_recording_distributed
+from backend.src.memory_governor import register_component, unregister_component, touch_component, object_mb
 from backend.api.prediction import (
     load_model_and_scaler,
-    predict,
+    load_model_bundle,
+    predict_matrix,
     save_predictions,
     weighted_majority_voting,
 )
@@ -40,20 +58,103 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "prediction_pipeline.log")
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
+# Segment-level AD probability threshold
+DECISION_THRESHOLD = 0.28
+
+# Acoustic-only cascade: segments whose screening probability falls outside
+# "low,high" are decided without ASR; inside the band they escalate to the full model.
+# Unset (default) disables the cascade. Pick the band from training's cascade_report.csv.
+CASCADE_BAND = os.environ.get("CASCADE_BAND", "")
+
+# Worker processes for acoustic extraction (0 = extract in this process). Segments and
+# the feature matrix are handed to the workers through shared memory, not pickled.
+ACOUSTIC_WORKERS = int(os.environ.get("ACOUSTIC_WORKERS", 0))
+
+# Records are queued and written by the background writer (see logging_setup.py)
+logger = get_logger(__name__, LOG_FILE)
 
 # ----------------------------------------------------
-# Load Model + Scaler
+# Load Model + Scaler (lazily, on first prediction or warm-up)
 # ----------------------------------------------------
 MODEL_PATH = os.path.join(MODEL_DIR, "random_forest_model.joblib")
 SCALER_PATH = os.path.join(MODEL_DIR, "scaler.joblib")
+# Versioned bundle written by training; preferred over the separate files above
+BUNDLE_PATH = os.path.join(MODEL_DIR, "model_bundle.joblib")
 
-model, scaler = load_model_and_scaler(MODEL_PATH, SCALER_PATH)
-logging.info("✅ Model and scaler loaded successfully.")
+_classifier = None  # {"version", "model", "scaler", "acoustic_model", "batcher"}, replaced as a whole
+_classifier_lock = threading.Lock()
+
+
+def _load_classifier() -> dict:
+    """
+    The loaded classifier, loading it on first use. The dict returned is never
+    modified afterwards, so unloading (memory_governor.py) cannot change it under a caller.
+    """
+    global _classifier
+    classifier = _classifier
+    if classifier is not None:
+        touch_component("classifier")
+        return classifier
+    with _classifier_lock:
+        if _classifier is None:
+            acoustic_model = None
+            if os.path.exists(BUNDLE_PATH):
+                bundle = load_model_bundle(BUNDLE_PATH)
+                model, scaler = bundle["model"], bundle["scaler"]
+                acoustic_model = bundle.get("acoustic_model")
+                version = bundle["version"]
+            else:
+                model, scaler = load_model_and_scaler(MODEL_PATH, SCALER_PATH)
+                version = "legacy"
+            configure_model(model)
+            if acoustic_model is not None:
+                configure_model(acoustic_model)
+            # Published in one assignment: the unlocked check above treats any entry as loaded.
+            # The batcher lives and dies with this model (no cache keyed by a reusable id()).
+            _classifier = {
+                "version": version, "model": model, "scaler": scaler, "acoustic_model": acoustic_model,
+                "batcher": classifier_batcher(model, scaler) if BATCHING_ENABLED else None,
+            }
+            logger.info(f"✅ Model and scaler loaded successfully ({version}).")
+            register_component("classifier", unload_classifier, _classifier_mb)
+        return _classifier
+
+
+def _classifier_mb():
+    classifier = _classifier or {}
+    return sum(object_mb(classifier.get(key)) or 0.0 for key in ("model", "acoustic_model"))
+
+
+def unload_classifier():
+    """Drop the loaded classifier and its batcher; the next prediction loads the bundle again."""
+    global _classifier
+    with _classifier_lock:
+        classifier, _classifier = _classifier, None
+    if classifier is not None and classifier["batcher"] is not None:
+        # The batcher's batch_fn holds the model and scaler; without this nothing is freed
+        close_batcher("classifier", classifier["batcher"])
+    unregister_component("classifier")
+
+
+def get_model_and_scaler():
+    """Load the classifier and scaler once per process and return them."""
+    classifier = _load_classifier()
+    return classifier["model"], classifier["scaler"]
+
+
+def get_acoustic_screen():
+    """Acoustic-only screening model from the bundle, or None if it has none."""
+    return _load_classifier()["acoustic_model"]
+
+
+def parse_cascade_band(value: str = CASCADE_BAND):
+    """Parse "low,high" into a (low, high) tuple; empty disables the cascade."""
+    if not value:
+        return None
+    low, high = (float(v) for v in value.split(","))
+    if not 0.0 <= low <= high <= 1.0:
+        raise ValueError(f"Invalid CASCADE_BAND '{value}': expected 0 <= low <= high <= 1")
+    return low, high
 
 
 # ----------------------------------------------------
@@ -64,9 +165,9 @@ def delete_directory(directory_path: str):
     if os.path.exists(directory_path):
         try:
             shutil.rmtree(directory_path)
-            logging.info(f"Deleted directory: {directory_path}")
+            logger.info(f"Deleted directory: {directory_path}")
         except Exception as e:
-            logging.error(f"Error deleting directory {directory_path}: {e}")
+            logger.error(f"Error deleting directory {directory_path}: {e}")
 
 
 def safe_delete_file(file_path: str):
@@ -74,89 +175,245 @@ def safe_delete_file(file_path: str):
     if os.path.exists(file_path):
         try:
             os.remove(file_path)
-            logging.info(f"Deleted file: {file_path}")
+            logger.info(f"Deleted file: {file_path}")
         except Exception as e:
-            logging.error(f"Error deleting file {file_path}: {e}")
+            logger.error(f"Error deleting file {file_path}: {e}")
 
 
 # ----------------------------------------------------
-# Main Prediction Function
+# Single-Recording Pipeline
 # ----------------------------------------------------
-def predict_final_classification(audio_file_path: str, lang: str) -> str:
+def score_recording(audio_file_path: str, lang: str, work_dir: str = None) -> dict:
     """
-    Full pipeline for audio-based dementia classification.
-    Returns 'AD' or 'HC'.
+    Segment, transcribe, extract features and classify one recording.
+    Segments are written to work_dir, which segmentation empties first and the
+    caller is responsible for removing. Without one the job uses its own
+    directory PROCESSED_DIR/<job id>, removed when it returns, so concurrent
+    jobs never touch each other's segments.
+    Returns a dict with the final label ('AD'/'HC'), the mean AD probability,
+    the segment count, the per-segment results DataFrame and the deciding
+    stage ('acoustic' when the cascade screen decided every segment, 'cascade'
+    when only some segments were escalated, else 'full').
+    Shared memory used by the job is released when it returns or fails.
+    With PIPELINE_BROKER set the stages run on distributed workers instead (see distributed.py).
     """
+    if PIPELINE_BROKER:
+        return score_recording_distributed(audio_file_path, lang)
 
-    classification_label = "Unknown"
-
+    job_id = uuid.uuid4().hex
+    own_dir = work_dir is None
+    if own_dir:
+        work_dir = os.path.join(PROCESSED_DIR, job_id)
     try:
-        logging.info(f"🚀 Starting prediction pipeline for file: {audio_file_path}")
-
-        # 1. Segment Audio
-        process_single_audio_file(audio_file_path, output_folder=PROCESSED_DIR)
-
-        # 2. Collect Segment Paths
-        segment_files = sorted(
-            [os.path.join(PROCESSED_DIR, f) for f in os.listdir(PROCESSED_DIR) if f.endswith(".wav")]
-        )
-        if not segment_files:
-            raise FileNotFoundError("No audio segments found after segmentation.")
-
-        logging.info(f"🧩 Found {len(segment_files)} audio segments for processing.")
-
-        # 3. Load Language Model
+        with job_scope(job_id), log_context(job_id=job_id):
+            return _score_job(audio_file_path, lang, work_dir, job_id)
+    finally:
+        if own_dir:
+            delete_directory(work_dir)
+
+
+def _score_job(audio_file_path: str, lang: str, work_dir: str, job_id: str) -> dict:
+    # 1. Segment Audio (published to shared memory when workers will read it)
+    segments = process_single_audio_file(
+        audio_file_path, output_folder=work_dir, job_id=job_id if ACOUSTIC_WORKERS else None
+    )
+
+    # 2. Collect Segment Paths
+    segments = sorted(segments, key=lambda segment: segment["path"])
+    segment_files = [segment["path"] for segment in segments]
+    if not segment_files:
+        raise FileNotFoundError("No audio segments found after segmentation.")
+
+    logger.info(f"🧩 Found {len(segment_files)} audio segments for processing.")
+
+    band = parse_cascade_band()
+    transcription_futures = None
+    if BATCHING_ENABLED and band is None:
+        # No cascade: queue every segment for ASR up front so the shared per-language
+        # batcher works (and merges with concurrent jobs) while acoustic extraction runs here.
+        batcher = get_asr_batcher(lang)
+        transcription_futures = [batcher.submit(path) for path in segment_files]
+
+    # 3. Extract Acoustic Features straight into the (segments x features) float32 matrix
+    # One snapshot of the classifier for the whole job, even if it is unloaded meanwhile
+    classifier = _load_classifier()
+    model, scaler = classifier["model"], classifier["scaler"]
+    schema = schema_for_scaler(scaler)
+    with stage_threads("acoustic"):
+        if ACOUSTIC_WORKERS:
+            features, features_handle = create_array((len(segments), schema.width), np.float32, job_id, fill=np.nan)
+            extract_acoustic_parallel(segments, features_handle, schema, ACOUSTIC_WORKERS)
+        elif stage_timeout("acoustic"):
+            # Supervised worker processes; segments that miss the deadline stay NaN
+            features = schema.new_rows(len(segment_files))
+            timed_out = extract_acoustic_supervised(segment_files, features, schema, BUDGET["acoustic"])
+            if timed_out:
+                logger.warning(f"{timed_out}/{len(segment_files)} segments missed the acoustic deadline.")
+        else:
+            features = schema.new_rows(len(segment_files))
+            for i, segment_path in enumerate(segment_files):
+                with log_context(segment=os.path.basename(segment_path)):
+                    logger.info("Processing segment")
+                    extract_acoustic_into(segment_path, features[i], schema)
+
+    # 4. Acoustic Screen: segments the acoustic-only model is confident about skip ASR
+    #    (decided per segment, as training's cascade_report.csv evaluates it)
+    acoustic_model = classifier["acoustic_model"] if band else None
+    screen_probability = None
+    escalated = np.arange(len(segment_files))
+    if acoustic_model is not None:
+        with stage_threads("classifier"):
+            screen_probs = np.asarray(predict_matrix(acoustic_model, scaler, features, schema), dtype=np.float64)
+        screen_probability = float(screen_probs.mean())
+        escalated = np.flatnonzero((screen_probs > band[0]) & (screen_probs < band[1]))
+        if not len(escalated):
+            logger.info(f"Acoustic screen decided every segment (outside {band}); skipping ASR.")
+            return _summarize(segment_files, screen_probs, stage="acoustic", screen_probability=screen_probability)
+        logger.info(f"Acoustic screen uncertain on {len(escalated)}/{len(segment_files)} segments; "
+                    f"escalating them to the full model.")
+    escalated_files = [segment_files[i] for i in escalated]
+
+    # 5. Transcribe + Extract Linguistic Features
+    if BATCHING_ENABLED:
+        if transcription_futures is None:
+            batcher = get_asr_batcher(lang)
+            transcription_futures = [batcher.submit(path) for path in escalated_files]
+        transcriptions = _collect_transcriptions(transcription_futures)
+    else:
         load_language_model(lang)
         tokenizer = language_models[lang]["tokenizer"]
         asr_model = language_models[lang]["model"]
+        with stage_threads("asr"):
+            transcriptions = [transcribe_audio(path, tokenizer, asr_model, device="cpu") for path in escalated_files]
+
+    with stage_threads("linguistic"):
+        for i, transcription in zip(escalated, transcriptions):
+            if transcription is not None:
+                with log_context(segment=os.path.basename(segment_files[i])):
+                    extract_linguistic_into(transcription, lang, features[i], schema)
+
+    # 6. Predict Probabilities
+    rows = features if len(escalated) == len(segment_files) else features[escalated]
+    if classifier["batcher"] is not None:
+        probabilities = classifier["batcher"].map(list(rows))
+    else:
+        with stage_threads("classifier"):
+            probabilities = predict_matrix(model, scaler, rows, schema)
+
+    if acoustic_model is not None and len(escalated) < len(segment_files):
+        screen_probs[escalated] = probabilities
+        return _summarize(segment_files, screen_probs, stage="cascade", screen_probability=screen_probability)
+    return _summarize(segment_files, probabilities, stage="full", screen_probability=screen_probability)
+
+
+def _collect_transcriptions(futures):
+    """
+    Wait for batched ASR results until the ASR deadline. Segments still pending
+    then get None (their linguistic features stay NaN); the batcher finishes them
+    in the background, but this request no longer waits. Segments whose
+    transcription failed get None as well; a model that cannot be loaded
+    fails the job (ASRModelUnavailable).
+    """
+    timeout = stage_timeout("asr")
+    deadline = time.monotonic() + timeout if timeout else None
+    record_call("asr")
+    transcriptions = []
+    missed = 0
+    for future in futures:
+        try:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            transcriptions.append(future.result(timeout=remaining))
+        except FutureTimeout:
+            missed += 1
+            transcriptions.append(None)
+        except ASRModelUnavailable:
+            # No segment can be transcribed: fail the job rather than classify without language features
+            raise
+        except Exception as e:
+            logger.error(f"Transcription failed: {e}")
+            transcriptions.append(None)
+
+    if missed:
+        record_timeout("asr")
+        logger.warning(f"{missed}/{len(futures)} segments missed the {timeout:.0f}s ASR deadline.")
+    return transcriptions
+
+
+def _summarize(segment_files, probabilities, stage: str, screen_probability=None) -> dict:
+    """Per-segment results plus weighted majority vote for one recording."""
+    results = []
+    for segment_path, positive_prob in zip(segment_files, probabilities):
+        positive_prob = float(positive_prob)
+        results.append({
+            "file_name": os.path.basename(segment_path),
+            "Prediction": 1 if positive_prob >= DECISION_THRESHOLD else 0,
+            "Probability": positive_prob,
+        })
+
+    all_results_df = pd.DataFrame(results)
+    classification_result = weighted_majority_voting(all_results_df)
+
+    return {
+        "label": "HC" if classification_result == 0 else "AD",
+        "probability": float(all_results_df["Probability"].mean()),
+        "n_segments": len(all_results_df),
+        "segments": all_results_df,
+        "stage": stage,
+        "screen_probability": screen_probability,
+    }
 
-        results = []
-
-        for segment_path in segment_files:
-            logging.info(f"Processing segment: {segment_path}")
-
-            # --- Extract Acoustic Features ---
-            acoustic_features = extract_all_features(segment_path)
-            acoustic_df = pd.DataFrame([acoustic_features])
-
-            # --- Transcribe Segment ---
-            transcription = transcribe_audio(segment_path, tokenizer, asr_model, device="cpu")
-
-            # --- Extract Linguistic Features ---
-            linguistic_df = extract_linguistic_features(transcription, lang)
-
-            # --- Combine Features ---
-            combined_features = pd.concat([acoustic_df, linguistic_df], axis=1)
-
-            # --- Predict Probability ---
-            preds, probs = predict(model, scaler, combined_features)
-            positive_prob = probs[0]
-            threshold = 0.28
-            predicted_label = 1 if positive_prob >= threshold else 0
 
-            acoustic_df["Prediction"] = predicted_label
-            acoustic_df["Probability"] = positive_prob
-            acoustic_df["file_name"] = os.path.basename(segment_path)
+# ----------------------------------------------------
+# Main Prediction Function
+# ----------------------------------------------------
+def predict_final_classification(audio_file_path: str, lang: str, profile_id: str = None) -> str:
+    """
+    Full pipeline for audio-based dementia classification.
+    Returns 'AD' or 'HC'. With a profile_id the job bypasses the result cache
+    and runs under cProfile / tracemalloc (see profiling.py).
+    """
+    return classify_recording(audio_file_path, lang, profile_id)[0]
 
-            results.append(acoustic_df)
 
-        # 4. Combine and Save All Results
-        all_results_df = pd.concat(results, ignore_index=True)
-        save_predictions(all_results_df, all_results_df["Prediction"], all_results_df["Probability"])
+def classify_recording(audio_file_path: str, lang: str, profile_id: str = None):
+    """
+    predict_final_classification, also returning where the label came from:
+    "computed", "profiled" (computed under the profiler), "cached" / "joined"
+    (result cache) or "error". Only "computed" jobs say how long the pipeline takes.
+    """
 
-        # 5. Weighted Majority Voting
-        classification_result = weighted_majority_voting(all_results_df)
-        classification_label = "HC" if classification_result == 0 else "AD"
+    classification_label = "Unknown"
+    source = "computed"
 
-        logging.info(f"✅ Final classification result: {classification_label}")
-        return classification_label
+    try:
+        logger.info(f"🚀 Starting prediction pipeline for file: {audio_file_path}")
+
+        if profile_id:
+            with profiled(profile_id, lang=lang, file=os.path.basename(audio_file_path)) as active:
+                result = score_recording(audio_file_path, lang)
+            source = "profiled" if active else "computed"
+        else:
+            # Retries and re-uploads of the same recording reuse a cached or running result
+            result, source = cached_classification(
+                audio_file_path, lang, lambda: score_recording(audio_file_path, lang)
+            )
+
+        # Save per-segment results (once, by the request that computed them)
+        if source in ("computed", "profiled"):
+            all_results_df = result["segments"]
+            save_predictions(all_results_df, all_results_df["Prediction"], all_results_df["Probability"])
+        else:
+            logger.info(f"Classification served from result cache ({source})")
+
+        classification_label = result["label"]
+        logger.info(f"✅ Final classification result: {classification_label}")
+        return classification_label, source
 
     except Exception as e:
-        logging.error(f"Error during classification: {e}")
-        return "Error: Could not classify audio."
+        logger.error(f"Error during classification: {e}")
+        return "Error: Could not classify audio.", "error"
 
     finally:
-        # Clean up after prediction
-        delete_directory(PROCESSED_DIR)
+        # Clean up after prediction (segments are removed by score_recording with the job's directory)
         safe_delete_file(os.path.join(UPLOAD_DIR, "recording.wav"))
         safe_delete_file(os.path.join(UPLOAD_DIR, "test_connection.wav"))
@@ -0,0 +1,168 @@
+"""
+profiling.py
+------------
+Opt-in profiling of single prediction jobs.
+
+A request sent with `X-Profile: 1` (and the admin token, see server.py) runs
+its classification under cProfile and tracemalloc. The artifacts are stored
+under PROFILE_DIR/<profile id>:
+
+  profile.prof    raw cProfile stats (open with pstats or snakeviz)
+  profile.txt     top functions by cumulative and by own time
+  memory.txt      top allocation sites still held at the end, plus the peak
+  summary.json    job metadata, wall time, peak traced memory
+
+and can be listed and downloaded through `/admin/profiles`. Requests without
+the flag only pay for one boolean check.
+
+cProfile sees the request thread only: time spent in the batching threads
+shows up as waiting on their futures, and supervised workers run in other
+processes. Set BATCHING_ENABLED=0 and STAGE_TIMEOUTS=acoustic=0 when every
+stage should appear in the profile. tracemalloc covers all threads of this process.
+
+Configuration (environment):
+  PROFILE_DIR   where artifacts are stored (default backend/profiles)
+  PROFILE_KEEP  number of most recent profiles kept (default 20)
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+from backend.src.logging_setup import get_logger
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "..", "profiles"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 20))
+
+ARTIFACTS = ("profile.prof", "profile.txt", "memory.txt", "summary.json")
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 30
+TRACEMALLOC_FRAMES = 10
+
+logger = get_logger(__name__)
+
+# cProfile allows one active profiler per process; concurrent profiled requests run unprofiled
+_profile_lock = threading.Lock()
+
+
+# ----------------------------------------------------
+# Profiling
+# ----------------------------------------------------
+@contextmanager
+def profiled(profile_id: str, **metadata):
+    """
+    Profile the block (CPU with cProfile, memory with tracemalloc) and store the
+    artifacts under PROFILE_DIR/profile_id. Yields True if profiling is active,
+    False if another profile was already running.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning(f"Profile {profile_id} skipped: another profile is running")
+        yield False
+        return
+
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    error = None
+    try:
+        yield True
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        profiler.disable()
+        wall = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+        try:
+            _save(profile_id, profiler, snapshot, {
+                **metadata,
+                "profile_id": profile_id,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "wall_seconds": round(wall, 3),
+                "traced_current_bytes": current,
+                "traced_peak_bytes": peak,
+                "error": error,
+            })
+        finally:
+            _profile_lock.release()
+
+
+def _save(profile_id, profiler, snapshot, summary):
+    path = profile_path(profile_id)
+    os.makedirs(path, exist_ok=True)
+    profiler.dump_stats(os.path.join(path, "profile.prof"))
+
+    report = io.StringIO()
+    stats = pstats.Stats(profiler, stream=report).strip_dirs()
+    for key in ("cumulative", "tottime"):
+        report.write(f"==== sorted by {key} ====\n")
+        stats.sort_stats(key).print_stats(TOP_FUNCTIONS)
+    with open(os.path.join(path, "profile.txt"), "w") as f:
+        f.write(report.getvalue())
+
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+    with open(os.path.join(path, "memory.txt"), "w") as f:
+        f.write(f"peak traced: {summary['traced_peak_bytes'] / 2**20:.1f} MiB, "
+                f"held at end: {summary['traced_current_bytes'] / 2**20:.1f} MiB\n\n")
+        for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            f.write(f"{stat}\n")
+
+    with open(os.path.join(path, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    logger.info(f"Saved profile {profile_id} ({summary['wall_seconds']}s)")
+    _prune()
+
+
+# ----------------------------------------------------
+# Stored Profiles
+# ----------------------------------------------------
+def profile_path(profile_id: str) -> str:
+    """Directory of a profile; ids are restricted to [A-Za-z0-9_-]."""
+    if not profile_id or not all(c.isalnum() or c in "-_" for c in profile_id):
+        raise ValueError(f"Invalid profile id: {profile_id!r}")
+    return os.path.join(PROFILE_DIR, profile_id)
+
+
+def list_profiles() -> list:
+    """Summaries of stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    summaries = []
+    for name in os.listdir(PROFILE_DIR):
+        try:
+            with open(os.path.join(PROFILE_DIR, name, "summary.json")) as f:
+                summaries.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return sorted(summaries, key=lambda s: s.get("created", ""), reverse=True)
+
+
+def artifact_path(profile_id: str, artifact: str):
+    """Path of one stored artifact, or None if it does not exist."""
+    if artifact not in ARTIFACTS:
+        return None
+    path = os.path.join(profile_path(profile_id), artifact)
+    return path if os.path.isfile(path) else None
+
+
+def _prune():
+    for summary in list_profiles()[PROFILE_KEEP:]:
+        shutil.rmtree(profile_path(summary["profile_id"]), ignore_errors=True)
@@ -0,0 +1,221 @@
+"""
+resources.py
+------------
+CPU thread budgets for the pipeline stages.
+
+Every stage (ASR, acoustic, linguistic, classifier) gets an explicit number
+of threads from one configuration, so concurrent requests and pool workers
+do not oversubscribe the machine:
+
+- ASR:         torch intra-op threads (`torch.set_num_threads`), set when torch is first used.
+- classifier:  the random forest's `n_jobs`.
+- acoustic / linguistic / classifier: BLAS and OpenMP pools (numpy, scipy, librosa,
+  spaCy) through threadpoolctl while the stage runs. Native pools are process-wide,
+  so a stage's own budget is only applied while it is the only stage running; when
+  stages overlap, the pools fall back to NATIVE_THREADS.
+
+Worker processes (score_corpus, ACOUSTIC_WORKERS) split the budget between them.
+`stage_threads()` also records wall and CPU time per stage; `resource_report()`
+turns that into effective cores used per stage.
+
+Configuration (environment):
+  CPU_BUDGET      cores this process may use (default: cores available to it)
+  THREAD_BUDGET   per-stage threads, e.g. "asr=4,acoustic=1,linguistic=1,classifier=2"
+  NATIVE_THREADS  BLAS/OpenMP threads while stages overlap (default 1)
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    from threadpoolctl import ThreadpoolController
+except ImportError:  # optional; without it only torch and n_jobs are limited
+    ThreadpoolController = None
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+STAGES = ("asr", "acoustic", "linguistic", "classifier")
+NATIVE_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def available_cores() -> int:
+    """Cores this process may run on (respects CPU affinity / container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_budget(total: int) -> dict:
+    """ASR gets half of the cores; the other stages share the rest."""
+    return {
+        "asr": max(1, total // 2),
+        "acoustic": max(1, total // 4),
+        "linguistic": 1,
+        "classifier": max(1, total // 4),
+    }
+
+
+def parse_budget(spec: str, total: int) -> dict:
+    """Parse "stage=threads,..." on top of the default budget for `total` cores."""
+    budget = default_budget(total)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        stage, _, threads = item.partition("=")
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage '{stage}' in THREAD_BUDGET. Use one of {STAGES}.")
+        budget[stage] = max(1, int(threads))
+    return budget
+
+
+CPU_BUDGET = int(os.environ.get("CPU_BUDGET", 0)) or available_cores()
+BUDGET = parse_budget(os.environ.get("THREAD_BUDGET", ""), CPU_BUDGET)
+NATIVE_THREADS = int(os.environ.get("NATIVE_THREADS", 1))
+
+_controller = None
+_controller_modules = 0
+_active = {}  # thread id -> {"stage", "overlapped"} for the stage running on it
+_state_lock = threading.Lock()
+_usage = {stage: {"calls": 0, "overlapped": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0} for stage in STAGES}
+
+
+def _native_controller():
+    """threadpoolctl controller, rescanned when new modules (and native libraries) were imported."""
+    global _controller, _controller_modules
+    if ThreadpoolController is not None and (_controller is None or len(sys.modules) != _controller_modules):
+        _controller = ThreadpoolController()
+        _controller_modules = len(sys.modules)
+    return _controller
+
+
+def _limit_native(threads: int):
+    controller = _native_controller()
+    if controller is not None:
+        controller.limit(limits=threads)
+
+
+# ----------------------------------------------------
+# Process Configuration
+# ----------------------------------------------------
+def budget_for_workers(workers: int, budget: dict = None) -> dict:
+    """Per-process budget when `workers` processes share this machine's budget."""
+    budget = budget or BUDGET
+    return {stage: max(1, threads // max(1, workers)) for stage, threads in budget.items()}
+
+
+def configure_process(budget: dict = None, native_threads: int = None):
+    """
+    Apply a budget to this process: native thread pools (env vars for libraries
+    not loaded yet, threadpoolctl for loaded ones) and torch if it is imported.
+    Call at the start of worker processes; the server uses the module defaults.
+    """
+    global NATIVE_THREADS
+    if budget:
+        BUDGET.update(budget)
+    if native_threads is not None:
+        NATIVE_THREADS = max(1, native_threads)
+
+    for var in NATIVE_THREAD_VARS:
+        os.environ[var] = str(NATIVE_THREADS)
+    _limit_native(NATIVE_THREADS)
+    apply_torch_threads()
+    logging.info(f"Thread budget {BUDGET} (native pools {NATIVE_THREADS})")
+
+
+def apply_torch_threads():
+    """Set torch intra-op threads to the ASR budget (no-op until torch is imported)."""
+    if "torch" not in sys.modules:
+        return
+    torch = sys.modules["torch"]
+    torch.set_num_threads(BUDGET["asr"])
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before the first parallel op; keep whatever is set
+        pass
+
+
+def configure_model(model):
+    """Limit a fitted scikit-learn ensemble to the classifier budget."""
+    if hasattr(model, "n_jobs"):
+        model.n_jobs = BUDGET["classifier"]
+    return model
+
+
+# ----------------------------------------------------
+# Stage Accounting
+# ----------------------------------------------------
+def _apply_stage_limits():
+    """One stage running: give native pools its budget. Several: the shared default."""
+    if len(_active) == 1:
+        _limit_native(BUDGET[next(iter(_active.values()))["stage"]])
+    else:
+        _limit_native(NATIVE_THREADS)
+
+
+@contextmanager
+def stage_threads(stage: str):
+    """Run a block under `stage`'s thread budget and record its wall/CPU time."""
+    if stage not in BUDGET:
+        raise ValueError(f"Unknown stage '{stage}'. Use one of {STAGES}.")
+
+    thread_id = threading.get_ident()
+    with _state_lock:
+        entry = {"stage": stage, "overlapped": bool(_active)}
+        for other in _active.values():
+            other["overlapped"] = True
+        _active[thread_id] = entry
+        _apply_stage_limits()
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield BUDGET[stage]
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        with _state_lock:
+            _active.pop(thread_id, None)
+            _apply_stage_limits()
+            usage = _usage[stage]
+            usage["calls"] += 1
+            usage["overlapped"] += entry["overlapped"]
+            usage["wall_seconds"] += wall
+            usage["cpu_seconds"] += cpu
+
+
+def resource_report() -> dict:
+    """
+    Budget, native pools and per-stage usage. `effective_cores` is process CPU
+    time over wall time; for calls that overlapped other stages it also
+    includes their CPU time, so treat it as an upper bound there.
+    """
+    with _state_lock:
+        stages = {}
+        for stage, usage in _usage.items():
+            wall = usage["wall_seconds"]
+            stages[stage] = {
+                **{k: round(v, 3) if isinstance(v, float) else v for k, v in usage.items()},
+                "budget": BUDGET[stage],
+                "effective_cores": round(usage["cpu_seconds"] / wall, 2) if wall else 0.0,
+            }
+        running = sorted(entry["stage"] for entry in _active.values())
+
+    controller = _native_controller()
+    native = [
+        {"library": pool.internal_api, "prefix": pool.prefix, "threads": pool.num_threads}
+        for pool in (controller.lib_controllers if controller is not None else [])
+    ]
+    torch_threads = sys.modules["torch"].get_num_threads() if "torch" in sys.modules else None
+
+    return {
+        "cpu_budget": CPU_BUDGET,
+        "budget": dict(BUDGET),
+        "native_threads": NATIVE_THREADS,
+        "native_pools": native,
+        "torch_threads": torch_threads,
+        "running": running,
+        "stages": stages,
+    }
@@ -0,0 +1,197 @@
+"""
+result_cache.py
+---------------
+Result cache and in-flight deduplication for whole-recording classifications.
+
+Clients retry `/get_classification` after timeouts and sometimes re-upload the
+same recording. Each request is keyed by a keyed hash of the audio bytes and
+the language:
+
+- If a result for the key is cached and not expired, it is returned at once.
+- If the same key is already being computed, the request waits for that
+  computation instead of starting another pipeline run. The wait is bounded
+  by RESULT_CACHE_JOIN_TIMEOUT; a request that gives up computes the result
+  itself, so one stuck pipeline run cannot hold every retry of it.
+- Otherwise the request computes the result and caches it on success.
+  Failures are passed to every waiting request but never cached.
+
+Only the key (an HMAC-SHA256 digest) and the small summary (label,
+probability, segment count, stage) are kept; no audio, transcripts or file
+names. The HMAC key is random per process unless RESULT_CACHE_SECRET is set,
+so digests cannot be matched against hashes of known recordings, and the
+cache starts empty after a restart (and thus after a model change).
+
+Configuration (environment):
+  RESULT_CACHE_SIZE    maximum cached results, least recently used evicted first
+                       (default 256, 0 disables caching but keeps deduplication)
+  RESULT_CACHE_TTL     seconds a result stays valid (default 3600)
+  RESULT_CACHE_SECRET  HMAC key shared by several processes (default: random per process)
+  RESULT_CACHE_JOIN_TIMEOUT  seconds a request waits for an identical one in flight
+                       (default: the sum of the ffmpeg, acoustic and ASR stage deadlines,
+                       see watchdog.py; 0 waits without limit)
+"""
+
+import os
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from backend.src.logging_setup import get_logger
+from backend.src.watchdog import stage_timeout
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "prediction_pipeline.log")
+
+logger = get_logger(__name__, LOG_FILE)
+
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", 256))
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", 3600))
+_SECRET = os.environ.get("RESULT_CACHE_SECRET", "").encode() or os.urandom(32)
+# A healthy run finishes within its stage deadlines; waiting longer means it is stuck
+RESULT_CACHE_JOIN_TIMEOUT = float(
+    os.environ.get("RESULT_CACHE_JOIN_TIMEOUT", sum(stage_timeout(s) or 0.0 for s in ("ffmpeg", "acoustic", "asr")))
+)
+
+HASH_CHUNK_BYTES = 1 << 20
+# Summary fields kept for cached results
+CACHED_FIELDS = ("label", "probability", "n_segments", "stage", "screen_probability")
+
+
+def content_key(file_path: str, lang: str) -> str:
+    """HMAC-SHA256 of the language and the file's bytes, read in chunks."""
+    digest = hmac.new(_SECRET, digestmod=hashlib.sha256)
+    digest.update(lang.encode() + b"\0")
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ----------------------------------------------------
+# Cache
+# ----------------------------------------------------
+class ResultCache:
+    """Bounded TTL/LRU cache of results plus a table of computations in progress."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 join_timeout: float = RESULT_CACHE_JOIN_TIMEOUT):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = ttl
+        self.join_timeout = join_timeout or None
+        self._entries = OrderedDict()  # key -> (expires_at, summary)
+        self._inflight = {}            # key -> Future
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "joined": 0, "join_timeouts": 0, "errors": 0, "evicted": 0,
+                       "expired": 0}
+
+    def _lookup(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[key]
+            self._stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key: str, result: dict):
+        if not self.max_entries:
+            return
+        summary = {field: result.get(field) for field in CACHED_FIELDS}
+        self._entries[key] = (time.monotonic() + self.ttl, summary)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evicted"] += 1
+
+    def get_or_compute(self, key: str, compute):
+        """
+        Return (result, source) for `key`, where source is "cached", "joined"
+        (waited for an identical request already running) or "computed".
+        Cached and joined results may only carry the CACHED_FIELDS summary.
+        A join that outlasts join_timeout computes the result itself.
+        """
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                self._stats["hits"] += 1
+                return dict(cached), "cached"
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self._stats["misses"] += 1
+                future = self._inflight[key] = Future()
+            else:
+                self._stats["joined"] += 1
+
+        if not owner:
+            logger.info(f"Joining in-flight classification {key[:12]}")
+            try:
+                return dict(future.result(timeout=self.join_timeout)), "joined"
+            except FutureTimeout:
+                with self._lock:
+                    self._stats["join_timeouts"] += 1
+                logger.warning(f"In-flight classification {key[:12]} still running after "
+                                f"{self.join_timeout:g}s; computing it again")
+            try:
+                result = compute()
+            except BaseException:
+                with self._lock:
+                    self._stats["errors"] += 1
+                raise
+            with self._lock:
+                self._store(key, result)
+            return result, "computed"
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                self._stats["errors"] += 1
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._store(key, result)
+            del self._inflight[key]
+        future.set_result(result)
+        return result, "computed"
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "in_flight": len(self._inflight),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "join_timeout_seconds": self.join_timeout,
+            }
+
+
+_cache = ResultCache()
+
+
+def cached_classification(file_path: str, lang: str, compute):
+    """Classify a recording through the shared cache: returns (result, source)."""
+    return _cache.get_or_compute(content_key(file_path, lang), compute)
+
+
+def result_cache_stats() -> dict:
+    """Hit / miss / join counters and occupancy of the shared result cache."""
+    return _cache.stats()
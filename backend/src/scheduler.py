@@ -0,0 +1,477 @@
+"""
+scheduler.py
+------------
+Cost-model based ordering and admission of classification jobs.
+
+Processing time grows with the number of 20-second segments (see
+segmentation.py) and depends on the language, whose ASR model may first have
+to be loaded. Every job is estimated before it runs:
+
+  seconds = base[lang] + per_segment[lang] * segments (+ load[lang] if the model is cold)
+
+The coefficients are fitted by least squares from recorded job timings: per
+language once it has COST_MIN_OBSERVATIONS warm jobs, otherwise over all
+languages, and from the COST_* defaults before any job has finished. Load
+times are recorded by transcription.py whenever an ASR model is loaded.
+Timings are appended to logs/job_timings.jsonl and read back at startup, so
+the model survives restarts.
+
+At most SCHEDULER_SLOTS jobs run at once (each segments into its own work
+directory, see prediction_script.score_recording); the rest wait, and a free
+slot goes to:
+  fifo  the oldest job (arrival order)
+  sjf   the job with the smallest estimate (default)
+  fair  the job of the client with the least recently served work (estimated
+        seconds, decayed with a FAIR_SHARE_HALF_LIFE half-life), then the smallest
+Under sjf and fair, jobs waiting longer than SCHEDULER_MAX_WAIT seconds go
+first, so long recordings are not starved.
+
+The predicted wait of a job simulates the slots over the running jobs'
+remaining estimates and the jobs ordered ahead of it. When the predicted wait
+plus the job's own estimate exceeds its deadline (the X-Deadline-Seconds
+header, else SCHEDULER_DEADLINE) the job is refused before it is queued.
+
+Configuration (environment):
+  SCHEDULER_POLICY       fifo, sjf (default) or fair
+  SCHEDULER_SLOTS        concurrent jobs (default PIPELINE_WORKERS, else 2)
+  SCHEDULER_DEADLINE     default deadline in seconds (default 0 = none)
+  SCHEDULER_MAX_WAIT     seconds after which a waiting job is served first (default 300)
+  FAIR_SHARE_HALF_LIFE   seconds for a client's served work to halve (default 300)
+  COST_BASE_SECONDS / COST_SEGMENT_SECONDS / COST_LOAD_SECONDS   estimates before any timing is recorded
+"""
+
+import os
+import json
+import time
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+import numpy as np
+
+from backend.src.logging_setup import get_logger
+from backend.src.audio_io import audio_duration
+from backend.src.segmentation import segment_count, SEGMENT_SECONDS
+from backend.src.memory_governor import get_memory_governor
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "prediction_pipeline.log")
+TIMINGS_FILE = os.path.join(LOG_DIR, "job_timings.jsonl")
+
+POLICIES = ("fifo", "sjf", "fair")
+SCHEDULER_POLICY = os.environ.get("SCHEDULER_POLICY", "sjf")
+SCHEDULER_SLOTS = int(os.environ.get("SCHEDULER_SLOTS", os.environ.get("PIPELINE_WORKERS", 2)))
+SCHEDULER_DEADLINE = float(os.environ.get("SCHEDULER_DEADLINE", 0))
+SCHEDULER_MAX_WAIT = float(os.environ.get("SCHEDULER_MAX_WAIT", 300))
+FAIR_SHARE_HALF_LIFE = float(os.environ.get("FAIR_SHARE_HALF_LIFE", 300))
+
+COST_BASE_SECONDS = float(os.environ.get("COST_BASE_SECONDS", 2.0))
+COST_SEGMENT_SECONDS = float(os.environ.get("COST_SEGMENT_SECONDS", 3.0))
+COST_LOAD_SECONDS = float(os.environ.get("COST_LOAD_SECONDS", 25.0))
+COST_MIN_OBSERVATIONS = 5
+# Recent jobs per language the model is fitted on
+COST_WINDOW = 200
+# Bytes per second of the 16 kHz, 16-bit mono WAV the app uploads (when the header is unreadable)
+UPLOAD_BYTES_PER_SECOND = 32000
+
+if SCHEDULER_POLICY not in POLICIES:
+    raise ValueError(f"Invalid SCHEDULER_POLICY '{SCHEDULER_POLICY}': use one of {POLICIES}")
+
+logger = get_logger(__name__, LOG_FILE)
+
+
+class DeadlineExceeded(Exception):
+    """A job was refused because its estimated completion misses its deadline."""
+
+    def __init__(self, message: str, estimate: dict):
+        super().__init__(message)
+        self.estimate = estimate
+
+
+def recording_segments(file_path: str) -> int:
+    """Segments a recording will be split into, from its header (or size) alone."""
+    duration = audio_duration(file_path)
+    if duration is None:
+        duration = os.path.getsize(file_path) / UPLOAD_BYTES_PER_SECOND if os.path.exists(file_path) else SEGMENT_SECONDS
+    return segment_count(duration)
+
+
+# ----------------------------------------------------
+# Cost Model
+# ----------------------------------------------------
+class CostModel:
+    """Per-language linear job-time model fitted from recorded timings."""
+
+    def __init__(self, path=TIMINGS_FILE, window=COST_WINDOW):
+        self.path = path
+        self.jobs = {}  # lang -> deque of (segments, warm seconds)
+        self.loads = {}  # lang -> deque of load seconds
+        self.window = window
+        self._fits = {}
+        self._lock = threading.Lock()
+        if path:
+            self._read()
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._add(record)
+
+    def _add(self, record):
+        lang = record.get("lang")
+        if record.get("type") == "load":
+            self.loads.setdefault(lang, deque(maxlen=self.window)).append(record["seconds"])
+        elif record.get("type") == "job":
+            seconds = record["seconds"] - (record.get("load_seconds") or 0.0)
+            self.jobs.setdefault(lang, deque(maxlen=self.window)).append((record["segments"], max(0.0, seconds)))
+        self._fits.pop(lang, None)
+        self._fits.pop(None, None)
+
+    def _append(self, record):
+        with self._lock:
+            self._add(record)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def record_job(self, lang, segments, seconds, load_seconds=0.0):
+        """A finished job: wall seconds, of which load_seconds loading its ASR model."""
+        self._append({"type": "job", "time": time.time(), "lang": lang, "segments": segments,
+                      "seconds": round(seconds, 3), "load_seconds": round(load_seconds, 3)})
+
+    def record_load(self, lang, seconds):
+        self._append({"type": "load", "time": time.time(), "lang": lang, "seconds": round(seconds, 3)})
+
+    @staticmethod
+    def _fit(points):
+        """Least-squares (base, per_segment) for (segments, seconds) points, or None."""
+        if len(points) < COST_MIN_OBSERVATIONS:
+            return None
+        segments, seconds = (np.asarray(v, dtype=np.float64) for v in zip(*points))
+        if np.ptp(segments) > 0:
+            per_segment, base = np.polyfit(segments, seconds, 1)
+            if per_segment > 0 and base >= 0:
+                return float(base), float(per_segment)
+        # All jobs the same length, or a fit with a negative term: time proportional to segments
+        return 0.0, float(seconds.sum() / segments.sum())
+
+    def coefficients(self, lang):
+        """(base, per_segment, source) for a language; source is the data the fit came from."""
+        with self._lock:
+            if lang not in self._fits:
+                fit = self._fit(list(self.jobs.get(lang, ())))
+                self._fits[lang] = (*fit, "language") if fit else None
+            if self._fits[lang] is not None:
+                return self._fits[lang]
+            if None not in self._fits:
+                fit = self._fit([point for points in self.jobs.values() for point in points])
+                self._fits[None] = (*fit, "pooled") if fit else (COST_BASE_SECONDS, COST_SEGMENT_SECONDS, "default")
+            return self._fits[None]
+
+    def load_seconds(self, lang):
+        loads = self.loads.get(lang) or [s for values in self.loads.values() for s in values]
+        return float(np.median(loads)) if loads else COST_LOAD_SECONDS
+
+    def estimate(self, lang, segments, cold=False) -> float:
+        base, per_segment, _ = self.coefficients(lang)
+        return base + per_segment * segments + (self.load_seconds(lang) if cold else 0.0)
+
+    def report(self) -> dict:
+        languages = {}
+        for lang in sorted(set(self.jobs) | set(self.loads), key=str):
+            base, per_segment, source = self.coefficients(lang)
+            languages[lang] = {
+                "jobs": len(self.jobs.get(lang, ())),
+                "base_seconds": round(base, 3),
+                "segment_seconds": round(per_segment, 3),
+                "load_seconds": round(self.load_seconds(lang), 3),
+                "source": source,
+            }
+        return languages
+
+
+# ----------------------------------------------------
+# Scheduler
+# ----------------------------------------------------
+class Ticket:
+    """One job's place in the schedule. Use as a context manager around the job."""
+
+    def __init__(self, scheduler, lang, segments, cold, estimate, client, deadline):
+        self.scheduler = scheduler
+        self.lang = lang
+        self.segments = segments
+        self.cold = cold
+        self.estimate = estimate
+        self.client = client
+        self.deadline = deadline
+        self.predicted_wait = 0.0
+        self.load_seconds = 0.0  # ASR model load that happened during this job
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = False
+        self.record = True  # set False for jobs whose timing says nothing about the pipeline
+        self.seq = 0
+        self._granted = threading.Event()
+        self._callbacks = []
+
+    def on_grant(self, callback):
+        """Call `callback()` once the job gets a slot (immediately if it has one)."""
+        with self.scheduler._lock:
+            if not self._granted.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout=None) -> bool:
+        return self._granted.wait(timeout)
+
+    async def wait_async(self):
+        """Wait for a slot without blocking the event loop (ASGI server)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def granted():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        self.on_grant(granted)
+        await future
+
+    def done(self, record=True):
+        """Release the slot (or leave the queue); with `record`, add the job's timing to the cost model."""
+        self.scheduler._finish(self, record)
+
+    def __enter__(self):
+        self.wait()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Failed, refused, cached or profiled jobs say little about how long a job takes
+        self.done(record=self.record and exc_type is None)
+
+    def summary(self) -> dict:
+        waited = (self.started or time.monotonic()) - self.submitted
+        return {
+            "estimated_seconds": round(self.estimate, 2),
+            "predicted_wait_seconds": round(self.predicted_wait, 2),
+            "waited_seconds": round(waited, 2),
+            "segments": self.segments,
+            "cold_model": self.cold,
+        }
+
+
+class JobScheduler:
+    """Grants SCHEDULER_SLOTS run slots to waiting jobs in policy order."""
+
+    def __init__(self, policy=SCHEDULER_POLICY, slots=SCHEDULER_SLOTS, cost_model=None,
+                 max_wait=SCHEDULER_MAX_WAIT, half_life=FAIR_SHARE_HALF_LIFE):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}'. Use one of {POLICIES}.")
+        self.policy = policy
+        self.slots = max(1, slots)
+        self.cost_model = cost_model if cost_model is not None else CostModel()
+        self.max_wait = max_wait
+        self.half_life = half_life
+        self._waiting = []
+        self._running = []
+        self._usage = {}  # client -> (served estimated seconds, as of monotonic time)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "rejected": 0, "completed": 0, "abandoned": 0}
+        self._errors = deque(maxlen=COST_WINDOW)  # actual - estimated seconds of finished jobs
+
+    # -- ordering ---------------------------------------------------------
+    def _client_usage(self, client, now):
+        served, at = self._usage.get(client, (0.0, now))
+        return served * 0.5 ** ((now - at) / self.half_life) if self.half_life else served
+
+    def _key(self, ticket, now):
+        if self.policy == "fifo":
+            return (0, ticket.seq)
+        starving = now - ticket.submitted > self.max_wait
+        if starving:
+            return (0, ticket.seq)
+        if self.policy == "fair":
+            return (1, self._client_usage(ticket.client, now), ticket.estimate, ticket.seq)
+        return (1, ticket.estimate, ticket.seq)
+
+    def _dispatch(self):
+        """Hand free slots to the best waiting jobs (lock held); returns their callbacks."""
+        callbacks = []
+        now = time.monotonic()
+        while self._waiting and len(self._running) < self.slots:
+            ticket = min(self._waiting, key=lambda t: self._key(t, now))
+            self._waiting.remove(ticket)
+            self._running.append(ticket)
+            ticket.started = now
+            served = self._client_usage(ticket.client, now)
+            self._usage[ticket.client] = (served + ticket.estimate, now)
+            ticket._granted.set()
+            callbacks += ticket._callbacks
+            ticket._callbacks = []
+        return callbacks
+
+    def _predict_wait(self, ticket, now):
+        """Simulate the slots: running jobs' remaining time, then the waiting jobs ordered ahead."""
+        free_at = sorted(max(0.0, t.estimate - (now - t.started)) for t in self._running)
+        free_at += [0.0] * (self.slots - len(free_at))
+        key = self._key(ticket, now)
+        for other in sorted((t for t in self._waiting if t is not ticket), key=lambda t: self._key(t, now)):
+            if self._key(other, now) > key:
+                break
+            free_at.sort()
+            free_at[0] += other.estimate
+        return min(free_at)
+
+    # -- jobs -------------------------------------------------------------
+    def _is_cold(self, lang):
+        """Cold if the ASR model is not loaded and no queued or running job will load it first."""
+        if get_memory_governor().is_loaded(f"asr:{lang}"):
+            return False
+        return not any(t.lang == lang for t in self._running + self._waiting)
+
+    def _ticket(self, file_path, lang, client, deadline):
+        segments = recording_segments(file_path)
+        with self._lock:
+            cold = self._is_cold(lang)
+        estimate = self.cost_model.estimate(lang, segments, cold)
+        deadline = deadline if deadline is not None else (SCHEDULER_DEADLINE or None)
+        return Ticket(self, lang, segments, cold, estimate, client or "-", deadline)
+
+    def estimate(self, file_path, lang, client=None, deadline=None) -> dict:
+        """Estimate and predicted wait for a job without queueing it."""
+        ticket = self._ticket(file_path, lang, client, deadline)
+        with self._lock:
+            ticket.seq = next(self._seq)
+            ticket.predicted_wait = self._predict_wait(ticket, time.monotonic())
+        return ticket.summary()
+
+    def submit(self, file_path, lang, client=None, deadline=None) -> Ticket:
+        """
+        Queue a job. Raises DeadlineExceeded (without queueing) when the predicted
+        wait plus the estimate exceeds the deadline.
+        """
+        ticket = self._ticket(file_path, lang, client, deadline)
+        with self._lock:
+            ticket.seq = next(self._seq)
+            ticket.predicted_wait = self._predict_wait(ticket, time.monotonic())
+            if ticket.deadline and ticket.predicted_wait + ticket.estimate > ticket.deadline:
+                self.counters["rejected"] += 1
+                summary = ticket.summary()
+                logger.warning(f"Job refused: estimated completion {ticket.predicted_wait + ticket.estimate:.1f}s "
+                               f"> deadline {ticket.deadline:.1f}s ({lang}, {ticket.segments} segments)")
+                raise DeadlineExceeded(
+                    f"Estimated completion in {ticket.predicted_wait + ticket.estimate:.0f}s "
+                    f"exceeds the {ticket.deadline:g}s deadline", summary)
+            self._waiting.append(ticket)
+            self.counters["submitted"] += 1
+            callbacks = self._dispatch()
+        for callback in callbacks:
+            callback()
+        return ticket
+
+    def _finish(self, ticket, record=True):
+        with self._lock:
+            if ticket.finished:
+                return
+            ticket.finished = True
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self.counters["abandoned"] += 1
+                return
+            self._running.remove(ticket)
+            seconds = time.monotonic() - ticket.started
+            self.counters["completed"] += 1
+            if record:
+                self._errors.append(seconds - ticket.estimate)
+            callbacks = self._dispatch()
+        for callback in callbacks:
+            callback()
+        if record:
+            self.cost_model.record_job(ticket.lang, ticket.segments, seconds, min(ticket.load_seconds, seconds))
+
+    def record_load(self, lang, seconds):
+        """Record an ASR model load and charge it to a running job of that language."""
+        with self._lock:
+            for ticket in self._running:
+                if ticket.lang == lang and not ticket.load_seconds:
+                    ticket.load_seconds = seconds
+                    break
+        self.cost_model.record_load(lang, seconds)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            queue = [
+                {"lang": t.lang, "segments": t.segments, "estimated_seconds": round(t.estimate, 2),
+                 "waited_seconds": round(now - t.submitted, 2), "client": t.client}
+                for t in sorted(self._waiting, key=lambda t: self._key(t, now))
+            ]
+            running = [
+                {"lang": t.lang, "segments": t.segments, "estimated_seconds": round(t.estimate, 2),
+                 "elapsed_seconds": round(now - t.started, 2), "client": t.client}
+                for t in self._running
+            ]
+            errors = list(self._errors)
+        return {
+            "policy": self.policy,
+            "slots": self.slots,
+            "running": running,
+            "queue": queue,
+            "counters": dict(self.counters),
+            "mean_abs_error_seconds": round(float(np.mean(np.abs(errors))), 2) if errors else None,
+            "cost_model": self.cost_model.report(),
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> JobScheduler:
+    """The process-wide scheduler, created (and its timings read) on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = JobScheduler()
+    return _scheduler
+
+
+def submit_job(file_path, lang, client=None, deadline=None) -> Ticket:
+    return get_scheduler().submit(file_path, lang, client, deadline)
+
+
+def estimate_job(file_path, lang, client=None, deadline=None) -> dict:
+    return get_scheduler().estimate(file_path, lang, client, deadline)
+
+
+def record_model_load(lang, seconds):
+    """Called by transcription.py after an ASR model load."""
+    get_scheduler().record_load(lang, seconds)
+
+
+def parse_deadline(value):
+    """Deadline header value in seconds, None when absent; raises ValueError when invalid."""
+    if value in (None, ""):
+        return None
+    deadline = float(value)
+    if deadline <= 0:
+        raise ValueError("Deadline must be a positive number of seconds")
+    return deadline
+
+
+def scheduler_stats() -> dict:
+    return get_scheduler().stats()
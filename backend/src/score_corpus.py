@@ -0,0 +1,234 @@
+"""
+score_corpus.py
+---------------
+Batch offline scoring for large recording corpora (`score-corpus`).
+
+Runs the full pipeline (segmentation, acoustic extraction, ASR, linguistic
+extraction, classification) for every recording in a directory or manifest,
+using a bounded pool of worker processes. Results are streamed to an
+append-only JSON Lines file, one line per recording, which doubles as the
+checkpoint: re-running the same command skips recordings already scored.
+
+Usage:
+  python -m backend.src.score_corpus recordings/ --lang en --output scores.jsonl --workers 4
+  python -m backend.src.score_corpus manifest.csv --output scores.jsonl
+
+A manifest is a CSV with a `path` column and optional `id` and `lang` columns.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from backend.src.resources import budget_for_workers, configure_process
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".aac", ".webm")
+
+
+# ----------------------------------------------------
+# Input Discovery
+# ----------------------------------------------------
+def discover_recordings(source: str, default_lang: str):
+    """
+    Returns a list of {"id", "path", "lang"} dicts from a directory tree or a CSV manifest.
+    Directory ids are paths relative to the directory, so they stay stable across runs.
+    """
+    recordings = []
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    recordings.append({
+                        "id": os.path.relpath(path, source),
+                        "path": path,
+                        "lang": default_lang,
+                    })
+        recordings.sort(key=lambda rec: rec["id"])
+    elif os.path.isfile(source):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                path = row.get("path", "").strip()
+                if not path:
+                    continue
+                if not os.path.isabs(path):
+                    path = os.path.join(base_dir, path)
+                recordings.append({
+                    "id": (row.get("id") or "").strip() or row["path"].strip(),
+                    "path": path,
+                    "lang": (row.get("lang") or "").strip() or default_lang,
+                })
+    else:
+        raise FileNotFoundError(f"Corpus source not found: {source}")
+    return recordings
+
+
+# ----------------------------------------------------
+# Checkpointing
+# ----------------------------------------------------
+def load_completed_ids(output_path: str, retry_failed: bool = False):
+    """
+    Read the append-only output and return the ids that should not be re-run.
+    A torn last line from an interrupted run is ignored.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok" or not retry_failed:
+                completed.add(record.get("id"))
+    return completed
+
+
+def _repair_trailing_line(output_path: str):
+    """Terminate a torn final line so new records start on their own line."""
+    if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            f.write(b"\n")
+
+
+# ----------------------------------------------------
+# Worker
+# ----------------------------------------------------
+def score_one(recording: dict, scratch_dir: str = None) -> dict:
+    """
+    Score a single recording in a private scratch directory.
+    Runs inside a worker process; never raises.
+    """
+    from backend.src.prediction_script import score_recording
+
+    start = time.perf_counter()
+    work_dir = tempfile.mkdtemp(prefix="segments_", dir=scratch_dir)
+    record = {"id": recording["id"], "path": recording["path"], "lang": recording["lang"]}
+    try:
+        result = score_recording(recording["path"], recording["lang"], work_dir=work_dir)
+        record.update(
+            status="ok",
+            label=result["label"],
+            probability=round(result["probability"], 6),
+            n_segments=result["n_segments"],
+            stage=result["stage"],
+            segment_probabilities=[round(p, 6) for p in result["segments"]["Probability"]],
+        )
+    except Exception as e:
+        logging.error(f"Scoring failed for {recording['path']}: {e}")
+        record.update(status="error", error=str(e))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+# ----------------------------------------------------
+# Runner
+# ----------------------------------------------------
+def score_corpus(recordings, output_path: str, workers: int = 2, max_pending: int = None,
+                 retry_failed: bool = False, scratch_dir: str = None):
+    """
+    Score recordings with at most `workers` processes and `max_pending` queued jobs,
+    appending one JSON line per finished recording. Returns (scored, skipped, failed).
+    """
+    completed = load_completed_ids(output_path, retry_failed=retry_failed)
+    # Group by language so each worker keeps reusing the ASR model it already loaded
+    todo = sorted((rec for rec in recordings if rec["id"] not in completed), key=lambda rec: rec["lang"])
+    skipped = len(recordings) - len(todo)
+    max_pending = max_pending or workers * 2
+
+    print(f"📚 {len(recordings)} recordings, {skipped} already scored, {len(todo)} to go.")
+    if not todo:
+        return 0, skipped, 0
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    _repair_trailing_line(output_path)
+
+    scored = failed = 0
+    started = time.perf_counter()
+    queue = iter(todo)
+    pending = set()
+
+    # Each worker gets an equal share of the thread budget so workers x threads fits the machine
+    worker_budget = budget_for_workers(workers)
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, initializer=configure_process,
+                                initargs=(worker_budget, 1)) as pool:
+
+        def refill():
+            while len(pending) < max_pending:
+                recording = next(queue, None)
+                if recording is None:
+                    return
+                pending.add(pool.submit(score_one, recording, scratch_dir))
+
+        refill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                scored += 1
+                failed += record["status"] != "ok"
+            refill()
+
+            elapsed = time.perf_counter() - started
+            print(f"  {scored}/{len(todo)} scored ({failed} failed), "
+                  f"{scored / elapsed:.2f} recordings/s", end="\r", flush=True)
+
+    print()
+    return scored, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="score-corpus",
+        description="Score a directory or manifest of recordings with the full pipeline.",
+    )
+    parser.add_argument("source", help="Directory of recordings or CSV manifest (path[,id][,lang]).")
+    parser.add_argument("--output", required=True, help="Append-only JSON Lines output / checkpoint.")
+    parser.add_argument("--lang", default="en", help="Language code for recordings without one.")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="Maximum queued recordings (default: 2x workers).")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Re-run recordings whose previous attempt failed.")
+    parser.add_argument("--scratch-dir", default=None, help="Where per-recording segments are written.")
+    args = parser.parse_args(argv)
+
+    recordings = discover_recordings(args.source, args.lang)
+    scored, skipped, failed = score_corpus(
+        recordings,
+        args.output,
+        workers=args.workers,
+        max_pending=args.max_pending,
+        retry_failed=args.retry_failed,
+        scratch_dir=args.scratch_dir,
+    )
+    print(f"✅ Scored {scored} recordings ({failed} failed, {skipped} skipped) → {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,15 +2,20 @@
 segmentation.py
 ----------------
 Splits an input audio file into 20-second segments (or pads shorter clips).
-Handles re-encoding using FFmpeg when format compatibility issues arise.
+Audio is decoded in-process by `audio_io`; FFmpeg is only used (through a pipe)
+for formats that cannot be read natively. Given a job id, the segments are also
+published to shared memory (see `shared_arrays.py`) so worker processes can
+read them without decoding the files again.
 """
 
 import os
+import math
 import shutil
-import logging
-import subprocess
-from pydub import AudioSegment
-from pydub.exceptions import CouldntDecodeError
+import numpy as np
+
+from backend.src.logging_setup import get_logger
+from backend.src.audio_io import decode_audio, write_wav, pcm16_roundtrip, AudioDecodeError
+from backend.src.shared_arrays import share_array
 
 
 # ----------------------------------------------------
@@ -26,26 +31,31 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "segmentation.log")
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
+SEGMENT_SECONDS = 20
+
+# Records are queued and written by the background writer (see logging_setup.py)
+logger = get_logger(__name__, LOG_FILE)
 
 
 # ----------------------------------------------------
 # Core Function
 # ----------------------------------------------------
-def process_single_audio_file(file_path: str, output_folder: str = PROCESSED_DIR):
+def segment_count(duration_seconds: float) -> int:
+    """Number of segments process_single_audio_file() produces for a recording of this length."""
+    return max(1, math.ceil(duration_seconds / SEGMENT_SECONDS))
+
+
+def process_single_audio_file(file_path: str, output_folder: str = PROCESSED_DIR, job_id: str = None):
     """
     Splits the given audio file into 20-second segments.
     Pads short files to reach 20 seconds.
-    Automatically handles re-encoding with FFmpeg if Pydub can't decode the file.
+    Decodes WAV/PCM natively and only falls back to an FFmpeg pipe for other formats.
+    Returns a list of {"path", "sample_rate", "audio"} per segment, where "audio" is a
+    SharedArray handle owned by job_id (None when no job id is given).
     """
     if not os.path.isfile(file_path):
-        logging.error(f"Invalid file path: {file_path}")
-        print("❌ Invalid file path or file does not exist.")
-        return
+        logger.error(f"Invalid file path: {file_path}")
+        return []
 
     # Clean output folder
     if os.path.exists(output_folder):
@@ -53,95 +63,78 @@ def process_single_audio_file(file_path: str, output_folder: str = PROCESSED_DIR
     os.makedirs(output_folder)
 
     try:
-        audio = AudioSegment.from_file(file_path)
-    except CouldntDecodeError as e:
-        logging.warning(f"Decode error for {file_path}: {e}")
-        print(f"⚠️ Error decoding {file_path}, attempting to re-encode...")
-        reencoded_path = reencode_audio(file_path)
-        if reencoded_path:
-            try:
-                audio = AudioSegment.from_file(reencoded_path)
-                logging.info(f"Successfully re-encoded {reencoded_path}")
-            except CouldntDecodeError as e2:
-                logging.error(f"Re-encoding failed for {file_path}: {e2}")
-                print("❌ Failed to re-encode audio.")
-                return
-        else:
-            return
-
-    duration_ms = len(audio)
-    twenty_sec_ms = 20 * 1000
-
-    if duration_ms < twenty_sec_ms:
-        process_short_audio(audio, os.path.basename(file_path), duration_ms, twenty_sec_ms, output_folder)
+        audio, sample_rate = decode_audio(file_path)
+    except AudioDecodeError as e:
+        logger.error(f"Decode error for {file_path}: {e}")
+        return []
+
+    if len(audio) == 0:
+        logger.error(f"Decoded audio is empty: {file_path}")
+        return []
+
+    segment_len = SEGMENT_SECONDS * sample_rate
+
+    if len(audio) < segment_len:
+        written = process_short_audio(audio, sample_rate, os.path.basename(file_path), segment_len, output_folder)
     else:
-        process_long_audio(audio, os.path.basename(file_path), duration_ms, twenty_sec_ms, output_folder)
+        written = process_long_audio(audio, sample_rate, os.path.basename(file_path), segment_len, output_folder)
+
+    logger.info(f"Audio segmentation completed for {file_path}")
 
-    print(f"✅ Processed audio files are saved in: {output_folder}")
-    logging.info(f"Audio segmentation completed for {file_path}")
+    segments = []
+    for output_path, samples in written:
+        # Share exactly what a worker would get by decoding the written 16-bit WAV
+        handle = share_array(pcm16_roundtrip(samples), job_id) if job_id else None
+        segments.append({"path": output_path, "sample_rate": sample_rate, "audio": handle})
+    return segments
 
 
 # ----------------------------------------------------
-# Helper: Re-encode with FFmpeg
+# Helper: Loop-pad to a fixed length
 # ----------------------------------------------------
-def reencode_audio(file_path: str):
-    """Re-encode audio to WAV (PCM 16-bit, 16kHz) for universal compatibility."""
-    base, _ = os.path.splitext(file_path)
-    reencoded_path = f"{base}_reencoded.wav"
-    command = [
-        "ffmpeg", "-y",
-        "-i", file_path,
-        "-acodec", "pcm_s16le",
-        "-ar", "16000",
-        reencoded_path
-    ]
-
-    try:
-        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        return reencoded_path
-    except subprocess.CalledProcessError as e:
-        logging.error(f"FFmpeg re-encoding failed: {e.stderr.decode(errors='ignore')}")
-        print("❌ FFmpeg re-encoding failed.")
-        return None
+def loop_pad(audio: np.ndarray, target_len: int) -> np.ndarray:
+    """Repeats the clip until it reaches target_len samples."""
+    repeats = (target_len // len(audio)) + 1
+    return np.tile(audio, repeats)[:target_len]
 
 
 # ----------------------------------------------------
 # Helper: Handle Short Audio
 # ----------------------------------------------------
-def process_short_audio(audio, filename, duration_ms, target_ms, output_folder):
-    """Pads short audio by looping it until it reaches 20 seconds."""
-    repeats = (target_ms // duration_ms) + 1
-    new_audio = (audio * repeats)[:target_ms]
+def process_short_audio(audio, sample_rate, filename, target_len, output_folder):
+    """Pads short audio by looping it until it reaches 20 seconds. Returns [(path, samples)]."""
+    new_audio = loop_pad(audio, target_len)
     output_filename = os.path.splitext(filename)[0] + ".wav"
     output_path = os.path.join(output_folder, output_filename)
-    new_audio.export(output_path, format="wav")
-    logging.info(f"Padded short audio: {filename} → {output_filename}")
-    print(f"🟢 Processed short audio: {filename} → {output_filename}")
+    write_wav(output_path, new_audio, sample_rate)
+    logger.info(f"Padded short audio: {filename} → {output_filename}")
+    return [(output_path, new_audio)]
 
 
 # ----------------------------------------------------
 # Helper: Handle Long Audio
 # ----------------------------------------------------
-def process_long_audio(audio, filename, duration_ms, segment_ms, output_folder):
-    """Splits long audio into 20-second segments, padding the last one if needed."""
-    num_segments = duration_ms // segment_ms
+def process_long_audio(audio, sample_rate, filename, segment_len, output_folder):
+    """Splits long audio into 20-second segments, padding the last one if needed. Returns [(path, samples)]."""
+    num_segments = len(audio) // segment_len
+    written = []
 
     for i in range(int(num_segments)):
-        start_ms = i * segment_ms
-        end_ms = start_ms + segment_ms
-        segment = audio[start_ms:end_ms]
+        start = i * segment_len
+        segment = audio[start:start + segment_len]
         output_filename = f"{os.path.splitext(filename)[0]}_segment{i+1}.wav"
         output_path = os.path.join(output_folder, output_filename)
-        segment.export(output_path, format="wav")
-        logging.info(f"Segment {i+1} exported: {output_filename}")
-
-    remainder_ms = duration_ms % segment_ms
-    if remainder_ms > 0:
-        last_segment = audio[-remainder_ms:]
-        repeats = (segment_ms // remainder_ms) + 1
-        last_segment = (last_segment * repeats)[:segment_ms]
+        write_wav(output_path, segment, sample_rate)
+        written.append((output_path, segment))
+        logger.info(f"Segment {i+1} exported: {output_filename}")
+
+    remainder = len(audio) % segment_len
+    if remainder > 0:
+        last_segment = loop_pad(audio[-remainder:], segment_len)
         output_filename = f"{os.path.splitext(filename)[0]}_segment{int(num_segments)+1}.wav"
         output_path = os.path.join(output_folder, output_filename)
-        last_segment.export(output_path, format="wav")
-        logging.info(f"Last segment padded: {output_filename}")
-        print(f"🟢 Processed final padded segment: {output_filename}")
+        write_wav(output_path, last_segment, sample_rate)
+        written.append((output_path, last_segment))
+        logger.info(f"Last segment padded: {output_filename}")
+
+    return written
@@ -0,0 +1,135 @@
+"""
+shared_arrays.py
+----------------
+Zero-copy transport of NumPy arrays between worker processes.
+
+Arrays (decoded segments, feature matrices) are placed once in a
+`multiprocessing.shared_memory` block and passed around as small picklable
+`SharedArray` handles (block name, shape, dtype). A worker attaches to the
+block and reads or writes it in place, so nothing is pickled or copied per
+hand-off.
+
+Every block belongs to a job. `job_scope(job_id)` releases (closes and
+unlinks) all of the job's blocks when the job finishes, fails or is
+cancelled; anything still registered at interpreter exit is released too.
+"""
+
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArray(NamedTuple):
+    """Picklable handle to an array stored in a shared memory block."""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+# ----------------------------------------------------
+# Registry (owning process)
+# ----------------------------------------------------
+_job_blocks = {}  # job_id -> {block name: SharedMemory}
+_registry_lock = threading.Lock()
+
+
+def create_array(shape, dtype, job_id: str, fill=None):
+    """
+    Allocate a shared array owned by `job_id`.
+    Returns (ndarray view, SharedArray handle).
+    """
+    dtype = np.dtype(dtype)
+    shape = tuple(int(n) for n in shape)
+    nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    with _registry_lock:
+        _job_blocks.setdefault(job_id, {})[shm.name] = shm
+
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    if fill is not None:
+        array.fill(fill)
+    return array, SharedArray(shm.name, shape, dtype.str)
+
+
+def share_array(array: np.ndarray, job_id: str) -> SharedArray:
+    """Copy an array into shared memory once and return its handle."""
+    view, handle = create_array(array.shape, array.dtype, job_id)
+    view[...] = array
+    return handle
+
+
+def release_job(job_id: str):
+    """Close and unlink every block of a job. Safe to call more than once."""
+    with _registry_lock:
+        blocks = _job_blocks.pop(job_id, {})
+    for name, shm in blocks.items():
+        try:
+            shm.close()
+        except BufferError:
+            # Views are still alive in this process; the mapping goes away with them
+            pass
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+    if blocks:
+        logging.info(f"Released {len(blocks)} shared memory blocks for job {job_id}")
+
+
+@contextmanager
+def job_scope(job_id: str):
+    """Release the job's shared blocks when the block exits, whatever the outcome."""
+    try:
+        yield job_id
+    finally:
+        release_job(job_id)
+
+
+def active_blocks() -> dict:
+    """Per-job count and size of shared blocks still held by this process."""
+    with _registry_lock:
+        return {
+            job_id: {"blocks": len(blocks), "bytes": sum(shm.size for shm in blocks.values())}
+            for job_id, blocks in _job_blocks.items()
+        }
+
+
+@atexit.register
+def _release_all():
+    for job_id in list(_job_blocks):
+        release_job(job_id)
+
+
+# ----------------------------------------------------
+# Attaching (any process)
+# ----------------------------------------------------
+def _attach(name: str):
+    try:
+        # Python 3.13+: attaching processes must not unlink the block on exit
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+@contextmanager
+def attached(handle: SharedArray):
+    """
+    Map a shared array for the duration of the block, without copying.
+    Do not keep references to the yielded array after the block exits.
+    """
+    shm = _attach(handle.name)
+    array = np.ndarray(handle.shape, dtype=np.dtype(handle.dtype), buffer=shm.buf)
+    try:
+        yield array
+    finally:
+        del array
+        try:
+            shm.close()
+        except BufferError:
+            # The caller still holds a view; the mapping is closed when it is collected
+            pass
@@ -0,0 +1,262 @@
+"""
+short_term_features.py
+----------------------
+Vectorized NumPy implementation of pyAudioAnalysis short-term features.
+
+`ShortTermFeatures.feature_extraction` walks the signal one window at a time
+in Python. This module frames the whole signal with a strided view and
+computes the same 34 features (plus their 34 deltas) over the frame matrix
+at once: zero-crossing rate, energy, energy entropy, spectral centroid and
+spread, spectral entropy, flux and roll-off, 13 MFCCs and 12 chroma bins
+plus their std. Names, ordering and numerics follow pyAudioAnalysis 0.3.x,
+including its quirks (rectangular window, magnitude spectrum divided by its
+length, first-frame flux and delta of zero), so `pyaudio_*` columns stay
+compatible with trained models.
+
+Benchmark against the original:
+  python -m backend.src.short_term_features path/to/segment.wav --repeat 5
+"""
+
+import sys
+import time
+import argparse
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.fft import dct
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+EPS = sys.float_info.epsilon
+N_MFCC = 13
+N_CHROMA = 13  # 12 chroma bins + chroma_std
+N_SUB_BLOCKS = 10
+ROLLOFF = 0.90
+
+FEATURE_NAMES = (
+    ["zcr", "energy", "energy_entropy", "spectral_centroid", "spectral_spread",
+     "spectral_entropy", "spectral_flux", "spectral_rolloff"]
+    + [f"mfcc_{i}" for i in range(1, N_MFCC + 1)]
+    + [f"chroma_{i}" for i in range(1, N_CHROMA)]
+    + ["chroma_std"]
+)
+
+# Filter bank / chroma matrices depend only on (sampling rate, num_fft)
+_fbank_cache = {}
+_chroma_cache = {}
+
+
+# ----------------------------------------------------
+# Precomputed Matrices
+# ----------------------------------------------------
+def mfcc_filter_bank(sampling_rate, num_fft, lowfreq=133.33, linc=200 / 3,
+                     logsc=1.0711703, num_lin_filt=13, num_log_filt=27):
+    """Triangular MFCC filter bank (num_filters x num_fft), as in pyAudioAnalysis."""
+    key = (sampling_rate, num_fft)
+    if key in _fbank_cache:
+        return _fbank_cache[key]
+
+    num_filt_total = num_lin_filt + num_log_filt
+    frequencies = np.zeros(num_filt_total + 2)
+    frequencies[:num_lin_filt] = lowfreq + np.arange(num_lin_filt) * linc
+    frequencies[num_lin_filt:] = frequencies[num_lin_filt - 1] * logsc ** np.arange(1, num_log_filt + 3)
+    heights = 2. / (frequencies[2:] - frequencies[0:-2])
+
+    fbank = np.zeros((num_filt_total, num_fft))
+    nfreqs = np.arange(num_fft) / (1. * num_fft) * sampling_rate
+    for i in range(num_filt_total):
+        low, cent, high = frequencies[i], frequencies[i + 1], frequencies[i + 2]
+        lid = np.arange(np.floor(low * num_fft / sampling_rate) + 1,
+                        np.floor(cent * num_fft / sampling_rate) + 1, dtype=int)
+        rid = np.arange(np.floor(cent * num_fft / sampling_rate) + 1,
+                        np.floor(high * num_fft / sampling_rate) + 1, dtype=int)
+        fbank[i][lid] = heights[i] / (cent - low) * (nfreqs[lid] - low)
+        fbank[i][rid] = heights[i] / (high - cent) * (high - nfreqs[rid])
+
+    _fbank_cache[key] = fbank
+    return fbank
+
+
+def chroma_matrix(sampling_rate, num_fft):
+    """
+    (num_fft x 12) matrix M such that (|X|^2 @ M) / sum(|X|^2) reproduces
+    pyAudioAnalysis' chroma_features, including its index-assignment semantics
+    (negative chroma indices wrap, repeated indices keep the last frequency bin,
+    and the per-position normalization).
+    """
+    key = (sampling_rate, num_fft)
+    if key in _chroma_cache:
+        return _chroma_cache[key]
+
+    freqs = (np.arange(num_fft) + 1) * sampling_rate / (2 * num_fft)
+    num_chroma = np.round(12.0 * np.log2(freqs / 27.50)).astype(int)
+    if num_chroma.max() >= num_fft:
+        raise ValueError("Window too large for pyAudioAnalysis-compatible chroma features.")
+
+    num_freqs_per_chroma = np.zeros(num_fft)
+    for u in np.unique(num_chroma):
+        idx = np.nonzero(num_chroma == u)[0]
+        num_freqs_per_chroma[idx] = idx.shape[0]
+
+    # C[num_chroma] = spec: position t receives the last bin j with num_chroma[j] == t
+    positions = num_chroma % num_fft
+    source = {}
+    for j, t in enumerate(positions):
+        source[t] = j
+    divisor = num_freqs_per_chroma[num_chroma]
+
+    matrix = np.zeros((num_fft, 12))
+    for t, j in source.items():
+        matrix[j, t % 12] += 1.0 / divisor[t]
+
+    _chroma_cache[key] = matrix
+    return matrix
+
+
+# ----------------------------------------------------
+# Feature Extraction
+# ----------------------------------------------------
+def frame_signal(signal, window, step):
+    """Read-only (num_frames x window) strided view of the signal."""
+    if len(signal) < window:
+        return np.empty((0, window), dtype=signal.dtype)
+    return sliding_window_view(signal, window)[::step]
+
+
+def _block_entropy(frames, total_energy):
+    """Entropy of the normalized energies of N_SUB_BLOCKS consecutive sub-blocks per row."""
+    sub_len = frames.shape[1] // N_SUB_BLOCKS
+    blocks = frames[:, :sub_len * N_SUB_BLOCKS].reshape(len(frames), N_SUB_BLOCKS, sub_len)
+    s = np.sum(blocks ** 2, axis=2) / (total_energy[:, None] + EPS)
+    return -np.sum(s * np.log2(s + EPS), axis=1)
+
+
+def feature_extraction(signal, sampling_rate, window, step, deltas=True):
+    """
+    Drop-in replacement for pyAudioAnalysis.ShortTermFeatures.feature_extraction.
+    Like the original, `signal` is expected in int16 scale (as returned by
+    audioBasicIO); the /2**15 scaling is kept so the peak normalization matches.
+    Returns (features [n_feats x n_frames], feature_names).
+    """
+    window, step = int(window), int(step)
+    signal = np.asarray(signal, dtype=np.float64) / (2.0 ** 15)
+    signal = signal - signal.mean()
+    signal = signal / (np.abs(signal).max() + 1e-10)
+
+    num_fft = window // 2
+    frames = frame_signal(signal, window, step)
+    n = len(frames)
+    feats = np.zeros((n, len(FEATURE_NAMES)))
+
+    if n:
+        # Time domain
+        feats[:, 0] = np.sum(np.abs(np.diff(np.sign(frames), axis=1)), axis=1) / 2 / (window - 1.0)
+        frame_energy = np.sum(frames ** 2, axis=1)
+        feats[:, 1] = frame_energy / window
+        feats[:, 2] = _block_entropy(frames, frame_energy)
+
+        # Magnitude spectrum (rectangular window, first num_fft bins, divided by num_fft)
+        mag = np.abs(np.fft.rfft(frames, axis=1))[:, :num_fft] / num_fft
+
+        # Centroid / spread on the max-normalized spectrum
+        ind = np.arange(1, num_fft + 1) * (sampling_rate / (2.0 * num_fft))
+        mag_max = mag.max(axis=1, keepdims=True)
+        xt = mag / np.where(mag_max == 0, EPS, mag_max)
+        den = np.sum(xt, axis=1) + EPS
+        centroid = np.sum(ind * xt, axis=1) / den
+        spread = np.sqrt(np.sum((ind - centroid[:, None]) ** 2 * xt, axis=1) / den)
+        feats[:, 3] = centroid / (sampling_rate / 2.0)
+        feats[:, 4] = spread / (sampling_rate / 2.0)
+
+        power = mag ** 2
+        spectral_energy = np.sum(power, axis=1)
+        feats[:, 5] = _block_entropy(mag, spectral_energy)
+
+        # Flux against the previous frame (the first frame is compared with itself)
+        previous = np.vstack([mag[:1], mag[:-1]])
+        feats[:, 6] = np.sum(
+            (mag / np.sum(mag + EPS, axis=1, keepdims=True)
+             - previous / np.sum(previous + EPS, axis=1, keepdims=True)) ** 2,
+            axis=1,
+        )
+
+        # Roll-off: first bin whose cumulative energy exceeds ROLLOFF of the total
+        above = (np.cumsum(power, axis=1) + EPS) > (ROLLOFF * spectral_energy)[:, None]
+        feats[:, 7] = np.where(above.any(axis=1), np.argmax(above, axis=1) / float(num_fft), 0.0)
+
+        # MFCCs
+        mspec = np.log10(mag @ mfcc_filter_bank(sampling_rate, num_fft).T + EPS)
+        mfcc_end = 8 + N_MFCC
+        feats[:, 8:mfcc_end] = dct(mspec, type=2, norm="ortho", axis=1)[:, :N_MFCC]
+
+        # Chroma
+        chroma = power @ chroma_matrix(sampling_rate, num_fft)
+        chroma /= np.where(spectral_energy == 0, EPS, spectral_energy)[:, None]
+        feats[:, mfcc_end:mfcc_end + 12] = chroma
+        feats[:, mfcc_end + 12] = chroma.std(axis=1)
+
+    names = list(FEATURE_NAMES)
+    if deltas:
+        delta = np.zeros_like(feats)
+        delta[1:] = np.diff(feats, axis=0)
+        feats = np.hstack([feats, delta])
+        names += ["delta " + name for name in FEATURE_NAMES]
+
+    return feats.T, names
+
+
+# ----------------------------------------------------
+# Benchmark
+# ----------------------------------------------------
+def compare_with_reference(signal, sampling_rate, window, step, repeat=3):
+    """
+    Time this implementation against pyAudioAnalysis on the same signal and
+    return {"seconds", "reference_seconds", "speedup", "max_abs_diff", "max_rel_diff"}.
+    """
+    from pyAudioAnalysis import ShortTermFeatures
+
+    def best_of(fn):
+        best, out = float("inf"), None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            out = fn()
+            best = min(best, time.perf_counter() - start)
+        return best, out
+
+    seconds, (ours, names) = best_of(lambda: feature_extraction(signal, sampling_rate, window, step))
+    ref_seconds, (ref, ref_names) = best_of(
+        lambda: ShortTermFeatures.feature_extraction(signal, sampling_rate, window, step)
+    )
+    if list(names) != list(ref_names) or ours.shape != ref.shape:
+        raise AssertionError(f"Shape/name mismatch: {ours.shape} vs {ref.shape}")
+
+    abs_diff = np.abs(ours - ref)
+    return {
+        "seconds": seconds,
+        "reference_seconds": ref_seconds,
+        "speedup": ref_seconds / seconds if seconds else float("inf"),
+        "max_abs_diff": float(abs_diff.max()) if abs_diff.size else 0.0,
+        "max_rel_diff": float((abs_diff / (np.abs(ref) + 1e-9)).max()) if abs_diff.size else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark vectorized short-term features vs pyAudioAnalysis.")
+    parser.add_argument("audio_files", nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    from backend.src.audio_io import decode_audio
+
+    for path in args.audio_files:
+        signal, sr = decode_audio(path)
+        signal = signal * (2.0 ** 15)
+        result = compare_with_reference(signal, sr, 0.050 * sr, 0.025 * sr, repeat=args.repeat)
+        print(f"{path}: {result['seconds'] * 1000:.1f} ms vs {result['reference_seconds'] * 1000:.1f} ms "
+              f"({result['speedup']:.1f}x), max abs diff {result['max_abs_diff']:.2e}, "
+              f"max rel diff {result['max_rel_diff']:.2e}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
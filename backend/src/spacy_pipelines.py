@@ -0,0 +1,280 @@
+"""
+spacy_pipelines.py
+------------------
+Bounded cache of spaCy pipelines for linguistic feature extraction.
+
+Pipelines are cached per spaCy model (languages without their own model
+share the multilingual fallback), least recently used first out, within
+SPACY_MAX_PIPELINES models and SPACY_MAX_MB of resident memory.
+
+Each model is loaded without the components the LFTK features in use never
+read. Text classification is always excluded. The named-entity components
+fill doc.ents, which LFTK's "entity" and "avgentity" feature families count,
+so they are excluded only when no feature of those families is in use (see
+linguistic_extraction.get_feature_families). With every LFTK feature in use,
+as in training, they are loaded. SPACY_EXCLUDE replaces this choice with an
+explicit list; excluding a component a feature reads turns that feature
+into a constant the classifier was not trained on.
+
+The dependency parser is kept by default, as it was when the training
+features were extracted. SPACY_SENTER=1 replaces the parser, the slowest
+component, with the model's statistical sentence segmenter ("senter") where
+it ships one; its boundaries can differ slightly from the parser's, so only
+enable it for models trained that way.
+
+For every model the manager records load time, resident size (growth of
+process RSS during the load) and parse throughput; `pipeline_stats()` is
+reported under `spacy` in /admin/resources. Languages in SPACY_PRELOAD are
+loaded by warm-up (see warmup.py) so their first request does not pay for
+the load. Loaded models are also registered with the memory governor
+(memory_governor.py), which unloads them when idle or under memory pressure.
+
+Configuration (environment):
+  SPACY_MAX_PIPELINES  models kept loaded (default 4)
+  SPACY_MAX_MB         resident size budget for loaded models (default 0 = unbounded)
+  SPACY_EXCLUDE        components never loaded (default: derived from the LFTK feature families in use)
+  SPACY_SENTER         1 replaces the parser with "senter" where available (default 0)
+  SPACY_PRELOAD        languages loaded at warm-up, e.g. "en,de"
+"""
+
+import os
+import gc
+import time
+import threading
+from collections import OrderedDict
+
+from backend.src.logging_setup import get_logger
+from backend.src.lazy_imports import lazy_module
+from backend.src.memory_governor import register_component, unregister_component, touch_component
+
+spacy = lazy_module("spacy")
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "linguistic_extraction.log")
+
+SPACY_MAX_PIPELINES = int(os.environ.get("SPACY_MAX_PIPELINES", 4))
+SPACY_MAX_MB = float(os.environ.get("SPACY_MAX_MB", 0))
+SPACY_EXCLUDE = os.environ.get("SPACY_EXCLUDE")
+SPACY_EXCLUDE = [c for c in SPACY_EXCLUDE.split(",") if c] if SPACY_EXCLUDE is not None else None
+SPACY_SENTER = os.environ.get("SPACY_SENTER", "0") == "1"
+SPACY_PRELOAD = [lang for lang in os.environ.get("SPACY_PRELOAD", "").split(",") if lang]
+
+# ----------------------------------------------------
+# Language to SpaCy Model Mapping
+# ----------------------------------------------------
+SPACY_PIPELINES = {
+    "de": "de_core_news_sm", "en": "en_core_web_sm", "es": "es_core_news_sm",
+    "fr": "fr_core_news_sm", "it": "it_core_news_sm", "nl": "nl_core_news_sm",
+    "pl": "pl_core_news_sm", "pt": "pt_core_news_sm", "ru": "ru_core_news_sm",
+    "zh": "zh_core_web_sm", "ja": "ja_core_news_sm", "ko": "ko_core_news_sm",
+    # fallback multilingual pipeline for unsupported languages
+    "default": "xx_sent_ud_sm"
+}
+
+# Components no LFTK feature reads
+UNUSED_COMPONENTS = ["textcat", "textcat_multilabel"]
+# Components that fill doc.ents, and the LFTK feature families that read it
+ENTITY_COMPONENTS = ["ner", "entity_ruler", "entity_linker"]
+ENTITY_FAMILIES = ("entity", "avgentity")
+
+# Records are queued and written by the background writer (see logging_setup.py)
+logger = get_logger(__name__, LOG_FILE)
+
+
+def model_for(lang_code: str) -> str:
+    return SPACY_PIPELINES.get(lang_code, SPACY_PIPELINES["default"])
+
+
+def components_to_exclude(feature_families) -> list:
+    """spaCy components that none of the given LFTK feature families read."""
+    exclude = list(UNUSED_COMPONENTS)
+    if not set(feature_families) & set(ENTITY_FAMILIES):
+        exclude += ENTITY_COMPONENTS
+    return exclude
+
+
+def _rss_mb():
+    """Resident set size of this process in MB (Linux), or None."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ----------------------------------------------------
+# Pipeline Manager
+# ----------------------------------------------------
+class PipelineManager:
+    """LRU of loaded spaCy models with per-model load and parse statistics."""
+
+    def __init__(self, max_pipelines=SPACY_MAX_PIPELINES, max_mb=SPACY_MAX_MB,
+                 exclude=SPACY_EXCLUDE, use_senter=SPACY_SENTER):
+        self.max_pipelines = max(1, max_pipelines)
+        self.max_mb = max_mb
+        self.exclude = list(exclude) if exclude is not None else None  # None: derived on first load
+        self.use_senter = use_senter
+        self._pipelines = OrderedDict()  # model name -> nlp, least recently used first
+        self._stats = {}  # model name -> counters, kept across evictions
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, lang_code: str):
+        """The pipeline for a language, loading it (and evicting others) if needed."""
+        model_name = model_for(lang_code)
+        with self._lock:
+            nlp = self._pipelines.get(model_name)
+            if nlp is not None:
+                self._pipelines.move_to_end(model_name)
+                self._stats[model_name]["last_used"] = time.time()
+        if nlp is not None:
+            touch_component(f"spacy:{model_name}")
+            return nlp
+
+        # One load at a time, so the RSS growth is attributed to the right model
+        with self._load_lock:
+            with self._lock:
+                nlp = self._pipelines.get(model_name)
+            if nlp is None:
+                nlp = self._load(model_name, lang_code)
+            return nlp
+
+    def _load(self, model_name, lang_code):
+        before = _rss_mb()
+        start = time.perf_counter()
+        try:
+            nlp = self._load_pruned(model_name)
+        except Exception as e:
+            logger.error(f"Error loading SpaCy model for {lang_code}: {e}")
+            raise RuntimeError(f"Failed to load SpaCy model for {lang_code}: {e}")
+        seconds = time.perf_counter() - start
+        after = _rss_mb()
+        size_mb = max(0.0, after - before) if before is not None and after is not None else None
+
+        with self._lock:
+            stats = self._stats.setdefault(model_name, {"loads": 0, "docs": 0, "chars": 0, "parse_seconds": 0.0})
+            stats.update(load_seconds=round(seconds, 3), rss_mb=size_mb, components=list(nlp.pipe_names),
+                         last_used=time.time())
+            stats["loads"] += 1
+            self._pipelines[model_name] = nlp
+            evicted = self._evict()
+        for name in evicted:
+            unregister_component(f"spacy:{name}")
+        if evicted:
+            gc.collect()
+        # The memory governor unloads it once idle (MODEL_IDLE_TTL) or under memory pressure
+        register_component(f"spacy:{model_name}", lambda: self.unload_model(model_name),
+                           lambda: self._stats[model_name].get("rss_mb"))
+        logger.info(f"Loaded SpaCy model: {model_name} for language {lang_code} in {seconds:.2f}s "
+                    f"({', '.join(nlp.pipe_names)}; {size_mb or 0:.0f} MB)")
+        return nlp
+
+    def _excluded(self) -> list:
+        if self.exclude is None:
+            from backend.src.linguistic_extraction import get_feature_families
+            self.exclude = components_to_exclude(get_feature_families())
+            logger.info(f"SpaCy components excluded for the LFTK features in use: {', '.join(self.exclude)}")
+        return self.exclude
+
+    def _load_pruned(self, model_name):
+        """Load without excluded components; swap the parser for senter when the model has one."""
+        exclude = self._excluded()
+        if self.use_senter:
+            nlp = spacy.load(model_name, exclude=exclude + ["parser"])
+            if "senter" in nlp.disabled:
+                nlp.enable_pipe("senter")
+            if nlp.has_pipe("senter") or nlp.has_pipe("sentencizer"):
+                return nlp
+            # No sentence segmenter without the parser: load it with the parser after all
+            del nlp
+        return spacy.load(model_name, exclude=exclude)
+
+    def _evict(self):
+        """Drop least recently used models beyond the count / memory budget (lock held)."""
+        evicted = []
+        while len(self._pipelines) > 1 and (
+            len(self._pipelines) > self.max_pipelines
+            or (self.max_mb and self.resident_mb() > self.max_mb)
+        ):
+            model_name, _ = self._pipelines.popitem(last=False)
+            evicted.append(model_name)
+            self.evictions += 1
+        for model_name in evicted:
+            logger.info(f"Evicted SpaCy model {model_name}")
+        return evicted
+
+    def resident_mb(self) -> float:
+        return sum(self._stats[name].get("rss_mb") or 0.0 for name in self._pipelines)
+
+    def parse(self, lang_code: str, text: str):
+        """Run the language's pipeline on text, recording throughput."""
+        nlp = self.get(lang_code)
+        start = time.perf_counter()
+        doc = nlp(text)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            stats = self._stats[model_for(lang_code)]
+            stats["docs"] += 1
+            stats["chars"] += len(text)
+            stats["parse_seconds"] += seconds
+        return doc
+
+    def unload(self, lang_code: str = None) -> list:
+        """Unload one language's model (or all); returns the unloaded model names."""
+        with self._lock:
+            names = [model_for(lang_code)] if lang_code else list(self._pipelines)
+        return [name for name in names if self.unload_model(name)]
+
+    def unload_model(self, model_name: str) -> bool:
+        with self._lock:
+            unloaded = self._pipelines.pop(model_name, None) is not None
+        if unloaded:
+            unregister_component(f"spacy:{model_name}")
+            gc.collect()
+        return unloaded
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {}
+            now = time.time()
+            for name, stats in self._stats.items():
+                entry = dict(stats, loaded=name in self._pipelines)
+                entry["idle_seconds"] = round(now - entry.pop("last_used"), 1)
+                entry["chars_per_second"] = (
+                    round(stats["chars"] / stats["parse_seconds"]) if stats["parse_seconds"] else None
+                )
+                entry["parse_seconds"] = round(stats["parse_seconds"], 3)
+                entry["languages"] = sorted(lang for lang, model in SPACY_PIPELINES.items() if model == name)
+                models[name] = entry
+            return {
+                "loaded": list(self._pipelines),
+                "resident_mb": round(self.resident_mb(), 1),
+                "max_pipelines": self.max_pipelines,
+                "max_mb": self.max_mb,
+                "evictions": self.evictions,
+                "models": models,
+            }
+
+
+_manager = PipelineManager()
+
+
+def get_pipeline_manager() -> PipelineManager:
+    return _manager
+
+
+def preload(languages=None):
+    """Load the pipelines for `languages` (default SPACY_PRELOAD) ahead of the first request."""
+    for lang in languages if languages is not None else SPACY_PRELOAD:
+        _manager.get(lang)
+
+
+def pipeline_stats() -> dict:
+    return _manager.stats()
@@ -3,17 +3,40 @@ transcription.py
 ----------------
 Handles automatic speech recognition (ASR) for multilingual audio input.
 Uses Hugging Face Wav2Vec2 models for transcription.
+torch, transformers and librosa are imported lazily on first use.
+
+Each language can have several checkpoint tiers (e.g. the default "large"
+models and smaller "base" or distilled ones). A tier is either a Hub name
+from ASR_CHECKPOINTS or a local directory ASR_MODEL_DIR/<lang>/<tier>, which
+takes precedence. The serving tier is chosen with ASR_TIER (all languages)
+and ASR_TIERS (per language, e.g. "en=base,de=large");
+`training/asr_tier_evaluation.py` compares tiers on a local test set.
+
+Audio longer than ASR_CHUNK_SECONDS is transcribed in overlapping windows
+(`transcribe_chunked`), so peak memory does not grow with recording length.
+Check that stitched and single-pass transcripts agree with:
+  python -m backend.src.transcription --verify-chunking en path/to/short.wav
 """
 
 import os
-import torch
-import librosa
+import sys
+import time
+import argparse
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from transformers import Wav2Vec2ForCTC, Wav2Vec2Tokenizer
-import logging
 import warnings
 
+from backend.src.logging_setup import get_logger
+from backend.src.lazy_imports import lazy_module
+from backend.src.resources import apply_torch_threads
+from backend.src.memory_governor import register_component, unregister_component, touch_component, object_mb
+from backend.src.scheduler import record_model_load
+
+torch = lazy_module("torch")
+librosa = lazy_module("librosa")
+transformers = lazy_module("transformers")
+
 warnings.filterwarnings("ignore")
 
 
@@ -27,25 +50,80 @@ os.makedirs(LOG_DIR, exist_ok=True)
 
 LOG_FILE = os.path.join(LOG_DIR, "transcription.log")
 
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-)
+# Records are queued and written by the background writer (see logging_setup.py)
+logger = get_logger(__name__, LOG_FILE)
+
+
+# Sliding-window inference: windows of ASR_CHUNK_SECONDS overlap by
+# ASR_STRIDE_SECONDS of context on each side (0 disables chunking)
+ASR_SAMPLE_RATE = 16000
+ASR_CHUNK_SECONDS = float(os.environ.get("ASR_CHUNK_SECONDS", 30))
+ASR_STRIDE_SECONDS = float(os.environ.get("ASR_STRIDE_SECONDS", 5))
 
 
 # ----------------------------------------------------
-# Supported Languages
+# Supported Languages and Checkpoint Tiers
 # ----------------------------------------------------
-language_models = {
-    "en": {"model_name": "facebook/wav2vec2-large-960h"},
-    "de": {"model_name": "jonatasgrosman/wav2vec2-large-xlsr-53-german"},
-    "es": {"model_name": "jonatasgrosman/wav2vec2-large-xlsr-53-spanish"},
-    "zh": {"model_name": "jonatasgrosman/wav2vec2-large-xlsr-53-chinese-zh-cn"},
-    "el": {"model_name": "facebook/wav2vec2-large-xlsr-53-greek"},
-    "ar": {"model_name": "jonatasgrosman/wav2vec2-large-xlsr-53-arabic"},
+DEFAULT_TIER = "large"
+
+ASR_CHECKPOINTS = {
+    "en": {"large": "facebook/wav2vec2-large-960h", "base": "facebook/wav2vec2-base-960h"},
+    "de": {"large": "jonatasgrosman/wav2vec2-large-xlsr-53-german"},
+    "es": {"large": "jonatasgrosman/wav2vec2-large-xlsr-53-spanish"},
+    "zh": {"large": "jonatasgrosman/wav2vec2-large-xlsr-53-chinese-zh-cn"},
+    "el": {"large": "facebook/wav2vec2-large-xlsr-53-greek"},
+    "ar": {"large": "jonatasgrosman/wav2vec2-large-xlsr-53-arabic"},
 }
 
+# Local checkpoints: ASR_MODEL_DIR/<lang>/<tier>/ (config.json + weights + vocab)
+ASR_MODEL_DIR = os.environ.get("ASR_MODEL_DIR", os.path.join(ROOT_DIR, "models", "asr"))
+
+
+def available_tiers(language_code: str) -> dict:
+    """Tier name -> checkpoint (Hub name or local directory) for a language."""
+    tiers = dict(ASR_CHECKPOINTS.get(language_code, {}))
+    local_dir = os.path.join(ASR_MODEL_DIR, language_code)
+    if os.path.isdir(local_dir):
+        for tier in sorted(os.listdir(local_dir)):
+            path = os.path.join(local_dir, tier)
+            if os.path.isfile(os.path.join(path, "config.json")):
+                tiers[tier] = path
+    return tiers
+
+
+def selected_tier(language_code: str) -> str:
+    """Serving tier for a language from ASR_TIERS / ASR_TIER, falling back to the default."""
+    overrides = dict(
+        item.split("=", 1) for item in os.environ.get("ASR_TIERS", "").split(",") if "=" in item
+    )
+    tier = overrides.get(language_code, os.environ.get("ASR_TIER", DEFAULT_TIER))
+    tiers = available_tiers(language_code)
+    if tier not in tiers:
+        logger.warning(f"ASR tier '{tier}' not available for '{language_code}'; using '{DEFAULT_TIER}'")
+        tier = DEFAULT_TIER
+    return tier
+
+
+def _language_entry(language_code: str) -> dict:
+    tier = selected_tier(language_code)
+    return {"tier": tier, "model_name": available_tiers(language_code)[tier]}
+
+
+language_models = {lang: _language_entry(lang) for lang in ASR_CHECKPOINTS}
+
+
+class ASRModelUnavailable(RuntimeError):
+    """A language's ASR model could not be loaded; the recording cannot be transcribed."""
+
+
+def load_checkpoint(model_name: str):
+    """Load a (tokenizer, model) pair from a Hub name or local directory onto the CPU."""
+    tokenizer = transformers.Wav2Vec2Tokenizer.from_pretrained(model_name)
+    model = transformers.Wav2Vec2ForCTC.from_pretrained(model_name).to("cpu")  # use 'cuda' if available
+    model.eval()
+    apply_torch_threads()
+    return tokenizer, model
+
 
 # ----------------------------------------------------
 # Model Loading
@@ -53,30 +131,135 @@ language_models = {
 def load_language_model(language_code: str):
     """
     Loads the tokenizer and model for the given language.
+    Already-loaded models are reused. Raises ASRModelUnavailable if loading fails.
     """
     if language_code not in language_models:
         raise ValueError(
             f"Unsupported language '{language_code}'. Supported: {list(language_models.keys())}"
         )
 
+    if language_models[language_code].get("model") is not None:
+        touch_component(f"asr:{language_code}")
+        return
+
     model_name = language_models[language_code]["model_name"]
-    logging.info(f"Loading ASR model for '{language_code}' ({model_name})")
-    print(f"🎧 Loading ASR model for '{language_code}' ...")
+    tier = language_models[language_code]["tier"]
+    logger.info(f"Loading ASR model for '{language_code}' ({tier}: {model_name})")
 
     try:
-        tokenizer = Wav2Vec2Tokenizer.from_pretrained(model_name)
-        model = Wav2Vec2ForCTC.from_pretrained(model_name).to("cpu")  # use 'cuda' if available
-
+        start = time.perf_counter()
+        tokenizer, model = load_checkpoint(model_name)
+        # Load times feed the scheduler's cold-start estimate (scheduler.py)
+        record_model_load(language_code, time.perf_counter() - start)
         language_models[language_code]["tokenizer"] = tokenizer
         language_models[language_code]["model"] = model
+        # Unloaded by the memory governor once idle (MODEL_IDLE_TTL) or under memory pressure
+        register_component(
+            f"asr:{language_code}",
+            lambda: unload_language_model(language_code),
+            lambda: object_mb(language_models[language_code].get("model")),
+        )
 
-        print(f"✅ Model loaded successfully for '{language_code}'\n")
-        logging.info(f"Model loaded successfully for {language_code}")
+        logger.info(f"Model loaded successfully for {language_code}")
     except Exception as e:
-        print(f"❌ Failed to load model for '{language_code}': {e}")
-        logging.error(f"Model load error for {language_code}: {e}")
+        logger.error(f"Model load error for {language_code}: {e}")
         language_models[language_code]["tokenizer"] = None
         language_models[language_code]["model"] = None
+        raise ASRModelUnavailable(f"ASR model for '{language_code}' failed to load: {e}") from e
+
+
+def unload_language_model(language_code: str):
+    """Drop a language's tokenizer and model; the next use loads them again."""
+    entry = language_models.get(language_code)
+    if entry is not None and entry.get("model") is not None:
+        entry["tokenizer"] = None
+        entry["model"] = None
+        unregister_component(f"asr:{language_code}")
+        logger.info(f"Unloaded ASR model for {language_code}")
+
+
+# ----------------------------------------------------
+# Sliding-window (chunked) Inference
+# ----------------------------------------------------
+def _samples_per_frame(model) -> int:
+    """Input samples per CTC output frame (320 for wav2vec2's conv feature encoder)."""
+    ratio = getattr(model.config, "inputs_to_logits_ratio", None)
+    if ratio is None:
+        ratio = int(np.prod(getattr(model.config, "conv_stride", [320])))
+    return int(ratio)
+
+
+def chunk_windows(n_samples: int, chunk: int, stride: int, frame: int = 1):
+    """
+    Overlapping windows as (start, end, left, right) sample offsets: each window
+    covers [start, end) and its first `left` / last `right` samples are context
+    only, whose frames are dropped when stitching. Sizes are rounded to whole
+    frames so the kept spans tile the input without gaps or overlaps.
+    """
+    chunk = max(frame, chunk // frame * frame)
+    stride = min(stride // frame * frame, (chunk - frame) // 2)
+    step = chunk - 2 * stride
+    windows = []
+    start = kept_end = 0
+    while True:
+        end = min(start + chunk, n_samples)
+        if end == n_samples:
+            # Last window: extend it backwards to full length instead of leaving a short tail
+            start = max(0, (n_samples - chunk) // frame * frame)
+        right = stride if end < n_samples else 0
+        windows.append((start, end, kept_end - start, right))
+        if end >= n_samples:
+            return windows
+        kept_end = end - right
+        start += step
+
+
+def transcribe_chunked(audio, tokenizer, model, device="cpu", chunk_seconds=None, stride_seconds=None):
+    """
+    Transcribe a 16 kHz signal of any length in overlapping windows. Each
+    window runs through the model on its own; the argmax CTC ids of its
+    central part are concatenated and decoded once, so memory depends on the
+    window size only. Windows are normalized separately, so very long inputs
+    can differ slightly from a single pass.
+    """
+    chunk_seconds = ASR_CHUNK_SECONDS if chunk_seconds is None else chunk_seconds
+    stride_seconds = ASR_STRIDE_SECONDS if stride_seconds is None else stride_seconds
+    frame = _samples_per_frame(model)
+    windows = chunk_windows(
+        len(audio), int(chunk_seconds * ASR_SAMPLE_RATE), int(stride_seconds * ASR_SAMPLE_RATE), frame
+    )
+
+    ids = []
+    for start, end, left, right in windows:
+        input_values = tokenizer(audio[start:end], return_tensors="pt").input_values.to(device)
+        with torch.no_grad():
+            window_ids = torch.argmax(model(input_values).logits, dim=-1)[0].cpu().numpy()
+        first = left // frame
+        last = first + (end - start - left - right) // frame if right else len(window_ids)
+        ids.append(window_ids[first:last])
+
+    return tokenizer.decode(np.concatenate(ids).tolist())
+
+
+def verify_chunking(file_paths, tokenizer, model, chunk_seconds=4.0, stride_seconds=1.0, device="cpu"):
+    """
+    Transcribe each (short) file in one pass and with small windows, and return
+    a list of {"file", "single_pass", "chunked", "match"} for comparison.
+    """
+    results = []
+    for file_path in file_paths:
+        audio, _ = librosa.load(file_path, sr=ASR_SAMPLE_RATE)
+        input_values = tokenizer(audio, return_tensors="pt").input_values.to(device)
+        with torch.no_grad():
+            single = tokenizer.decode(torch.argmax(model(input_values).logits, dim=-1)[0])
+        chunked = transcribe_chunked(audio, tokenizer, model, device, chunk_seconds, stride_seconds)
+        results.append({
+            "file": os.path.basename(file_path),
+            "single_pass": single.lower().strip(),
+            "chunked": chunked.lower().strip(),
+            "match": single.lower().split() == chunked.lower().split(),
+        })
+    return results
 
 
 # ----------------------------------------------------
@@ -85,25 +268,68 @@ def load_language_model(language_code: str):
 def transcribe_audio(file_path: str, tokenizer, model, device="cpu"):
     """
     Transcribes a single WAV file using the provided model and tokenizer.
+    Files longer than ASR_CHUNK_SECONDS are transcribed in overlapping windows.
     """
     try:
-        audio, rate = librosa.load(file_path, sr=16000)
-        input_values = tokenizer(audio, return_tensors="pt", padding="longest").input_values.to(device)
-        with torch.no_grad():
-            logits = model(input_values).logits
-        predicted_ids = torch.argmax(logits, dim=-1)
-        transcription = tokenizer.decode(predicted_ids[0])
+        audio, rate = librosa.load(file_path, sr=ASR_SAMPLE_RATE)
+        if ASR_CHUNK_SECONDS and len(audio) > ASR_CHUNK_SECONDS * ASR_SAMPLE_RATE:
+            transcription = transcribe_chunked(audio, tokenizer, model, device)
+        else:
+            input_values = tokenizer(audio, return_tensors="pt", padding="longest").input_values.to(device)
+            with torch.no_grad():
+                logits = model(input_values).logits
+            predicted_ids = torch.argmax(logits, dim=-1)
+            transcription = tokenizer.decode(predicted_ids[0])
 
         transcription = transcription.lower().strip()
-        logging.info(f"Transcribed: {os.path.basename(file_path)}")
-        print(f"🗣️ Transcribed {os.path.basename(file_path)}")
+        logger.info(f"Transcribed: {os.path.basename(file_path)}")
         return transcription
     except Exception as e:
-        print(f"❌ Error transcribing {file_path}: {e}")
-        logging.error(f"Transcription error for {file_path}: {e}")
+        logger.error(f"Transcription error for {file_path}: {e}")
         return None
 
 
+# ----------------------------------------------------
+# Transcribe a Batch of Files
+# ----------------------------------------------------
+def transcribe_batch(file_paths, tokenizer, model, device="cpu"):
+    """
+    Transcribes several WAV files in one padded forward pass.
+    Segments from `segmentation.py` all have the same length, so no padding is added in practice.
+    Files that fail to load come back as None.
+    """
+    audios, loaded = [], []
+    for i, file_path in enumerate(file_paths):
+        try:
+            audio, _ = librosa.load(file_path, sr=ASR_SAMPLE_RATE)
+            audios.append(audio)
+            loaded.append(i)
+        except Exception as e:
+            logger.error(f"Transcription error for {file_path}: {e}")
+
+    transcriptions = [None] * len(file_paths)
+    if not audios:
+        return transcriptions
+
+    inputs = tokenizer(audios, return_tensors="pt", padding="longest")
+    input_values = inputs.input_values.to(device)
+    attention_mask = getattr(inputs, "attention_mask", None)
+    # Checkpoints with group-norm feature extractors expect zero padding without a mask
+    if getattr(model.config, "feat_extract_norm", "layer") != "layer":
+        attention_mask = None
+    with torch.no_grad():
+        if attention_mask is not None:
+            logits = model(input_values, attention_mask=attention_mask.to(device)).logits
+        else:
+            logits = model(input_values).logits
+    predicted_ids = torch.argmax(logits, dim=-1)
+
+    for i, text in zip(loaded, tokenizer.batch_decode(predicted_ids)):
+        transcriptions[i] = text.lower().strip()
+    logger.info(f"Transcribed batch of {len(audios)} segments")
+    return transcriptions
+
+
 # ----------------------------------------------------
 # Transcribe a Dataset
 # ----------------------------------------------------
@@ -153,5 +379,30 @@ def save_transcriptions_to_csv(transcriptions, output_csv="transcriptions.csv"):
     pd.DataFrame(transcriptions).to_csv(output_path, index=False)
 
     print(f"\n💾 Transcriptions saved to: {output_path}")
-    logging.info(f"Transcriptions saved: {output_path}")
+    logger.info(f"Transcriptions saved: {output_path}")
     return output_path
+
+
+# ----------------------------------------------------
+# Entry Point
+# ----------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare chunked and single-pass transcripts.")
+    parser.add_argument("--verify-chunking", nargs="+", metavar=("LANG", "WAV"), required=True)
+    parser.add_argument("--chunk-seconds", type=float, default=4.0)
+    parser.add_argument("--stride-seconds", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    language_code, file_paths = args.verify_chunking[0], args.verify_chunking[1:]
+    load_language_model(language_code)
+    entry = language_models[language_code]
+    results = verify_chunking(file_paths, entry["tokenizer"], entry["model"], args.chunk_seconds, args.stride_seconds)
+    for result in results:
+        print(f"{'✅' if result['match'] else '❌'} {result['file']}")
+        if not result["match"]:
+            print(f"   single:  {result['single_pass']}\n   chunked: {result['chunked']}")
+    return 0 if all(result["match"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+warmup.py
+---------
+Readiness tracking and explicit warm-up for the prediction pipeline.
+
+Heavy dependencies are imported lazily (see `lazy_imports.py`), so a fresh
+worker can answer health checks immediately. `warmup()` preloads whatever a
+deployment needs ahead of the first request and records progress that the
+server exposes through `GET /ready`.
+
+Usage:
+  python -m backend.src.warmup --languages en de
+  python -m backend.src.warmup --components classifier acoustic --profile-imports
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+import threading
+
+from backend.src.logging_setup import get_logger
+from backend.src.lazy_imports import IMPORT_TIMES, ensure_loaded
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
+os.makedirs(LOG_DIR, exist_ok=True)
+
+LOG_FILE = os.path.join(LOG_DIR, "prediction_pipeline.log")
+
+logger = get_logger(__name__, LOG_FILE)
+
+COMPONENTS = ("classifier", "acoustic", "linguistic", "asr")
+
+# Shared warm-up state, read by the /ready endpoint
+WARMUP_STATUS = {
+    "state": "idle",  # idle | running | ready | failed
+    "steps": {},
+    "completed": 0,
+    "total": 0,
+    "started_at": None,
+    "finished_at": None,
+}
+
+_status_lock = threading.Lock()
+_warmup_thread = None
+
+
+# ----------------------------------------------------
+# Warm-up Steps
+# ----------------------------------------------------
+def _warm_classifier():
+    from backend.src.prediction_script import get_model_and_scaler
+    get_model_and_scaler()
+
+
+def _warm_acoustic():
+    from backend.src import acoustic_extraction
+    ensure_loaded(acoustic_extraction.librosa)
+    acoustic_extraction.get_smile()
+
+    # Start the supervised extraction workers too (they import the same libraries)
+    from backend.src.watchdog import stage_timeout
+    from backend.src.prediction_script import ACOUSTIC_WORKERS, get_model_and_scaler
+    if ACOUSTIC_WORKERS or stage_timeout("acoustic"):
+        from backend.src.resources import BUDGET
+        from backend.src.feature_schema import schema_for_scaler
+        schema = schema_for_scaler(get_model_and_scaler()[1])
+        acoustic_extraction.get_acoustic_pool(schema, ACOUSTIC_WORKERS or BUDGET["acoustic"]).start()
+
+
+def _warm_linguistic(lang):
+    from backend.src.linguistic_extraction import get_spacy_pipeline, get_feature_keys
+    get_feature_keys()
+    get_spacy_pipeline(lang)
+
+
+def _warm_asr(lang):
+    from backend.src.transcription import load_language_model, language_models
+    load_language_model(lang)
+    if language_models[lang].get("model") is None:
+        raise RuntimeError(f"ASR model for '{lang}' failed to load")
+
+
+def build_steps(languages, components=COMPONENTS):
+    """Returns an ordered list of (step name, callable) for the requested warm-up."""
+    steps = []
+    if "classifier" in components:
+        steps.append(("classifier", _warm_classifier))
+    if "acoustic" in components:
+        steps.append(("acoustic", _warm_acoustic))
+    for lang in languages:
+        if "linguistic" in components:
+            steps.append((f"linguistic:{lang}", lambda lang=lang: _warm_linguistic(lang)))
+        if "asr" in components:
+            steps.append((f"asr:{lang}", lambda lang=lang: _warm_asr(lang)))
+    if "linguistic" in components:
+        # SPACY_PRELOAD languages get their spaCy pipeline even without ASR warm-up
+        from backend.src.spacy_pipelines import SPACY_PRELOAD
+        for lang in SPACY_PRELOAD:
+            if lang not in languages:
+                steps.append((f"linguistic:{lang}", lambda lang=lang: _warm_linguistic(lang)))
+    return steps
+
+
+# ----------------------------------------------------
+# Runner
+# ----------------------------------------------------
+def warmup(languages=("en",), components=COMPONENTS):
+    """
+    Preload models and libraries, updating WARMUP_STATUS as each step finishes.
+    A failing step is recorded and the remaining steps still run.
+    Returns True if every step succeeded.
+    """
+    steps = build_steps(languages, components)
+    with _status_lock:
+        WARMUP_STATUS.update(
+            state="running",
+            steps={name: {"status": "pending"} for name, _ in steps},
+            completed=0,
+            total=len(steps),
+            started_at=time.time(),
+            finished_at=None,
+        )
+
+    ok = True
+    for name, step in steps:
+        with _status_lock:
+            WARMUP_STATUS["steps"][name] = {"status": "running"}
+        start = time.perf_counter()
+        try:
+            step()
+            result = {"status": "done"}
+        except Exception as e:
+            ok = False
+            logger.error(f"Warm-up step '{name}' failed: {e}")
+            result = {"status": "failed", "error": str(e)}
+        result["seconds"] = round(time.perf_counter() - start, 3)
+        with _status_lock:
+            WARMUP_STATUS["steps"][name] = result
+            WARMUP_STATUS["completed"] += 1
+        logger.info(f"Warm-up step '{name}': {result['status']} in {result['seconds']}s")
+
+    with _status_lock:
+        WARMUP_STATUS["state"] = "ready" if ok else "failed"
+        WARMUP_STATUS["finished_at"] = time.time()
+    return ok
+
+
+def start_background_warmup(languages=("en",), components=COMPONENTS):
+    """Run warmup() on a daemon thread so the server can start accepting connections."""
+    global _warmup_thread
+    if _warmup_thread is not None and _warmup_thread.is_alive():
+        return _warmup_thread
+    _warmup_thread = threading.Thread(
+        target=warmup, args=(tuple(languages), tuple(components)), name="warmup", daemon=True
+    )
+    _warmup_thread.start()
+    return _warmup_thread
+
+
+def readiness():
+    """Snapshot of warm-up progress plus first-import timings of heavy modules."""
+    with _status_lock:
+        status = {
+            **WARMUP_STATUS,
+            "steps": {name: dict(step) for name, step in WARMUP_STATUS["steps"].items()},
+        }
+    status["ready"] = status["state"] in ("idle", "ready")
+    status["imports"] = {name: round(seconds, 3) for name, seconds in IMPORT_TIMES.items()}
+    return status
+
+
+# ----------------------------------------------------
+# Import-time Profile
+# ----------------------------------------------------
+def format_import_profile(server_import_seconds=None):
+    """Render recorded import timings as a plain-text report, slowest first."""
+    lines = ["Import-time profile", "-------------------"]
+    if server_import_seconds is not None:
+        lines.append(f"{'backend.api.server (cold)':<40} {server_import_seconds * 1000:>10.1f} ms")
+    for name, seconds in sorted(IMPORT_TIMES.items(), key=lambda item: item[1], reverse=True):
+        lines.append(f"{name:<40} {seconds * 1000:>10.1f} ms")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Preload models and report import/warm-up timings.")
+    parser.add_argument("--languages", nargs="+", default=["en"], help="Language codes to preload.")
+    parser.add_argument("--components", nargs="+", default=list(COMPONENTS), choices=COMPONENTS)
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="Also time the server import and every heavy module import.")
+    args = parser.parse_args(argv)
+
+    server_seconds = None
+    if args.profile_imports:
+        start = time.perf_counter()
+        importlib.import_module("backend.api.server")
+        server_seconds = time.perf_counter() - start
+
+    ok = warmup(args.languages, args.components)
+    status = readiness()
+
+    print(f"Warm-up {'completed' if ok else 'finished with errors'}:")
+    for name, step in status["steps"].items():
+        detail = f" ({step['error']})" if "error" in step else ""
+        print(f"  {name:<24} {step['status']:<8} {step.get('seconds', 0):>8.2f}s{detail}")
+
+    if args.profile_imports:
+        print()
+        print(format_import_profile(server_seconds))
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+watchdog.py
+-----------
+Deadlines for pipeline stages that can hang on pathological input.
+
+Native extractors (OpenSMILE, librosa, FFmpeg) catch Python exceptions but
+cannot be interrupted once they hang inside C code. A `SupervisedPool` runs
+such calls in long-lived worker processes: the caller waits at most the
+stage's deadline for the answer, and a worker that misses it is killed and
+replaced on the next call. Callers degrade instead of stalling: features of a
+timed-out segment stay NaN (zero after scaling), like a failed extractor.
+
+Stages without a worker process (FFmpeg's own subprocess, waiting for batched
+ASR) use the same deadlines and counters; `watchdog_stats()` reports calls,
+timeouts, crashes and worker restarts per stage.
+
+Configuration (environment):
+  STAGE_TIMEOUTS            per-stage deadlines in seconds, e.g. "acoustic=60,asr=120,ffmpeg=60";
+                            0 disables a deadline (acoustic then runs in-process again)
+  WATCHDOG_STARTUP_TIMEOUT  seconds a new worker may take to import and warm up (default 180)
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+
+# ----------------------------------------------------
+# Configuration
+# ----------------------------------------------------
+DEFAULT_TIMEOUTS = {"acoustic": 60.0, "asr": 120.0, "ffmpeg": 60.0}
+
+
+def parse_timeouts(spec: str) -> dict:
+    """Parse "stage=seconds,..." on top of DEFAULT_TIMEOUTS."""
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        stage, _, seconds = item.partition("=")
+        if stage not in DEFAULT_TIMEOUTS:
+            raise ValueError(f"Unknown stage '{stage}' in STAGE_TIMEOUTS. Use one of {tuple(DEFAULT_TIMEOUTS)}.")
+        timeouts[stage] = max(0.0, float(seconds))
+    return timeouts
+
+
+STAGE_TIMEOUTS = parse_timeouts(os.environ.get("STAGE_TIMEOUTS", ""))
+WATCHDOG_STARTUP_TIMEOUT = float(os.environ.get("WATCHDOG_STARTUP_TIMEOUT", 180))
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class StageTimeout(Exception):
+    """A stage missed its deadline (or its worker died); the caller should degrade."""
+
+
+def stage_timeout(stage: str):
+    """Deadline in seconds for a stage, or None when it has none."""
+    return STAGE_TIMEOUTS.get(stage) or None
+
+
+# ----------------------------------------------------
+# Counters
+# ----------------------------------------------------
+def _count(stage: str, key: str):
+    with _stats_lock:
+        stats = _stats.setdefault(stage, {"calls": 0, "timeouts": 0, "crashes": 0, "restarts": 0})
+        stats[key] += 1
+
+
+def record_call(stage: str):
+    _count(stage, "calls")
+
+
+def record_timeout(stage: str):
+    _count(stage, "timeouts")
+
+
+def watchdog_stats() -> dict:
+    """Per-stage deadline and call / timeout / crash / restart counters."""
+    with _stats_lock:
+        return {
+            stage: {**_stats.get(stage, {"calls": 0, "timeouts": 0, "crashes": 0, "restarts": 0}),
+                    "timeout_seconds": seconds}
+            for stage, seconds in STAGE_TIMEOUTS.items()
+        }
+
+
+# ----------------------------------------------------
+# Supervised Workers
+# ----------------------------------------------------
+def _worker_main(conn, initializer, initargs):
+    """Worker loop: run (fn, args) messages until the pipe closes or None arrives."""
+    if initializer is not None:
+        initializer(*initargs)
+    conn.send("ready")
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        fn, args = message
+        try:
+            conn.send((True, fn(*args)))
+        except Exception as e:
+            # Exceptions from native libraries do not always pickle
+            conn.send((False, f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, context, initializer, initargs):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, initializer, initargs), daemon=True)
+        self.process.start()
+        child_conn.close()
+        try:
+            ready = self.conn.poll(WATCHDOG_STARTUP_TIMEOUT) and self.conn.recv() == "ready"
+        except (EOFError, OSError):
+            ready = False
+        if not ready:
+            self.kill()
+            raise StageTimeout(f"Worker failed to start within {WATCHDOG_STARTUP_TIMEOUT:.0f}s "
+                               f"(exit code {self.process.exitcode})")
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(5)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+            self.process.join(1)
+        except (OSError, EOFError):
+            pass
+        if self.process.is_alive():
+            self.kill()
+
+
+class SupervisedPool:
+    """
+    Up to `size` worker processes for one stage. `call()` blocks for at most
+    `timeout` seconds (plus worker start-up); on timeout the worker is killed
+    and StageTimeout is raised. Workers are started on demand and reused.
+    Functions and arguments must be picklable (module-level functions).
+    """
+
+    def __init__(self, stage: str, size: int, initializer=None, initargs=()):
+        self.stage = stage
+        self.size = max(1, int(size))
+        self.initializer = initializer
+        self.initargs = initargs
+        # Spawned, not forked: the server process holds threads and torch state
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _acquire(self) -> "_Worker":
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.kill()
+        return _Worker(self._context, self.initializer, self.initargs)
+
+    def _release(self, worker: "_Worker"):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(worker)
+                return
+        worker.stop()
+
+    def start(self, n: int = 1):
+        """Start up to `n` idle workers ahead of the first call."""
+        workers = [self._acquire() for _ in range(min(n, self.size))]
+        for worker in workers:
+            self._release(worker)
+
+    def call(self, fn, *args, timeout: float = None):
+        """Run fn(*args) in a worker; raises StageTimeout if it misses the deadline or the worker dies."""
+        with self._slots:
+            worker = self._acquire()
+            record_call(self.stage)
+            try:
+                worker.conn.send((fn, args))
+                if not worker.conn.poll(timeout):
+                    worker.kill()
+                    record_timeout(self.stage)
+                    _count(self.stage, "restarts")
+                    logging.warning(f"{self.stage} worker killed after missing its {timeout:.0f}s deadline")
+                    raise StageTimeout(f"{self.stage} missed its {timeout:.0f}s deadline")
+                ok, value = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.kill()
+                _count(self.stage, "crashes")
+                _count(self.stage, "restarts")
+                logging.warning(f"{self.stage} worker died (exit code {worker.process.exitcode})")
+                raise StageTimeout(f"{self.stage} worker died (exit code {worker.process.exitcode})")
+
+            self._release(worker)
+            if not ok:
+                raise RuntimeError(value)
+            return value
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
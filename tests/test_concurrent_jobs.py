@@ -0,0 +1,99 @@
+"""
+Concurrent classification jobs (backend/src/scheduler.py, prediction_script.py)
+------------------------------------------------------------------------------
+SCHEDULER_SLOTS lets several jobs run at once, so jobs must not share any
+scratch state. Two recordings are scored at the same time through a two-slot
+scheduler with real segmentation; the models are replaced by stubs that read
+the job's segment files while the other job is also mid-pipeline.
+"""
+
+import os
+import threading
+import wave
+
+import numpy as np
+import pytest
+
+import backend.src.prediction_script as ps
+from backend.src.scheduler import CostModel, JobScheduler
+
+SAMPLE_RATE = 16000
+
+
+def _write_wav(path, seconds, seed):
+    samples = (np.random.default_rng(seed).standard_normal(int(seconds * SAMPLE_RATE)) * 3000).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(samples.tobytes())
+
+
+class StubSchema:
+    width = 2
+
+    def new_rows(self, n):
+        return np.full((n, self.width), np.nan, dtype=np.float32)
+
+
+@pytest.fixture
+def stub_models(monkeypatch, tmp_path):
+    """Stub every model stage; each job's first transcription waits until both jobs got there."""
+    both_transcribing = threading.Barrier(2, timeout=10)
+    seen = {}
+
+    def transcribe(path, *args, **kwargs):
+        if not any(os.path.dirname(other) == os.path.dirname(path) for other in seen):
+            both_transcribing.wait()
+        with wave.open(path) as f:  # fails if the other job removed this segment
+            seen[path] = f.getnframes()
+        return "text"
+
+    monkeypatch.setattr(ps, "PROCESSED_DIR", str(tmp_path))
+    monkeypatch.setattr(ps, "PIPELINE_BROKER", "")
+    monkeypatch.setattr(ps, "BATCHING_ENABLED", False)
+    monkeypatch.setattr(ps, "ACOUSTIC_WORKERS", 0)
+    monkeypatch.setattr(ps, "stage_timeout", lambda stage: None)
+    monkeypatch.setattr(ps, "parse_cascade_band", lambda: None)
+    monkeypatch.setattr(ps, "_load_classifier", lambda: {"model": None, "scaler": None, "acoustic_model": None,
+                                                         "batcher": None})
+    monkeypatch.setattr(ps, "schema_for_scaler", lambda scaler: StubSchema())
+    monkeypatch.setattr(ps, "extract_acoustic_into", lambda path, row, schema: row.fill(0.0))
+    monkeypatch.setattr(ps, "load_language_model", lambda lang: None)
+    monkeypatch.setattr(ps, "language_models", {"en": {"tokenizer": None, "model": None}})
+    monkeypatch.setattr(ps, "transcribe_audio", transcribe)
+    monkeypatch.setattr(ps, "extract_linguistic_into", lambda text, lang, row, schema: None)
+    monkeypatch.setattr(ps, "predict_matrix", lambda model, scaler, X, schema=None: np.full(len(X), 0.9))
+    return seen
+
+
+def test_two_jobs_run_at_once_without_sharing_segments(stub_models, tmp_path):
+    recordings = []
+    for i, seconds in enumerate((45, 65)):
+        path = str(tmp_path / f"recording{i}.wav")
+        _write_wav(path, seconds, seed=i)
+        recordings.append(path)
+
+    scheduler = JobScheduler(policy="fifo", slots=2, cost_model=CostModel(path=None))
+    results, errors = {}, []
+
+    def run(path):
+        try:
+            with scheduler.submit(path, "en"):
+                results[path] = ps.score_recording(path, "en")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(path,)) for path in recordings]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert not errors
+    assert [results[path]["n_segments"] for path in recordings] == [3, 4]
+    assert all(results[path]["label"] == "AD" for path in recordings)
+    # Each job read only its own segments, from its own directory, and removed it afterwards
+    job_dirs = {os.path.dirname(path) for path in stub_models}
+    assert len(stub_models) == 7 and len(job_dirs) == 2
+    assert not any(os.path.exists(job_dir) for job_dir in job_dirs)
@@ -0,0 +1,104 @@
+"""
+Sliding-window ASR (backend/src/transcription.py)
+-------------------------------------------------
+chunk_windows must tile the input exactly, and transcribe_chunked must give the
+same CTC ids as a single pass. The stub model below behaves like wav2vec2's
+feature encoder (one frame per 320 samples, (L - 400) // 320 + 1 frames) and
+emits the global frame index as the id, so any gap or overlap when stitching
+shows up as a missing or repeated id.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from backend.src.transcription import ASR_SAMPLE_RATE, chunk_windows, transcribe_chunked
+
+FRAME = 320
+RECEPTIVE_FIELD = 400
+
+
+def _frames(n_samples: int) -> int:
+    return (n_samples - RECEPTIVE_FIELD) // FRAME + 1
+
+
+# ----------------------------------------------------
+# Stub CTC model
+# ----------------------------------------------------
+class StubTokenizer:
+    """Passes samples through unchanged and "decodes" to the list of ids."""
+
+    def __call__(self, audio, return_tensors="pt"):
+        import torch
+        return SimpleNamespace(input_values=torch.tensor(np.asarray(audio), dtype=torch.float64)[None])
+
+    def decode(self, ids):
+        return [int(i) for i in ids]
+
+
+class StubCTCModel:
+    """
+    Frame f of a window starting at sample s gets id (s + 320 f) // 320. The
+    input is np.arange(n), so the window's first sample value is s.
+    """
+
+    config = SimpleNamespace(inputs_to_logits_ratio=FRAME)
+
+    def __call__(self, input_values):
+        import torch
+        offset = int(input_values[0, 0].item()) // FRAME
+        n_frames = _frames(input_values.shape[-1])
+        ids = torch.arange(n_frames) + offset
+        logits = torch.zeros(1, n_frames, offset + n_frames)
+        logits[0, torch.arange(n_frames), ids] = 1.0
+        return SimpleNamespace(logits=logits)
+
+
+def _single_pass(audio):
+    import torch
+    tokenizer, model = StubTokenizer(), StubCTCModel()
+    logits = model(tokenizer(audio).input_values).logits
+    return tokenizer.decode(torch.argmax(logits, dim=-1)[0])
+
+
+# ----------------------------------------------------
+# chunk_windows
+# ----------------------------------------------------
+@pytest.mark.parametrize("n_samples", [400, 31_999, 32_000, 32_001, 100_000, 16_000 * 95 + 123])
+@pytest.mark.parametrize("chunk, stride", [(32_000, 8_000), (64_000, 16_000), (48_000, 0)])
+def test_chunk_windows_tile_the_input(n_samples, chunk, stride):
+    windows = chunk_windows(n_samples, chunk, stride, FRAME)
+
+    kept_start = 0
+    for start, end, left, right in windows:
+        assert start % FRAME == 0
+        assert 0 <= start < end <= n_samples
+        # The last window is moved back to a frame boundary, so it may be up to a frame longer
+        assert end - start < chunk + FRAME
+        assert left >= 0 and right >= 0
+        # Kept spans follow each other without gaps or overlaps
+        assert start + left == kept_start
+        kept_start = end - right
+    assert kept_start == n_samples
+    assert windows[-1][1] == n_samples and windows[-1][3] == 0
+
+
+def test_chunk_windows_single_window_for_short_input():
+    assert chunk_windows(10_000, 32_000, 8_000, FRAME) == [(0, 10_000, 0, 0)]
+
+
+# ----------------------------------------------------
+# transcribe_chunked
+# ----------------------------------------------------
+@pytest.mark.parametrize("seconds", [0.5, 3.9, 4.0, 7.3, 12.0, 20.02])
+def test_transcribe_chunked_matches_single_pass(seconds):
+    pytest.importorskip("torch")
+    audio = np.arange(int(seconds * ASR_SAMPLE_RATE), dtype=np.float64)
+
+    chunked = transcribe_chunked(
+        audio, StubTokenizer(), StubCTCModel(), chunk_seconds=4.0, stride_seconds=1.0
+    )
+
+    assert chunked == _single_pass(audio)
+    assert chunked == list(range(_frames(len(audio))))
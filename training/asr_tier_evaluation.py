@@ -0,0 +1,293 @@
+"""
+asr_tier_evaluation.py
+----------------------
+Offline comparison of ASR checkpoint tiers (see backend/src/transcription.py).
+
+For every language in a local test set and every available tier (Hub
+checkpoints and ASR_MODEL_DIR/<lang>/<tier> directories) it reports:
+- WER drift against the reference tier's transcripts (and WER against
+  reference transcripts when the manifest has them; CER for Chinese),
+- downstream accuracy/F1 of the trained classifier and the F1 change
+  against the reference tier, plus label agreement,
+- CPU latency (seconds per segment and real-time factor) and model size.
+
+Recordings are segmented and their acoustic features extracted once; only
+ASR and linguistic features are recomputed per tier. The smallest tier whose
+F1 drop stays within --max-f1-drop is marked as recommended per language.
+
+Manifest: CSV with `path` and `lang` columns, optional `label` (AD/HC) and
+`transcript` columns.
+
+Usage:
+  python training/asr_tier_evaluation.py test_set.csv --output-dir backend/outputs
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, f1_score
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, ".."))
+from backend.src.segmentation import process_single_audio_file, SEGMENT_SECONDS
+from backend.src.acoustic_extraction import extract_acoustic_into
+from backend.src.linguistic_extraction import extract_linguistic_into
+from backend.src.transcription import available_tiers, load_checkpoint, transcribe_batch, DEFAULT_TIER
+from backend.src.feature_schema import schema_for_scaler
+from backend.src.prediction_script import get_model_and_scaler, DECISION_THRESHOLD
+from backend.api.prediction import predict_matrix, weighted_majority_voting
+
+# ==============================
+# Configuration
+# ==============================
+LABEL_MAP = {'AD': 1, 'HC': 0}
+# Languages scored by character error rate instead of word error rate
+CHARACTER_LANGUAGES = {"zh"}
+ASR_BATCH_SIZE = 4
+
+
+# ==============================
+# Error Rates
+# ==============================
+def _tokens(text, lang):
+    text = (text or "").lower()
+    if lang in CHARACTER_LANGUAGES:
+        return [c for c in text if not c.isspace()]
+    return text.split()
+
+
+def edit_distance(reference, hypothesis):
+    """Levenshtein distance between two token lists."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_token in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_token in enumerate(hypothesis, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_token != hyp_token),
+            )
+        previous = current
+    return previous[-1]
+
+
+def corpus_error_rate(references, hypotheses, lang):
+    """Total edits over total reference tokens (WER, or CER for CHARACTER_LANGUAGES)."""
+    edits = words = 0
+    for ref, hyp in zip(references, hypotheses):
+        ref_tokens = _tokens(ref, lang)
+        edits += edit_distance(ref_tokens, _tokens(hyp, lang))
+        words += len(ref_tokens)
+    return edits / words if words else float("nan")
+
+
+# ==============================
+# Test Set
+# ==============================
+def load_manifest(path):
+    """Read the test set manifest into a list of dicts."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    recordings = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for i, row in enumerate(csv.DictReader(f)):
+            audio_path = row["path"].strip()
+            if not os.path.isabs(audio_path):
+                audio_path = os.path.join(base_dir, audio_path)
+            label = (row.get("label") or "").strip().upper()
+            recordings.append({
+                "id": (row.get("id") or "").strip() or str(i),
+                "path": audio_path,
+                "lang": row["lang"].strip(),
+                "label": LABEL_MAP.get(label),
+                "transcript": (row.get("transcript") or "").strip() or None,
+            })
+    return recordings
+
+
+def prepare_recording(recording, scratch_dir, schema):
+    """Segment a recording and extract its acoustic features once (shared by all tiers)."""
+    work_dir = os.path.join(scratch_dir, f"rec_{recording['id']}".replace(os.sep, "_"))
+    segments = sorted(process_single_audio_file(recording["path"], output_folder=work_dir),
+                      key=lambda segment: segment["path"])
+    paths = [segment["path"] for segment in segments]
+    features = schema.new_rows(len(paths))
+    for i, path in enumerate(paths):
+        extract_acoustic_into(path, features[i], schema)
+    return {**recording, "segments": paths, "acoustic": features}
+
+
+# ==============================
+# Tier Evaluation
+# ==============================
+def evaluate_tier(prepared, lang, tier, checkpoint, model, scaler, schema):
+    """Transcribe and classify every prepared recording with one tier."""
+    tokenizer, asr_model = load_checkpoint(checkpoint)
+    n_params = sum(p.numel() for p in asr_model.parameters())
+
+    results = []
+    asr_seconds = 0.0
+    for recording in prepared:
+        paths = recording["segments"]
+        if not paths:
+            continue
+        texts = []
+        start = time.perf_counter()
+        for i in range(0, len(paths), ASR_BATCH_SIZE):
+            texts.extend(transcribe_batch(paths[i:i + ASR_BATCH_SIZE], tokenizer, asr_model, device="cpu"))
+        asr_seconds += time.perf_counter() - start
+
+        features = recording["acoustic"].copy()
+        for i, text in enumerate(texts):
+            extract_linguistic_into(text, lang, features[i], schema)
+        probabilities = predict_matrix(model, scaler, features, schema)
+        votes = pd.DataFrame({
+            "Prediction": (probabilities >= DECISION_THRESHOLD).astype(int),
+            "Probability": probabilities,
+        })
+        results.append({
+            "id": recording["id"],
+            "label": recording["label"],
+            "reference_transcript": recording["transcript"],
+            "transcript": " ".join(t for t in texts if t),
+            "prediction": weighted_majority_voting(votes),
+            "probability": float(probabilities.mean()),
+            "n_segments": len(paths),
+        })
+
+    del tokenizer, asr_model
+    n_segments = sum(r["n_segments"] for r in results)
+    audio_seconds = n_segments * SEGMENT_SECONDS
+    return results, {
+        "lang": lang,
+        "tier": tier,
+        "checkpoint": checkpoint,
+        "parameters": int(n_params),
+        "recordings": len(results),
+        "segments": n_segments,
+        "asr_seconds": round(asr_seconds, 3),
+        "seconds_per_segment": round(asr_seconds / n_segments, 4) if n_segments else None,
+        "real_time_factor": round(asr_seconds / audio_seconds, 4) if audio_seconds else None,
+    }
+
+
+def compare_to_reference(summary, results, reference_results, lang):
+    """Add WER drift, ground-truth WER, F1 and deltas against the reference tier."""
+    truth = [r for r in results if r["reference_transcript"]]
+    summary["wer_vs_ground_truth"] = corpus_error_rate(
+        [r["reference_transcript"] for r in truth], [r["transcript"] for r in truth], lang
+    ) if truth else None
+
+    labelled = [r for r in results if r["label"] is not None]
+    if labelled:
+        y_true = [r["label"] for r in labelled]
+        y_pred = [r["prediction"] for r in labelled]
+        summary["accuracy"] = accuracy_score(y_true, y_pred)
+        summary["f1"] = f1_score(y_true, y_pred, zero_division=0)
+    else:
+        summary["accuracy"] = summary["f1"] = None
+
+    if reference_results is not None:
+        reference = {r["id"]: r for r in reference_results}
+        pairs = [(reference[r["id"]], r) for r in results if r["id"] in reference]
+        summary["wer_drift"] = corpus_error_rate(
+            [ref["transcript"] for ref, _ in pairs], [r["transcript"] for _, r in pairs], lang
+        )
+        summary["label_agreement"] = float(np.mean([ref["prediction"] == r["prediction"] for ref, r in pairs])) \
+            if pairs else None
+    return summary
+
+
+def within_budget(row, max_f1_drop):
+    """F1 drop within budget; without labels, label agreement with the reference tier is used."""
+    if row["f1_delta"] is not None:
+        return row["f1_delta"] >= -max_f1_drop
+    agreement = row.get("label_agreement")
+    return agreement is not None and agreement >= 1.0 - max_f1_drop
+
+
+def evaluate_tiers(recordings, tiers=None, reference_tier=DEFAULT_TIER, max_f1_drop=0.01, scratch_dir=None):
+    """Evaluate every requested tier per language. Returns a DataFrame with one row per (lang, tier)."""
+    model, scaler = get_model_and_scaler()
+    schema = schema_for_scaler(scaler)
+    scratch_dir = tempfile.mkdtemp(prefix="asr_tiers_", dir=scratch_dir)
+    rows = []
+
+    try:
+        for lang in sorted({r["lang"] for r in recordings}):
+            checkpoints = available_tiers(lang)
+            names = [t for t in (tiers or checkpoints) if t in checkpoints]
+            # The reference tier runs first so the others can be compared to it
+            names = sorted(names, key=lambda t: t != reference_tier)
+            if not names:
+                print(f"⚠️ No requested tiers available for '{lang}'")
+                continue
+
+            print(f"\n🌐 {lang}: preparing {sum(r['lang'] == lang for r in recordings)} recordings")
+            prepared = [prepare_recording(r, scratch_dir, schema) for r in recordings if r["lang"] == lang]
+
+            reference_results = None
+            lang_rows = []
+            for tier in names:
+                print(f"🎧 {lang}/{tier}: {checkpoints[tier]}")
+                results, summary = evaluate_tier(prepared, lang, tier, checkpoints[tier], model, scaler, schema)
+                if tier == reference_tier:
+                    reference_results = results
+                lang_rows.append(compare_to_reference(summary, results, reference_results, lang))
+
+            reference_f1 = next((r["f1"] for r in lang_rows if r["tier"] == reference_tier), None)
+            for row in lang_rows:
+                row["f1_delta"] = row["f1"] - reference_f1 \
+                    if row["f1"] is not None and reference_f1 is not None else None
+            acceptable = [r for r in lang_rows if within_budget(r, max_f1_drop)]
+            recommended = min(acceptable, key=lambda r: r["parameters"])["tier"] if acceptable else reference_tier
+            for row in lang_rows:
+                row["recommended"] = row["tier"] == recommended
+            rows.extend(lang_rows)
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return pd.DataFrame(rows)
+
+
+# ==============================
+# Entry Point
+# ==============================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare ASR checkpoint tiers on a local test set.")
+    parser.add_argument("manifest", help="CSV with path, lang and optional label / transcript columns.")
+    parser.add_argument("--tiers", nargs="+", default=None, help="Tiers to evaluate (default: all available).")
+    parser.add_argument("--reference-tier", default=DEFAULT_TIER)
+    parser.add_argument("--max-f1-drop", type=float, default=0.01,
+                        help="Largest F1 (or label agreement) loss accepted for a recommendation.")
+    parser.add_argument("--output-dir", default=os.path.join(BASE_DIR, "../backend/outputs"))
+    parser.add_argument("--scratch-dir", default=None)
+    args = parser.parse_args(argv)
+
+    recordings = load_manifest(args.manifest)
+    report = evaluate_tiers(recordings, args.tiers, args.reference_tier, args.max_f1_drop, args.scratch_dir)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    csv_path = os.path.join(args.output_dir, "asr_tier_report.csv")
+    report.to_csv(csv_path, index=False)
+    with open(os.path.join(args.output_dir, "asr_tier_report.json"), "w") as f:
+        json.dump(report.to_dict(orient="records"), f, indent=2, default=float)
+
+    columns = ["lang", "tier", "parameters", "seconds_per_segment", "real_time_factor",
+               "wer_drift", "wer_vs_ground_truth", "f1", "f1_delta", "label_agreement", "recommended"]
+    print("\n" + report.reindex(columns=columns).to_string(index=False))
+    if not report.empty:
+        tiers = ",".join(f"{r.lang}={r.tier}" for r in report[report["recommended"]].itertuples())
+        print(f"\n✅ Report saved to {csv_path}\nSuggested setting: ASR_TIERS={tiers}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
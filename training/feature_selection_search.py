@@ -0,0 +1,286 @@
+"""
+feature_selection_search.py
+---------------------------
+Cross-validated search over feature-selection methods and feature counts.
+
+model_training_script.py ranks features once, with Random Forest importance
+fitted on all languages pooled (including the rows it is later evaluated
+on), and keeps a fixed TOP_N. This search instead uses leave-one-language-out
+folds: for each language, imputation, scaling and the feature ranking are
+fitted on the other languages only, and the language itself is the test set.
+
+Methods:
+  importance   Random Forest impurity importance
+  permutation  permutation importance on an inner validation split
+  ttest        Welch's t-test between AD and HC (smallest p-value first)
+
+For every (method, N) the report gives the mean and per-language F1 and the
+time spent ranking and fitting, so the cost of a method is visible next to
+its score.
+
+Speed:
+- the imputed and scaled fold matrices are computed once and cached as .npy
+  files under --cache-dir, keyed by the input tables (path, size, mtime);
+  later runs, and the parallel workers, memory-map them instead of reloading
+  the CSVs;
+- rankings are cached per (fold, method) the same way, so adding N values
+  only costs the extra fits (the report keeps the original ranking time);
+- rankings and fits run in parallel with joblib (--n-jobs), one core each.
+
+Usage:
+  python training/feature_selection_search.py --top-n 50 100 200 397 --methods importance ttest
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from scipy.stats import ttest_ind
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.inspection import permutation_importance
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+from training_pipeline import (
+    RANDOM_STATE, N_JOBS, DECISION_THRESHOLD, load_datasets, build_feature_matrix,
+)
+from model_training_script import acoustic_csv_files, linguistic_csv_files, OUTPUT_DIR, TOP_N
+from backend.src.feature_store import resolve_feature_table
+warnings.filterwarnings('ignore')
+
+# ==============================
+# Configuration
+# ==============================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, "../backend/outputs/feature_search_cache")
+
+METHODS = ("importance", "permutation", "ttest")
+DEFAULT_TOP_N = (25, 50, 100, 200, TOP_N)
+# Bump when the fold preparation changes, so stale caches are not reused
+CACHE_VERSION = "1"
+PERMUTATION_REPEATS = 5
+
+
+# ==============================
+# Fold Cache
+# ==============================
+def data_fingerprint(acoustic_files, linguistic_files) -> str:
+    """Hash of the input tables' paths, sizes and modification times."""
+    digest = hashlib.sha1(f"{CACHE_VERSION}:{RANDOM_STATE}".encode())
+    for path in list(acoustic_files) + list(linguistic_files):
+        path = resolve_feature_table(path)
+        stat = os.stat(path) if os.path.exists(path) else None
+        digest.update(f"{path}:{stat.st_size if stat else -1}:{stat.st_mtime_ns if stat else -1}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _impute_scale(train, test):
+    """Median imputation and standard scaling fitted on the training rows only, in place."""
+    medians = np.nanmedian(train, axis=0)
+    medians = np.where(np.isnan(medians), 0.0, medians).astype(np.float32)
+    for X in (train, test):
+        rows, cols = np.nonzero(np.isnan(X))
+        X[rows, cols] = medians[cols]
+    mean = train.mean(axis=0)
+    scale = train.std(axis=0)
+    scale[scale == 0] = 1.0
+    for X in (train, test):
+        X -= mean
+        X /= scale
+
+
+def build_fold_cache(acoustic_files, linguistic_files, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Write (or reuse) the leave-one-language-out fold matrices.
+    Returns (fold directory list, feature names, fold names).
+    """
+    root = os.path.join(cache_dir, data_fingerprint(acoustic_files, linguistic_files))
+    meta_path = os.path.join(root, "meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        print(f"Using cached folds in {root}")
+        return [os.path.join(root, name) for name in meta["folds"]], meta["feature_names"], meta["folds"]
+
+    datasets = load_datasets(acoustic_files, linguistic_files)
+    X, y, feature_names, offsets = build_feature_matrix(datasets)
+    del datasets
+
+    folds = []
+    for i in range(len(offsets) - 1):
+        name = f"language_{i + 1}"
+        test_rows = np.arange(offsets[i], offsets[i + 1])
+        train_rows = np.setdiff1d(np.arange(len(y)), test_rows)
+        X_train, X_test = X[train_rows], X[test_rows]
+        _impute_scale(X_train, X_test)
+
+        fold_dir = os.path.join(root, name)
+        os.makedirs(fold_dir, exist_ok=True)
+        np.save(os.path.join(fold_dir, "X_train.npy"), X_train)
+        np.save(os.path.join(fold_dir, "X_test.npy"), X_test)
+        np.save(os.path.join(fold_dir, "y_train.npy"), y[train_rows])
+        np.save(os.path.join(fold_dir, "y_test.npy"), y[test_rows])
+        folds.append(name)
+
+    # Written last: a run interrupted while writing folds is rebuilt next time
+    with open(meta_path, "w") as f:
+        json.dump({"folds": folds, "feature_names": feature_names}, f)
+    return [os.path.join(root, name) for name in folds], feature_names, folds
+
+
+def load_fold(fold_dir):
+    """Memory-mapped (X_train, y_train, X_test, y_test) of a cached fold."""
+    return tuple(np.load(os.path.join(fold_dir, f"{name}.npy"), mmap_mode="r")
+                 for name in ("X_train", "y_train", "X_test", "y_test"))
+
+
+# ==============================
+# Rankings
+# ==============================
+def _rank_importance(X, y):
+    model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=1).fit(X, y)
+    return np.argsort(model.feature_importances_, kind="stable")[::-1]
+
+
+def _rank_permutation(X, y):
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X, y, test_size=0.25, stratify=y, random_state=RANDOM_STATE
+    )
+    model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=1).fit(X_fit, y_fit)
+    result = permutation_importance(model, X_val, y_val, n_repeats=PERMUTATION_REPEATS,
+                                    random_state=RANDOM_STATE, n_jobs=1)
+    return np.argsort(result.importances_mean, kind="stable")[::-1]
+
+
+def _rank_ttest(X, y):
+    _, p_values = ttest_ind(X[y == 1], X[y == 0], axis=0, equal_var=False)
+    # Constant features give NaN p-values; rank them last
+    return np.argsort(np.nan_to_num(p_values, nan=1.0), kind="stable")
+
+
+RANKERS = {"importance": _rank_importance, "permutation": _rank_permutation, "ttest": _rank_ttest}
+
+
+def fold_ranking(fold_dir, method):
+    """
+    Feature order of one fold and method, cached with the time the ranking took
+    when it was computed. Returns (order, ranking seconds).
+    """
+    path = os.path.join(fold_dir, f"rank_{method}.npy")
+    seconds_path = os.path.join(fold_dir, f"rank_{method}.seconds")
+    if os.path.exists(path) and os.path.exists(seconds_path):
+        with open(seconds_path) as f:
+            return np.load(path), float(f.read())
+    X_train, y_train, _, _ = load_fold(fold_dir)
+    start = time.perf_counter()
+    order = RANKERS[method](np.asarray(X_train), np.asarray(y_train))
+    seconds = time.perf_counter() - start
+    np.save(path, order)
+    with open(seconds_path, "w") as f:
+        f.write(f"{seconds:.6f}")
+    return order, seconds
+
+
+# ==============================
+# Evaluation
+# ==============================
+def evaluate_candidate(fold_dir, order, top_n):
+    """Fit on the fold's training languages with the top_n features and score the held-out language."""
+    X_train, y_train, X_test, y_test = load_fold(fold_dir)
+    columns = np.sort(order[:top_n])
+    start = time.perf_counter()
+    model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=1)
+    model.fit(X_train[:, columns], y_train)
+    y_pred = (model.predict_proba(X_test[:, columns])[:, 1] >= DECISION_THRESHOLD).astype(int)
+    return float(f1_score(y_test, y_pred)), time.perf_counter() - start
+
+
+def run_search(acoustic_files, linguistic_files, methods=METHODS, top_ns=DEFAULT_TOP_N,
+               cache_dir=DEFAULT_CACHE_DIR, n_jobs=N_JOBS):
+    """Evaluate every (method, N) on every fold; returns (report DataFrame, summary dict)."""
+    start = time.perf_counter()
+    fold_dirs, feature_names, fold_names = build_fold_cache(acoustic_files, linguistic_files, cache_dir)
+    prepare_seconds = time.perf_counter() - start
+    top_ns = sorted({min(n, len(feature_names)) for n in top_ns})
+
+    parallel = Parallel(n_jobs=n_jobs)
+    tasks = [(fold, method) for fold in range(len(fold_dirs)) for method in methods]
+    start = time.perf_counter()
+    rankings = parallel(delayed(fold_ranking)(fold_dirs[fold], method) for fold, method in tasks)
+    rank_wall_seconds = time.perf_counter() - start
+    rankings = dict(zip(tasks, rankings))
+
+    candidates = [(fold, method, n) for fold, method in tasks for n in top_ns]
+    start = time.perf_counter()
+    scores = parallel(
+        delayed(evaluate_candidate)(fold_dirs[fold], rankings[fold, method][0], n) for fold, method, n in candidates
+    )
+    fit_seconds = time.perf_counter() - start
+
+    rows = {}
+    for (fold, method, n), (f1, seconds) in zip(candidates, scores):
+        row = rows.setdefault((method, n), {"method": method, "top_n": n, "fit_seconds": 0.0,
+                                            "rank_seconds": 0.0})
+        row[f"f1_{fold_names[fold]}"] = f1
+        row["fit_seconds"] += seconds
+    for (fold, method), (_, seconds) in rankings.items():
+        for n in top_ns:
+            rows[method, n]["rank_seconds"] += seconds
+
+    report = pd.DataFrame(list(rows.values()))
+    f1_columns = [f"f1_{name}" for name in fold_names]
+    report["f1_mean"] = report[f1_columns].mean(axis=1)
+    report["f1_std"] = report[f1_columns].std(axis=1, ddof=0)
+    report = report.sort_values("f1_mean", ascending=False).reset_index(drop=True)
+
+    summary = {
+        "folds": fold_names,
+        "n_features": len(feature_names),
+        "prepare_seconds": round(prepare_seconds, 3),
+        "rank_seconds": round(rank_wall_seconds, 3),
+        "fit_seconds": round(fit_seconds, 3),
+        "candidates": len(candidates),
+        "n_jobs": n_jobs,
+    }
+    return report, summary
+
+
+# ==============================
+# Entry Point
+# ==============================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Leave-one-language-out feature-selection search.")
+    parser.add_argument("--methods", nargs="+", choices=METHODS, default=list(METHODS))
+    parser.add_argument("--top-n", nargs="+", type=int, default=list(DEFAULT_TOP_N), help="Feature counts.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--n-jobs", type=int, default=N_JOBS)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    args = parser.parse_args(argv)
+
+    report, summary = run_search(acoustic_csv_files, linguistic_csv_files, args.methods, args.top_n,
+                                 args.cache_dir, args.n_jobs)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    csv_path = os.path.join(args.output_dir, "feature_selection_report.csv")
+    report.to_csv(csv_path, index=False)
+    with open(os.path.join(args.output_dir, "feature_selection_report.json"), "w") as f:
+        json.dump({"summary": summary, "candidates": report.to_dict(orient="records")}, f, indent=2, default=float)
+
+    print("\n" + report.to_string(index=False))
+    print(f"\nPrepare {summary['prepare_seconds']:.1f}s | rank {summary['rank_seconds']:.1f}s | "
+          f"fit {summary['fit_seconds']:.1f}s for {summary['candidates']} fits")
+    best = report.iloc[0]
+    print(f"✅ Report saved to {csv_path}\nBest: method={best['method']} TOP_N={int(best['top_n'])} "
+          f"(mean F1 {best['f1_mean']:.3f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+incremental_training.py
+-----------------------
+Out-of-core, incremental retraining of the Random Forest classifier.
+
+model_training_script.py loads every language's full tables into memory and
+retrains from scratch. This mode streams the same acoustic / linguistic
+table pairs in chunks and only trains on rows it has not seen before:
+
+- rows are aligned per label as they stream in (the k-th AD acoustic row with
+  the k-th AD linguistic row, like the sampled alignment of the full run),
+  and chunks from the language pairs are interleaved so batches mix languages;
+- the StandardScaler is updated with partial_fit; when its mean/scale move,
+  the split thresholds of the existing trees are rebased to the new scaling,
+  which is exact because scaling is affine per feature;
+- every batch of BATCH_ROWS new rows adds TREES_PER_BATCH trees to a
+  warm_start forest, so retraining cost grows with the new data only;
+- the state (model, scaler, features, per-file progress) is kept in
+  backend/models/incremental_state.joblib and the backend's model bundle is
+  rewritten after every run.
+
+Progress is tracked per table pair: unchanged files are skipped without
+reading them; appended files are re-read but only their unseen rows are
+trained on. The feature selection is made once, from the first batch (or
+taken from --features), since later trees must use the same columns.
+Batches with a single class are held back until the other class arrives.
+The acoustic-only cascade screen is not trained in this mode.
+
+Usage:
+  python training/incremental_training.py                  # default tables from model_training_script.py
+  python training/incremental_training.py --acoustic new_acoustic.parquet --linguistic new_linguistic.parquet
+  python training/incremental_training.py --reset --batch-rows 20000 --trees-per-batch 20
+"""
+
+import os
+import sys
+import time
+import argparse
+import warnings
+from collections import deque
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, f1_score
+
+from training_pipeline import LABEL_MAP, RANDOM_STATE, N_JOBS, DECISION_THRESHOLD, StepReport, rank_features
+from model_training_script import acoustic_csv_files, linguistic_csv_files, MODEL_DIR, TOP_N
+from backend.src.feature_store import METADATA_COLUMNS, iter_feature_table, read_feature_schema, resolve_feature_table
+from backend.api.prediction import save_model_bundle
+warnings.filterwarnings('ignore')
+
+# ==============================
+# Configuration
+# ==============================
+STATE_PATH = os.path.join(MODEL_DIR, "incremental_state.joblib")
+CHUNK_ROWS = 2000
+BATCH_ROWS = 5000
+TREES_PER_BATCH = 10
+# A final partial batch smaller than this is held back for the next run
+MIN_BATCH_ROWS = 200
+
+
+# ==============================
+# State
+# ==============================
+def new_state():
+    return {
+        "model": None,
+        "scaler": StandardScaler(),
+        "feature_names": None,  # every feature column (the scaler's schema)
+        "selected_features": None,  # columns the forest uses
+        "files": {},  # pair key -> {"fingerprints", "consumed": {side: {label: rows}}}
+        "pending": None,  # (DataFrame, labels) held back from training
+        "rows_trained": 0,
+        "batches": 0,
+    }
+
+
+def load_state(path=STATE_PATH):
+    return joblib.load(path) if os.path.exists(path) else new_state()
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    joblib.dump(state, tmp_path, compress=3)
+    os.replace(tmp_path, path)
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# ==============================
+# Streaming Alignment
+# ==============================
+def aligned_chunks(acoustic_file, ling_file, consumed, chunk_rows=CHUNK_ROWS):
+    """
+    Yield DataFrames of (acoustic + linguistic features, 'label') for rows not yet
+    consumed. `consumed` ({"acoustic": {label: n}, "linguistic": {...}}) counts rows
+    per side and label that were paired in earlier runs; it is updated in place.
+    """
+    sides = {
+        "acoustic": iter_feature_table(acoustic_file, chunk_rows, exclude=("file_name",)),
+        "linguistic": iter_feature_table(ling_file, chunk_rows, exclude=("file_name", "id")),
+    }
+    seen = {side: {} for side in sides}  # rows per label read so far (after dropna)
+    queues = {side: {} for side in sides}  # label -> deque of pending single-label frames
+    queued = {side: {} for side in sides}  # label -> rows in the queue
+
+    while sides:
+        for side in list(sides):
+            chunk = next(sides[side], None)
+            if chunk is None:
+                del sides[side]
+                continue
+            chunk = chunk.dropna()
+            for label, rows in chunk.groupby("label", sort=False):
+                label = str(label)
+                start = seen[side].get(label, 0)
+                seen[side][label] = start + len(rows)
+                # Rows paired in an earlier run are skipped
+                skip = consumed[side].get(label, 0) - start
+                if skip >= len(rows):
+                    continue
+                rows = rows.iloc[max(0, skip):].drop(columns=["label"])
+                queues[side].setdefault(label, deque()).append(rows)
+                queued[side][label] = queued[side].get(label, 0) + len(rows)
+
+        parts = []
+        for label in set(queued["acoustic"]) & set(queued["linguistic"]):
+            n = min(queued["acoustic"][label], queued["linguistic"][label])
+            if n == 0:
+                continue
+            a_rows = _take(queues["acoustic"][label], n)
+            l_rows = _take(queues["linguistic"][label], n)
+            part = pd.concat([a_rows.reset_index(drop=True), l_rows.reset_index(drop=True)], axis=1)
+            part["label"] = label
+            parts.append(part)
+            for side in ("acoustic", "linguistic"):
+                queued[side][label] -= n
+                consumed[side][label] = consumed[side].get(label, 0) + n
+        if parts:
+            yield pd.concat(parts, ignore_index=True)
+
+
+def _take(frames: deque, n: int) -> pd.DataFrame:
+    """Remove and return the first n rows of a deque of frames."""
+    taken = []
+    while n > 0:
+        frame = frames.popleft()
+        if len(frame) > n:
+            frames.appendleft(frame.iloc[n:])
+            frame = frame.iloc[:n]
+        taken.append(frame)
+        n -= len(frame)
+    return pd.concat(taken)
+
+
+def new_rows(state, acoustic_files, linguistic_files, chunk_rows=CHUNK_ROWS):
+    """Round-robin over the table pairs, yielding chunks of rows not trained on yet."""
+    streams = []
+    for acoustic_file, ling_file in zip(acoustic_files, linguistic_files):
+        acoustic_file, ling_file = resolve_feature_table(acoustic_file), resolve_feature_table(ling_file)
+        if not (os.path.exists(acoustic_file) and os.path.exists(ling_file)):
+            print(f"Missing files for pair: {acoustic_file} | {ling_file}")
+            continue
+        key = f"{acoustic_file}|{ling_file}"
+        fingerprints = [_fingerprint(acoustic_file), _fingerprint(ling_file)]
+        entry = state["files"].setdefault(key, {"fingerprints": None, "consumed": {"acoustic": {}, "linguistic": {}}})
+        if entry["fingerprints"] == fingerprints:
+            print(f"Unchanged, skipped: {os.path.basename(acoustic_file)} | {os.path.basename(ling_file)}")
+            continue
+        entry["fingerprints"] = fingerprints
+        streams.append(aligned_chunks(acoustic_file, ling_file, entry["consumed"], chunk_rows))
+
+    while streams:
+        for stream in list(streams):
+            chunk = next(stream, None)
+            if chunk is None:
+                streams.remove(stream)
+            else:
+                yield chunk
+
+
+def feature_names_of(acoustic_file, ling_file):
+    """Feature columns of a table pair (acoustic first), from the schemas only."""
+    names = []
+    for path in (acoustic_file, ling_file):
+        names += [c for c in read_feature_schema(resolve_feature_table(path))["feature_names"]
+                  if c not in METADATA_COLUMNS]
+    return names
+
+
+# ==============================
+# Training
+# ==============================
+def rebase_thresholds(model, columns, old_mean, old_scale, new_mean, new_scale):
+    """
+    Move the split thresholds of every tree from the old scaling to the new one.
+    `columns` maps the model's input features to scaler columns.
+    """
+    old_mean, old_scale = old_mean[columns], old_scale[columns]
+    new_mean, new_scale = new_mean[columns], new_scale[columns]
+    for tree in model.estimators_:
+        feature = tree.tree_.feature
+        threshold = tree.tree_.threshold  # a writable view of the tree's nodes
+        split = feature >= 0
+        f = feature[split]
+        threshold[split] = (threshold[split] * old_scale[f] + old_mean[f] - new_mean[f]) / new_scale[f]
+
+
+def train_batch(state, batch: pd.DataFrame, trees=TREES_PER_BATCH, top_n=TOP_N, n_jobs=N_JOBS):
+    """Update the scaler with a batch and grow the forest by `trees` trees fitted on it."""
+    names = state["feature_names"]
+    X = batch.reindex(columns=names).to_numpy(dtype=np.float32, na_value=np.nan)
+    y = batch["label"].map(LABEL_MAP).to_numpy()
+
+    scaler = state["scaler"]
+    fitted = hasattr(scaler, "mean_")
+    old = (scaler.mean_.copy(), scaler.scale_.copy()) if fitted else None
+    scaler.partial_fit(pd.DataFrame(X, columns=names, copy=False))
+
+    model = state["model"]
+    if model is not None:
+        columns = [names.index(f) for f in state["selected_features"]]
+        rebase_thresholds(model, columns, *old, scaler.mean_, scaler.scale_)
+
+    X -= scaler.mean_.astype(np.float32)
+    X /= scaler.scale_.astype(np.float32)
+    np.nan_to_num(X, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+
+    if state["selected_features"] is None:
+        state["selected_features"] = rank_features(X, y, names, n_jobs=n_jobs)[:top_n]
+        print(f"Selected Top {len(state['selected_features'])} Features from the first batch")
+    columns = [names.index(f) for f in state["selected_features"]]
+
+    if model is None:
+        model = state["model"] = RandomForestClassifier(
+            n_estimators=trees, warm_start=True, random_state=RANDOM_STATE, n_jobs=n_jobs
+        )
+    else:
+        model.set_params(n_estimators=len(model.estimators_) + trees, n_jobs=n_jobs)
+    model.fit(pd.DataFrame(X[:, columns], columns=state["selected_features"], copy=False), y)
+
+    state["rows_trained"] += len(batch)
+    state["batches"] += 1
+
+
+def _trainable(batch, min_rows):
+    return len(batch) >= min_rows and batch["label"].nunique() == len(LABEL_MAP)
+
+
+def run_incremental(acoustic_files, linguistic_files, state_path=STATE_PATH, model_dir=MODEL_DIR,
+                    batch_rows=BATCH_ROWS, trees=TREES_PER_BATCH, chunk_rows=CHUNK_ROWS, top_n=TOP_N,
+                    features_file=None, n_jobs=N_JOBS, reset=False):
+    """Train on rows not seen before and rewrite the model bundle. Returns (state, summary)."""
+    report = StepReport()
+    state = new_state() if reset else load_state(state_path)
+    if state["feature_names"] is None:
+        state["feature_names"] = feature_names_of(acoustic_files[0], linguistic_files[0])
+    if features_file and state["selected_features"] is None:
+        with open(features_file) as f:
+            state["selected_features"] = [line.strip() for line in f if line.strip()]
+
+    trees_before = len(state["model"].estimators_) if state["model"] is not None else 0
+    rows_before = state["rows_trained"]
+    with report.step("stream_and_train"):
+        pending = [state["pending"]] if state["pending"] is not None else []
+        buffered = sum(len(frame) for frame in pending)
+        for chunk in new_rows(state, acoustic_files, linguistic_files, chunk_rows):
+            pending.append(chunk)
+            buffered += len(chunk)
+            if buffered >= batch_rows:
+                batch = pd.concat(pending, ignore_index=True)
+                if _trainable(batch, 1):
+                    train_batch(state, batch, trees, top_n, n_jobs)
+                    pending, buffered = [], 0
+                    print(f"Batch {state['batches']}: {len(batch)} rows → {len(state['model'].estimators_)} trees")
+        batch = pd.concat(pending, ignore_index=True) if pending else None
+        if batch is not None and _trainable(batch, MIN_BATCH_ROWS):
+            train_batch(state, batch, trees, top_n, n_jobs)
+            batch = None
+        state["pending"] = batch
+
+    summary = {
+        "rows_trained": state["rows_trained"] - rows_before,
+        "rows_pending": 0 if state["pending"] is None else len(state["pending"]),
+        "trees_added": (len(state["model"].estimators_) if state["model"] is not None else 0) - trees_before,
+        "total_trees": len(state["model"].estimators_) if state["model"] is not None else 0,
+        "total_rows": state["rows_trained"],
+    }
+    with report.step("save"):
+        save_state(state, state_path)
+        if summary["trees_added"]:
+            model = state["model"]
+            # Inference scores one segment at a time; a thread pool per call costs more than it saves
+            model.set_params(n_jobs=1)
+            bundle_path = os.path.join(model_dir, "model_bundle.joblib")
+            version = save_model_bundle(
+                bundle_path, model, state["scaler"], state["selected_features"],
+                metadata={"top_n": len(state["selected_features"]), "n_features": len(state["feature_names"]),
+                          "incremental": summary},
+            )
+            summary["bundle_version"] = version
+            print(f"\nModel bundle {version} saved at: {bundle_path}")
+
+    summary["steps"] = report.steps
+    print("\n" + report.summary())
+    return state, summary
+
+
+def evaluate_stream(state, acoustic_file, ling_file, chunk_rows=CHUNK_ROWS):
+    """Accuracy/F1 of the current model on a held-out table pair, streamed in chunks."""
+    names, scaler = state["feature_names"], state["scaler"]
+    columns = [names.index(f) for f in state["selected_features"]]
+    y_true, y_pred = [], []
+    consumed = {"acoustic": {}, "linguistic": {}}
+    for chunk in aligned_chunks(resolve_feature_table(acoustic_file), resolve_feature_table(ling_file),
+                                consumed, chunk_rows):
+        X = chunk.reindex(columns=names).to_numpy(dtype=np.float32, na_value=np.nan)
+        X = np.nan_to_num((X - scaler.mean_.astype(np.float32)) / scaler.scale_.astype(np.float32), nan=0.0)
+        y_pred.append((state["model"].predict_proba(X[:, columns])[:, 1] >= DECISION_THRESHOLD).astype(int))
+        y_true.append(chunk["label"].map(LABEL_MAP).to_numpy())
+    y_true, y_pred = np.concatenate(y_true), np.concatenate(y_pred)
+    return {"accuracy": float(accuracy_score(y_true, y_pred)), "f1": float(f1_score(y_true, y_pred))}
+
+
+# ==============================
+# Entry Point
+# ==============================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Incremental, out-of-core retraining of the classifier.")
+    parser.add_argument("--acoustic", nargs="+", default=acoustic_csv_files, help="Acoustic feature tables.")
+    parser.add_argument("--linguistic", nargs="+", default=linguistic_csv_files,
+                        help="Linguistic feature tables (same order as --acoustic).")
+    parser.add_argument("--state", default=STATE_PATH)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    parser.add_argument("--trees-per-batch", type=int, default=TREES_PER_BATCH)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--top-n", type=int, default=TOP_N)
+    parser.add_argument("--features", default=None, help="File with one selected feature per line.")
+    parser.add_argument("--eval", nargs=2, metavar=("ACOUSTIC", "LINGUISTIC"), default=None,
+                        help="Held-out table pair to score after training.")
+    parser.add_argument("--reset", action="store_true", help="Discard the saved state and start over.")
+    args = parser.parse_args(argv)
+    if len(args.acoustic) != len(args.linguistic):
+        parser.error("--acoustic and --linguistic need the same number of tables")
+
+    start = time.perf_counter()
+    state, summary = run_incremental(
+        args.acoustic, args.linguistic, args.state, args.model_dir, args.batch_rows, args.trees_per_batch,
+        args.chunk_rows, args.top_n, args.features, reset=args.reset,
+    )
+    print(f"\nTrained on {summary['rows_trained']} new rows (+{summary['trees_added']} trees, "
+          f"{summary['total_trees']} total, {summary['rows_pending']} rows held back) "
+          f"in {time.perf_counter() - start:.1f}s")
+    if args.eval and state["model"] is not None:
+        metrics = evaluate_stream(state, *args.eval)
+        print(f"Held-out → Accuracy: {metrics['accuracy'] * 100:.2f}% | F1: {metrics['f1'] * 100:.2f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""
+model_compaction.py
+-------------------
+Latency-aware compaction sweep for the Random Forest classifier.
+
+The production forest (100 trees, unlimited depth, top 397 features) is
+large on disk and slow to traverse. This sweep trains the same pipeline
+(training_pipeline.py: alignment, median imputation, scaling, importance
+ranking, train on the first language) with smaller forests and fewer
+features and measures for every configuration:
+- F1 on the validation split and on every other language's dataset,
+- single-row and batch inference latency (n_jobs=1, as the backend runs it),
+- serialized size (joblib, compress=3 like the model bundle) and node count.
+
+Configurations that no other configuration beats on mean F1, single-row
+latency and size at once are marked Pareto-optimal. Among those, the fastest
+one whose mean F1 is within --max-f1-drop of the current configuration is
+recommended; `--export` trains it with run_training() and writes it as the
+backend's model bundle.
+
+Usage:
+  python training/model_compaction.py --output-dir backend/outputs
+  python training/model_compaction.py --trees 50 100 --depths 0 12 --export
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+from training_pipeline import (
+    RANDOM_STATE, N_JOBS, DECISION_THRESHOLD,
+    load_datasets, build_feature_matrix, impute_median_, fit_scale_, rank_features,
+    fit_classifier, run_training,
+)
+from model_training_script import (
+    acoustic_csv_files, linguistic_csv_files, OUTPUT_DIR, MODEL_DIR, TOP_N,
+)
+warnings.filterwarnings('ignore')
+
+# ==============================
+# Configuration
+# ==============================
+# The configuration model_training_script.py trains today; F1 drops are measured against it
+BASELINE = {"n_estimators": 100, "max_depth": None, "min_samples_leaf": 1, "top_k": TOP_N}
+
+DEFAULT_TREES = (25, 50, 100)
+DEFAULT_DEPTHS = (None, 8, 12, 16)
+DEFAULT_LEAVES = (1, 2, 5)
+DEFAULT_TOP_K = (50, 100, 200, TOP_N)
+
+SINGLE_ROW_REPEATS = 50
+BATCH_SIZE = 64
+BATCH_REPEATS = 5
+
+
+# ==============================
+# Measurements
+# ==============================
+def model_size_bytes(model) -> int:
+    """Size of the model as stored in the bundle (joblib, compress=3)."""
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer, compress=3)
+    return buffer.tell()
+
+
+def measure_latency(model, X, single_repeats=SINGLE_ROW_REPEATS, batch_size=BATCH_SIZE,
+                    batch_repeats=BATCH_REPEATS):
+    """Median single-row latency and median per-batch latency (ms), single-threaded."""
+    model.set_params(n_jobs=1)
+    rng = np.random.default_rng(RANDOM_STATE)
+    model.predict_proba(X[:1])  # first call pays for validation caches
+
+    single = []
+    for i in rng.integers(0, len(X), single_repeats):
+        start = time.perf_counter()
+        model.predict_proba(X[i:i + 1])
+        single.append(time.perf_counter() - start)
+
+    batch_rows = X[rng.integers(0, len(X), batch_size)]
+    batch = []
+    for _ in range(batch_repeats):
+        start = time.perf_counter()
+        model.predict_proba(batch_rows)
+        batch.append(time.perf_counter() - start)
+    return float(np.median(single) * 1000), float(np.median(batch) * 1000)
+
+
+def node_count(model) -> int:
+    return int(sum(tree.tree_.node_count for tree in model.estimators_))
+
+
+# ==============================
+# Pareto Front
+# ==============================
+OBJECTIVES = (("f1_mean", "max"), ("single_row_ms", "min"), ("size_mb", "min"))
+
+
+def pareto_mask(report: pd.DataFrame, objectives=OBJECTIVES) -> np.ndarray:
+    """True for rows no other row matches or beats on every objective (and beats on one)."""
+    # Flip maximized objectives so that lower is better everywhere
+    values = np.column_stack([
+        report[column].to_numpy(dtype=float) * (-1 if direction == "max" else 1)
+        for column, direction in objectives
+    ])
+    mask = np.ones(len(values), dtype=bool)
+    for i, row in enumerate(values):
+        dominated = np.all(values <= row, axis=1) & np.any(values < row, axis=1)
+        mask[i] = not dominated.any()
+    return mask
+
+
+def recommend(report: pd.DataFrame, max_f1_drop: float):
+    """Index of the fastest Pareto configuration within max_f1_drop of the baseline's mean F1."""
+    baseline_f1 = report.loc[report["baseline"], "f1_mean"].max()
+    eligible = report[report["pareto"] & (report["f1_mean"] >= baseline_f1 - max_f1_drop)]
+    if eligible.empty:
+        return None
+    return eligible.sort_values(["single_row_ms", "size_mb"]).index[0]
+
+
+# ==============================
+# Sweep
+# ==============================
+def prepare_data(acoustic_files, linguistic_files, n_jobs=N_JOBS):
+    """
+    The matrices run_training() works with: scaled features ranked by importance,
+    the first language's train/validation split and every other language as a held-out set.
+    """
+    datasets = load_datasets(acoustic_files, linguistic_files)
+    X, y, feature_names, offsets = build_feature_matrix(datasets)
+    del datasets
+    impute_median_(X)
+    fit_scale_(X, feature_names)
+    ranked = rank_features(X, y, feature_names, n_jobs=n_jobs)
+    order = np.array([feature_names.index(f) for f in ranked])
+
+    train_rows = np.arange(offsets[0], offsets[1])
+    idx_train, idx_val = train_test_split(
+        train_rows, test_size=0.2, stratify=y[train_rows], random_state=RANDOM_STATE
+    )
+    held_out = {"validation": idx_val}
+    for i in range(1, len(offsets) - 1):
+        held_out[f"Dataset_{i + 1}"] = np.arange(offsets[i], offsets[i + 1])
+    return {"X": X, "y": y, "ranked": ranked, "order": order, "train": idx_train, "held_out": held_out}
+
+
+def evaluate_config(data, n_estimators, max_depth, min_samples_leaf, top_k, n_jobs=N_JOBS):
+    """Train one configuration and return its report row."""
+    columns = data["order"][:top_k]
+    X, y = data["X"], data["y"]
+    features = data["ranked"][:top_k]
+
+    start = time.perf_counter()
+    model = fit_classifier(
+        pd.DataFrame(X[np.ix_(data["train"], columns)], columns=features), y[data["train"]], n_jobs=n_jobs,
+        n_estimators=n_estimators, max_depth=max_depth, min_samples_leaf=min_samples_leaf,
+    )
+    fit_seconds = time.perf_counter() - start
+
+    model.set_params(n_jobs=1)
+    row = {
+        "n_estimators": n_estimators, "max_depth": max_depth, "min_samples_leaf": min_samples_leaf,
+        "top_k": len(features), "fit_seconds": round(fit_seconds, 3),
+    }
+    scores = []
+    for name, rows in data["held_out"].items():
+        # Segment-level decisions use the backend's threshold, not predict()'s 0.5
+        y_pred = (model.predict_proba(X[np.ix_(rows, columns)])[:, 1] >= DECISION_THRESHOLD).astype(int)
+        row[f"f1_{name}"] = float(f1_score(y[rows], y_pred))
+        scores.append(row[f"f1_{name}"])
+    row["f1_mean"] = float(np.mean(scores))
+
+    latency_rows = X[np.ix_(np.concatenate(list(data["held_out"].values())), columns)]
+    row["single_row_ms"], row["batch_ms"] = measure_latency(model, latency_rows)
+    row["batch_row_ms"] = row["batch_ms"] / BATCH_SIZE
+    row["size_mb"] = model_size_bytes(model) / 2 ** 20
+    row["nodes"] = node_count(model)
+    return row
+
+
+def sweep(data, trees=DEFAULT_TREES, depths=DEFAULT_DEPTHS, leaves=DEFAULT_LEAVES, top_ks=DEFAULT_TOP_K,
+          n_jobs=N_JOBS, max_f1_drop=0.01):
+    """Evaluate the grid (plus the baseline) and mark Pareto-optimal and recommended rows."""
+    n_features = len(data["ranked"])
+    grid = {(t, d, l, min(k, n_features)) for t, d, l, k in itertools.product(trees, depths, leaves, top_ks)}
+    baseline_key = (BASELINE["n_estimators"], BASELINE["max_depth"], BASELINE["min_samples_leaf"],
+                    min(BASELINE["top_k"], n_features))
+    grid.add(baseline_key)
+
+    rows = []
+    for i, (t, d, l, k) in enumerate(sorted(grid, key=lambda key: (key[0], key[1] or 0, key[2], key[3]))):
+        row = evaluate_config(data, t, d, l, k, n_jobs=n_jobs)
+        row["baseline"] = (t, d, l, k) == baseline_key
+        rows.append(row)
+        print(f"[{i + 1}/{len(grid)}] trees={t} depth={d} leaf={l} top_k={k} → "
+              f"F1 {row['f1_mean']:.3f} | {row['single_row_ms']:.2f} ms/row | {row['size_mb']:.1f} MB")
+
+    report = pd.DataFrame(rows)
+    report["pareto"] = pareto_mask(report)
+    report["recommended"] = False
+    choice = recommend(report, max_f1_drop)
+    if choice is not None:
+        report.loc[choice, "recommended"] = True
+    return report
+
+
+def export_choice(row, acoustic_files, linguistic_files, output_dir, model_dir, n_jobs=N_JOBS):
+    """Train the chosen configuration with the regular pipeline and save it as the model bundle."""
+    params = {
+        "n_estimators": int(row["n_estimators"]),
+        "max_depth": None if pd.isna(row["max_depth"]) else int(row["max_depth"]),
+        "min_samples_leaf": int(row["min_samples_leaf"]),
+    }
+    return run_training(
+        acoustic_files, linguistic_files, output_dir=output_dir, model_dir=model_dir,
+        top_n=int(row["top_k"]), n_jobs=n_jobs, model_params=params,
+    )
+
+
+# ==============================
+# Entry Point
+# ==============================
+def _depth(value):
+    return None if value.lower() in ("0", "none") else int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep Random Forest size against F1 and inference latency.")
+    parser.add_argument("--trees", nargs="+", type=int, default=list(DEFAULT_TREES))
+    parser.add_argument("--depths", nargs="+", type=_depth, default=list(DEFAULT_DEPTHS),
+                        help="Maximum tree depths (0 or none = unlimited).")
+    parser.add_argument("--leaves", nargs="+", type=int, default=list(DEFAULT_LEAVES), help="min_samples_leaf values.")
+    parser.add_argument("--top-k", nargs="+", type=int, default=list(DEFAULT_TOP_K), help="Feature counts.")
+    parser.add_argument("--max-f1-drop", type=float, default=0.01,
+                        help="Largest mean F1 loss against the current configuration accepted for a recommendation.")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--model-dir", default=MODEL_DIR)
+    parser.add_argument("--export", action="store_true",
+                        help="Train the recommended configuration and save it as the model bundle.")
+    args = parser.parse_args(argv)
+
+    data = prepare_data(acoustic_csv_files, linguistic_csv_files)
+    report = sweep(data, args.trees, args.depths, args.leaves, args.top_k, max_f1_drop=args.max_f1_drop)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    csv_path = os.path.join(args.output_dir, "compaction_report.csv")
+    report.to_csv(csv_path, index=False)
+    with open(os.path.join(args.output_dir, "compaction_report.json"), "w") as f:
+        json.dump(report.to_dict(orient="records"), f, indent=2, default=float)
+
+    columns = ["n_estimators", "max_depth", "min_samples_leaf", "top_k", "f1_mean", "single_row_ms",
+               "batch_row_ms", "size_mb", "nodes", "baseline", "recommended"]
+    print("\nPareto-optimal configurations:")
+    print(report.loc[report["pareto"], columns].sort_values("single_row_ms").to_string(index=False))
+    print(f"\n✅ Report saved to {csv_path}")
+
+    chosen = report[report["recommended"]]
+    if chosen.empty:
+        print(f"No Pareto configuration within {args.max_f1_drop} F1 of the baseline.")
+        return 0
+    row = chosen.iloc[0]
+    print(f"Recommended: trees={row['n_estimators']} depth={row['max_depth']} "
+          f"leaf={row['min_samples_leaf']} top_k={row['top_k']}")
+    if args.export:
+        bundle_path, _, _ = export_choice(row, acoustic_csv_files, linguistic_csv_files,
+                                          args.output_dir, args.model_dir)
+        print(f"Exported compacted model to {bundle_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,421 @@
+"""
+training_pipeline.py
+--------------------
+Reusable training stages for the language-independent Alzheimer's classifier.
+
+The stages mirror the original training script (load + align per language,
+median imputation, standard scaling, Random Forest importance selection,
+final model trained on the first language and tested on the others), but:
+- feature matrices are float32 and scaled in place, so only one full copy
+  of the pooled feature matrix is held at a time;
+- per-label frames are concatenated once instead of inside the label loop;
+- both forests are fitted on all cores (n_jobs);
+- every step reports wall time and peak memory;
+- model, scaler and selected features are saved as one versioned bundle
+  that the backend loads directly.
+
+It also trains the small acoustic-only screening model used by the backend's
+cascade mode, and reports accuracy versus the fraction of segments that would
+be escalated to the full (ASR + linguistic) model.
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+from sklearn.metrics import (accuracy_score, f1_score, confusion_matrix,
+                             roc_curve, auc)
+from sklearn.model_selection import train_test_split
+from sklearn.ensemble import RandomForestClassifier
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, ".."))
+from backend.src.feature_store import read_feature_table, read_feature_schema, resolve_feature_table
+from backend.api.prediction import save_model_bundle
+
+# ==============================
+# Configuration
+# ==============================
+LABEL_MAP = {'AD': 1, 'HC': 0}
+RANDOM_STATE = 42
+N_JOBS = int(os.environ.get("TRAINING_N_JOBS", -1))
+
+# Segment-level AD threshold; must match DECISION_THRESHOLD in backend/src/prediction_script.py
+DECISION_THRESHOLD = 0.28
+# Half-widths of the uncertainty band around the threshold evaluated for the cascade
+CASCADE_BAND_WIDTHS = (0.0, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 1.0)
+
+
+# ==============================
+# Step Reporting
+# ==============================
+class StepReport:
+    """
+    Collects wall time and memory for each training step: the step's own peak
+    of traced Python allocations (with trace_memory) and the process's maximum
+    RSS so far. ru_maxrss never decreases, so it is not a per-step peak.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak_mb = None
+            if self.trace_memory:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                peak_mb = peak / 2 ** 20
+            # ru_maxrss is reported in KiB on Linux
+            max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.steps.append({
+                "step": name,
+                "seconds": round(seconds, 3),
+                "peak_traced_mb": round(peak_mb, 1) if peak_mb is not None else None,
+                "max_rss_so_far_mb": round(max_rss_mb, 1),
+            })
+            print(f"[{name}] {seconds:.2f}s | peak traced {peak_mb or 0:.1f} MB | max RSS so far {max_rss_mb:.1f} MB")
+
+    def summary(self):
+        lines = [f"{'step':<28}{'seconds':>10}{'peak traced MB':>16}{'max RSS so far MB':>19}"]
+        for s in self.steps:
+            lines.append(f"{s['step']:<28}{s['seconds']:>10.2f}{(s['peak_traced_mb'] or 0):>16.1f}"
+                         f"{s['max_rss_so_far_mb']:>19.1f}")
+        return "\n".join(lines)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.steps, f, indent=2)
+
+
+# ==============================
+# Plot Helpers
+# ==============================
+def plot_confusion_matrix(y_true, y_pred, title, output_dir, cmap='Blues'):
+    """Save confusion matrix plot"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    cm = confusion_matrix(y_true, y_pred)
+    plt.figure(figsize=(6, 4))
+    sns.heatmap(cm, annot=True, fmt='d', cmap=cmap, xticklabels=['HC', 'AD'], yticklabels=['HC', 'AD'])
+    plt.xlabel('Predicted Label')
+    plt.ylabel('True Label')
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(os.path.join(output_dir, f"{title.replace(' ', '_')}.png"))
+    plt.close()
+
+
+def plot_roc_curve(y_true, y_scores, title, output_dir):
+    """Save ROC curve plot"""
+    import matplotlib.pyplot as plt
+
+    fpr, tpr, _ = roc_curve(y_true, y_scores)
+    roc_auc = auc(fpr, tpr)
+    plt.figure(figsize=(6, 4))
+    plt.plot(fpr, tpr, color='darkorange', lw=2, label='AUC = {:.2f}'.format(roc_auc))
+    plt.plot([0, 1], [0, 1], color='navy', lw=2, linestyle='--')
+    plt.xlabel('False Positive Rate')
+    plt.ylabel('True Positive Rate')
+    plt.title(title)
+    plt.legend(loc='lower right')
+    plt.tight_layout()
+    plt.savefig(os.path.join(output_dir, f"{title.replace(' ', '_')}.png"))
+    plt.close()
+
+
+# ==============================
+# Loading
+# ==============================
+def _float32_features(df, drop):
+    """Drop non-feature columns and downcast the rest to float32."""
+    features = df.drop(columns=list(drop), errors='ignore')
+    return features.astype(np.float32, copy=False)
+
+
+def load_language_dataset(acoustic_file, ling_file, random_state=RANDOM_STATE):
+    """
+    Load one language's acoustic + linguistic tables and align them per label
+    by sampling the same number of rows from each. Returns a shuffled float32
+    DataFrame with a 'label' column, or None if the pair cannot be used.
+    """
+    acoustic_file = resolve_feature_table(acoustic_file)
+    ling_file = resolve_feature_table(ling_file)
+    if not (os.path.exists(acoustic_file) and os.path.exists(ling_file)):
+        print(f"Missing files for pair: {acoustic_file} | {ling_file}")
+        return None
+
+    acoustic_df = read_feature_table(acoustic_file, exclude=("file_name",)).dropna().reset_index(drop=True)
+    # "id" identifies the speaker/recording (a metadata column), not a linguistic feature; the
+    # original CSV pipeline trained on it by accident, so models trained here do not use it
+    ling_df = read_feature_table(ling_file, exclude=("file_name", "id")).dropna().reset_index(drop=True)
+
+    common_labels = set(acoustic_df['label'].unique()).intersection(set(ling_df['label'].unique()))
+    if not common_labels:
+        print(f"No common labels between {acoustic_file} and {ling_file}. Skipping.")
+        return None
+
+    parts = []
+    for label in sorted(common_labels):
+        a_rows = acoustic_df[acoustic_df['label'] == label]
+        l_rows = ling_df[ling_df['label'] == label]
+        min_samples = min(len(a_rows), len(l_rows))
+        if min_samples == 0:
+            continue
+
+        a_features = _float32_features(
+            a_rows.sample(n=min_samples, random_state=random_state).reset_index(drop=True), ['label'])
+        l_features = _float32_features(
+            l_rows.sample(n=min_samples, random_state=random_state).reset_index(drop=True), ['label'])
+
+        part = pd.concat([a_features, l_features], axis=1)
+        part['label'] = label
+        parts.append(part)
+
+    if not parts:
+        return None
+
+    # One concat for all labels instead of growing a frame inside the loop
+    combined_df = pd.concat(parts, ignore_index=True)
+    return combined_df.sample(frac=1, random_state=random_state).reset_index(drop=True)
+
+
+def load_datasets(acoustic_files, linguistic_files):
+    """Load every language pair; raises if none could be used."""
+    datasets = []
+    for acoustic_file, ling_file in zip(acoustic_files, linguistic_files):
+        df = load_language_dataset(acoustic_file, ling_file)
+        if df is not None:
+            datasets.append(df)
+    if not datasets:
+        raise ValueError("No valid datasets loaded. Check file paths in sample_data/.")
+    return datasets
+
+
+def acoustic_feature_names(acoustic_files):
+    """Union of feature columns found in the acoustic tables (read from the schema only)."""
+    names = set()
+    for path in acoustic_files:
+        path = resolve_feature_table(path)
+        if os.path.exists(path):
+            names.update(read_feature_schema(path)["feature_names"])
+    return names
+
+
+# ==============================
+# Feature Matrix
+# ==============================
+def build_feature_matrix(datasets):
+    """
+    Stack all languages into one float32 matrix.
+    Returns (X, y, feature_names, offsets) where offsets[i]:offsets[i+1]
+    are the rows of datasets[i].
+    """
+    feature_names = [c for c in datasets[0].columns if c != 'label']
+    offsets = np.cumsum([0] + [len(df) for df in datasets])
+
+    X = np.empty((offsets[-1], len(feature_names)), dtype=np.float32)
+    y = np.empty(offsets[-1], dtype=np.int8)
+    for i, df in enumerate(datasets):
+        X[offsets[i]:offsets[i + 1]] = df.reindex(columns=feature_names).to_numpy(dtype=np.float32, na_value=np.nan)
+        y[offsets[i]:offsets[i + 1]] = df['label'].map(LABEL_MAP).to_numpy()
+    return X, y, feature_names, offsets
+
+
+def impute_median_(X):
+    """Fill NaNs with per-column medians, in place."""
+    nan_rows, nan_cols = np.nonzero(np.isnan(X))
+    if len(nan_rows):
+        medians = np.nanmedian(X, axis=0)
+        X[nan_rows, nan_cols] = np.take(medians, nan_cols)
+    return X
+
+
+def fit_scale_(X, feature_names):
+    """Fit a StandardScaler (with feature names for the backend) and scale X in place."""
+    scaler = StandardScaler()
+    scaler.fit(pd.DataFrame(X, columns=feature_names, copy=False))
+    X -= scaler.mean_.astype(np.float32)
+    X /= scaler.scale_.astype(np.float32)
+    return scaler
+
+
+# ==============================
+# Models
+# ==============================
+def rank_features(X, y, feature_names, n_jobs=N_JOBS):
+    """Rank features by Random Forest impurity importance (descending)."""
+    rf_selector = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=n_jobs)
+    rf_selector.fit(X, y)
+    order = np.argsort(rf_selector.feature_importances_, kind="stable")[::-1]
+    return [feature_names[i] for i in order]
+
+
+def fit_classifier(X_selected_df, y, n_jobs=N_JOBS, **params):
+    """Fit the final Random Forest on a DataFrame so feature names are recorded."""
+    model = RandomForestClassifier(random_state=RANDOM_STATE, n_jobs=n_jobs, **params)
+    model.fit(X_selected_df, y)
+    return model
+
+
+def evaluate(model, X_df, y, title, output_dir, plots=True):
+    """Accuracy/F1 on one split, optionally saving confusion matrix and ROC plots."""
+    y_pred = model.predict(X_df)
+    y_proba = model.predict_proba(X_df)[:, 1]
+    metrics = {"accuracy": float(accuracy_score(y, y_pred)), "f1": float(f1_score(y, y_pred))}
+    if plots:
+        plot_confusion_matrix(y, y_pred, f"Confusion Matrix - {title}", output_dir)
+        plot_roc_curve(y, y_proba, f"ROC Curve - {title}", output_dir)
+    return metrics, y_pred, y_proba
+
+
+def evaluate_cascade(screen_proba, full_proba, y, band_widths=CASCADE_BAND_WIDTHS,
+                     threshold=DECISION_THRESHOLD):
+    """
+    Simulate the two-stage cascade: rows (segments) whose screening probability
+    lies within `width` of the threshold are escalated to the full model, as
+    serving does per segment (prediction_script.py).
+    Returns a DataFrame of accuracy/F1 versus escalated fraction per band width.
+    """
+    rows = []
+    for width in band_widths:
+        escalated = np.abs(screen_proba - threshold) < width
+        proba = np.where(escalated, full_proba, screen_proba)
+        y_pred = (proba >= threshold).astype(int)
+        rows.append({
+            "band_low": round(max(0.0, threshold - width), 3),
+            "band_high": round(min(1.0, threshold + width), 3),
+            "escalated_fraction": float(escalated.mean()),
+            "accuracy": float(accuracy_score(y, y_pred)),
+            "f1": float(f1_score(y, y_pred)),
+        })
+    return pd.DataFrame(rows)
+
+
+# ==============================
+# Full Run
+# ==============================
+def run_training(acoustic_files, linguistic_files, output_dir, model_dir, top_n=397,
+                 n_jobs=N_JOBS, plots=True, trace_memory=False, screen_top_n=100, model_params=None):
+    """
+    Train, evaluate and save the model bundle. Returns (bundle_path, metrics, report).
+    With screen_top_n > 0 an acoustic-only screening model is trained alongside
+    the full model, and the cascade trade-off is written to cascade_report.csv.
+    model_params (e.g. n_estimators, max_depth from model_compaction.py) are
+    passed to the full model's RandomForestClassifier.
+    trace_memory adds tracemalloc peaks to the step report; it slows the forest
+    fits considerably, so it is off unless asked for (the maximum RSS so far is always reported).
+    """
+    model_params = model_params or {}
+    report = StepReport(trace_memory=trace_memory)
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(model_dir, exist_ok=True)
+
+    with report.step("load_datasets"):
+        datasets = load_datasets(acoustic_files, linguistic_files)
+        acoustic_names = acoustic_feature_names(acoustic_files)
+
+    with report.step("build_matrix"):
+        X, y, feature_names, offsets = build_feature_matrix(datasets)
+        del datasets
+        impute_median_(X)
+
+    with report.step("scale"):
+        scaler = fit_scale_(X, feature_names)
+
+    with report.step("select_features"):
+        ranked = rank_features(X, y, feature_names, n_jobs=n_jobs)
+        significant_features = ranked[:top_n]
+        selected_idx = [feature_names.index(f) for f in significant_features]
+        print(f"Selected Top {top_n} Features")
+
+    features_path = os.path.join(model_dir, "selected_features.txt")
+    with open(features_path, "w") as f:
+        for feat in significant_features:
+            f.write(f"{feat}\n")
+
+    def selected(rows, columns):
+        # np.ix_ gathers the rows and columns in one step, without a full-width copy of the rows
+        return pd.DataFrame(X[np.ix_(rows, [feature_names.index(f) for f in columns])], columns=columns)
+
+    metrics = {}
+    with report.step("train_final"):
+        train_rows = np.arange(offsets[0], offsets[1])
+        y_train = y[train_rows]
+        idx_train, idx_val = train_test_split(
+            train_rows, test_size=0.2, stratify=y_train, random_state=RANDOM_STATE
+        )
+        model = fit_classifier(selected(idx_train, significant_features), y[idx_train], n_jobs=n_jobs,
+                               **model_params)
+
+    screen_model, screen_features = None, []
+    if screen_top_n:
+        with report.step("train_acoustic_screen"):
+            screen_features = [f for f in ranked if f in acoustic_names][:screen_top_n]
+            screen_model = fit_classifier(selected(idx_train, screen_features), y[idx_train], n_jobs=n_jobs)
+            print(f"Trained acoustic screening model on {len(screen_features)} features")
+
+    with report.step("evaluate"):
+        metrics["validation"], _, _ = evaluate(
+            model, selected(idx_val, significant_features), y[idx_val], "Validation", output_dir, plots
+        )
+        print(f"\nValidation Accuracy: {metrics['validation']['accuracy'] * 100:.2f}% "
+              f"| F1: {metrics['validation']['f1'] * 100:.2f}%")
+
+        held_out = [idx_val]
+        for i in range(1, len(offsets) - 1):
+            name = f"Dataset_{i + 1}"
+            rows = np.arange(offsets[i], offsets[i + 1])
+            held_out.append(rows)
+            metrics[name], _, _ = evaluate(
+                model, selected(rows, significant_features), y[rows], name, output_dir, plots
+            )
+            print(f"\nDataset {i + 1} → Accuracy: {metrics[name]['accuracy'] * 100:.2f}% "
+                  f"| F1: {metrics[name]['f1'] * 100:.2f}%")
+
+    if screen_model is not None:
+        with report.step("evaluate_cascade"):
+            rows = np.concatenate(held_out)
+            cascade_df = evaluate_cascade(
+                screen_model.predict_proba(selected(rows, screen_features))[:, 1],
+                model.predict_proba(selected(rows, significant_features))[:, 1],
+                y[rows],
+            )
+            cascade_df.to_csv(os.path.join(output_dir, "cascade_report.csv"), index=False)
+            metrics["cascade"] = cascade_df.to_dict(orient="records")
+            print("\nCascade (accuracy vs. fraction escalated to ASR):")
+            print(cascade_df.to_string(index=False))
+
+    with report.step("save_bundle"):
+        # Inference scores one segment at a time; a thread pool per call costs more than it saves
+        model.set_params(n_jobs=1)
+        if screen_model is not None:
+            screen_model.set_params(n_jobs=1)
+        bundle_path = os.path.join(model_dir, "model_bundle.joblib")
+        version = save_model_bundle(
+            bundle_path, model, scaler, significant_features,
+            metadata={"top_n": top_n, "metrics": metrics, "n_features": len(feature_names),
+                      "model_params": model_params},
+            acoustic_model=screen_model,
+        )
+        print(f"\nModel bundle {version} saved at: {bundle_path}")
+
+    print("\n" + report.summary())
+    report.save(os.path.join(output_dir, "training_report.json"))
+    return bundle_path, metrics, report